@@ -0,0 +1,103 @@
+"""
+Mixed-model workload against a fake Ollama host that keeps only `--max-loaded` models loaded: `--clients` threads run chat
+turns (chat model stream, then a memory lookup with the query and embedding models) while a background worker ingests
+conversations, like a few TUI sessions and the ingest queue sharing one host. Reports the host's model loads / swaps and
+the scheduler's counters, with requests grouped by model or, with --ungrouped, only held to the per-model limits.
+
+    python bench/bench_pool.py --clients 3 --load-latency 0.3
+    python bench/bench_pool.py --clients 3 --load-latency 0.3 --ungrouped
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from contextlib import redirect_stdout
+from typing import Dict
+import argparse
+import io
+import shutil
+import tempfile
+import threading
+import time
+
+from fake_ollama import FakeOllama
+from run_bench import call_delta, percentiles, retrieval_queries
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+CHAT_MODEL = "gpt-oss:20b"
+
+def run(args) -> Dict:
+    from langchain_ollama import ChatOllama
+    from ollama_pool import pool
+    from rag import UserRAG
+    from test_data import conversations
+
+    server = FakeOllama(chat_latency=args.chat_latency, token_latency=args.token_latency, embed_latency=args.embed_latency,
+                        max_loaded=args.max_loaded, load_latency=args.load_latency).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    # ungrouped: as many models may run side by side as there are, the host sorts it out (and swaps)
+    pool.configure(max_loaded=99 if args.ungrouped else args.max_loaded, limits={CHAT_MODEL: 1, "llama3.1": 4, "embeddinggemma:300m": 2})
+    db_path = tempfile.mkdtemp(prefix="rechat-bench-pool-")
+    try:
+        rag_system = UserRAG(model_name="llama3.1", embedding_model_name="embeddinggemma:300m", db_path=db_path, text_splitter="nothing yet")
+        rag_system.injest_data(conversations[0])
+        chat = ChatOllama(model=CHAT_MODEL, **pool.client_kwargs())
+
+        def ingest():
+            for conversation in list(conversations)[1:] * args.ingest_rounds:
+                rag_system.injest_data(conversation)
+
+        turn_latencies = []
+
+        def chat_turns(client: int):
+            for turn in range(args.turns):
+                query = retrieval_queries[(client + turn * args.clients) % len(retrieval_queries)]
+                turn_start = time.perf_counter()
+                "".join(chunk.content for chunk in chat.stream([{"role": "user", "content": query}]))
+                rag_system.retrieve_data(query=f"{query} ({client})", k=1)
+                turn_latencies.append(time.perf_counter() - turn_start)
+
+        before = server.snapshot()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=ingest, daemon=True)]
+        threads += [threading.Thread(target=chat_turns, args=(client,), daemon=True) for client in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+                "seconds": time.perf_counter() - start,
+                "turn_latency": percentiles(turn_latencies),
+                "host": call_delta(before, server.snapshot()),
+                "scheduler": pool.scheduler.snapshot(),
+            }
+    finally:
+        server.stop()
+        shutil.rmtree(db_path, ignore_errors=True)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model swaps of a mixed chat + ingestion workload, grouped by model or not")
+    parser.add_argument("--clients", type=int, default=3, help="chat sessions running turns at the same time")
+    parser.add_argument("--turns", type=int, default=4, help="turns per session")
+    parser.add_argument("--ingest-rounds", type=int, default=1, help="passes of the background worker over test_data")
+    parser.add_argument("--max-loaded", type=int, default=1, help="models the fake host keeps loaded")
+    parser.add_argument("--load-latency", type=float, default=0.3, help="seconds the fake host takes to load a model")
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--ungrouped", action="store_true", help="only per-model limits, no grouping by model")
+    args = parser.parse_args()
+
+    with redirect_stdout(io.StringIO()):       # UserRAG prints every ingest decision
+        result = run(args)
+    host, scheduler = result["host"], result["scheduler"]
+    fmt = lambda stats: " ".join(f"{key} {value*1000:.0f}ms" for key, value in stats.items())
+    print(f"{'ungrouped' if args.ungrouped else 'grouped'}: {result['seconds']:.2f}s total, turn latency {fmt(result['turn_latency'])}")
+    print(f"host      : {host.get('model_loads', 0)} model loads, {host.get('model_swaps', 0)} swaps, "
+          f"{host.get('chat', 0)} chat / {host.get('embed', 0)} embed calls")
+    print(f"scheduler : {scheduler['requests']} requests, {scheduler['queued']} queued (max depth {scheduler['max_queue_depth']}), "
+          f"{scheduler['wait_seconds']:.2f}s waited, {scheduler['loads']} loads / {scheduler['swaps']} swaps")
@@ -0,0 +1,109 @@
+"""
+Chat turns through the same agent as main.py (chat model + user_data_retriever tool) against a fake Ollama host, with the
+memory prefetch on or off (`--no-prefetch`). Each turn is timed from submit to the tool result and to the end of the
+reply; the fake chat model always calls the tool with the raw message, so with prefetch on every lookup is a hit.
+The prefetch can only overlap the chat model's first step when the host runs the query and embedding models next to
+it (`--max-loaded`, like main.py's max_loaded_models); with one model loaded at a time it just queues behind the chat call.
+
+    python bench/bench_prefetch.py --max-loaded 3
+    python bench/bench_prefetch.py --max-loaded 3 --no-prefetch
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from contextlib import redirect_stdout
+from typing import Dict, List
+import argparse
+import io
+import shutil
+import tempfile
+import time
+
+from fake_ollama import FakeOllama
+from run_bench import call_delta, percentiles, retrieval_queries
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def run(args) -> Dict:
+    from langchain_ollama import ChatOllama
+    from langchain.agents import create_agent
+    from langchain.tools import tool
+    from ollama_pool import pool
+    from prefetch import MemoryPrefetcher
+    from prompt_gallery import system_prompt, retriever_desc
+    from rag import UserRAG
+    from test_data import conversations
+
+    server = FakeOllama(chat_latency=args.chat_latency, embed_latency=args.embed_latency).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    pool.configure(max_loaded=args.max_loaded, limits={"gpt-oss:20b": 1, "llama3.1": 4, "embeddinggemma:300m": 2})
+    db_path = tempfile.mkdtemp(prefix="rechat-bench-prefetch-")
+    prefetcher = None
+    try:
+        rag_system = UserRAG(model_name="llama3.1", embedding_model_name="embeddinggemma:300m", db_path=db_path, text_splitter="nothing yet")
+        for conversation in conversations:
+            rag_system.injest_data(conversation)
+        prefetcher = None if args.no_prefetch else MemoryPrefetcher(rag_system, k=1)
+        tool_done = []
+
+        @tool("user_data_retriever", description=retriever_desc)
+        def get_user_data(user_query: str) -> List[str]:
+            data_list = prefetcher.get(user_query, k=1) if prefetcher else rag_system.retrieve_data(query=user_query, k=1)
+            tool_done.append(time.perf_counter())
+            return data_list
+
+        chat_agent = create_agent(
+                model=ChatOllama(model="gpt-oss:20b", **pool.client_kwargs()),
+                system_prompt=system_prompt,
+                tools=[get_user_data],
+        )
+
+        to_tool, to_reply = [], []
+        before = server.snapshot()
+        for turn in range(args.turns):
+            # distinct per turn, so neither the query cache nor the embedding cache can answer
+            message = f"{retrieval_queries[turn % len(retrieval_queries)]} ({turn})"
+            tool_done.clear()
+            start = time.perf_counter()
+            if prefetcher:
+                prefetcher.start(message)
+            for _ in chat_agent.stream({"messages": [{"role": "user", "content": message}]}, stream_mode="updates"):
+                pass
+            to_reply.append(time.perf_counter() - start)
+            if tool_done:
+                to_tool.append(tool_done[0] - start)
+        return {
+                "turns": args.turns,
+                "to_tool": percentiles(to_tool),
+                "to_reply": percentiles(to_reply),
+                "host": call_delta(before, server.snapshot()),
+                "prefetch": prefetcher.summary() if prefetcher else None,
+            }
+    finally:
+        if prefetcher:
+            prefetcher.close()
+        server.stop()
+        shutil.rmtree(db_path, ignore_errors=True)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn latency of the chat agent with and without the memory prefetch")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--no-prefetch", action="store_true", help="retrieve only when the tool is called")
+    parser.add_argument("--max-loaded", type=int, default=1, help="models the scheduler lets run side by side")
+    parser.add_argument("--chat-latency", type=float, default=0.3)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with redirect_stdout(io.StringIO()):       # UserRAG prints every ingest decision
+        result = run(args)
+    fmt = lambda stats: " ".join(f"{key} {value*1000:.0f}ms" for key, value in stats.items())
+    print(f"prefetch {'off' if args.no_prefetch else 'on'}: {result['turns']} turns")
+    print(f"to tool  : {fmt(result['to_tool'])}")
+    print(f"to reply : {fmt(result['to_reply'])}")
+    print(f"host     : {result['host'].get('embed', 0)} embed / {result['host'].get('chat', 0)} chat calls")
+    if result["prefetch"]:
+        print(result["prefetch"])
@@ -0,0 +1,93 @@
+"""
+Concurrent users against one rag_service.py over its unix socket: two users' stores are filled from test_data, then
+`--clients` threads per user run the retrieval queries through RemoteUserRAG. Reports the fake host's embed calls and the
+service's batch sizes, with micro-batching on (`--window-ms`) or off (`--window-ms 0`).
+
+    python bench/bench_rag_service.py --clients 4 --window-ms 5
+    python bench/bench_rag_service.py --clients 4 --window-ms 0
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from contextlib import redirect_stdout
+from typing import Dict
+import argparse
+import io
+import shutil
+import tempfile
+import threading
+import time
+
+from fake_ollama import FakeOllama
+from run_bench import call_delta, percentiles, retrieval_queries
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+USERS = ("alice", "bob")
+
+def run(args) -> Dict:
+    from rag_service import RAGService, RemoteUserRAG, make_server
+    from test_data import conversations
+
+    server = FakeOllama(chat_latency=args.chat_latency, embed_latency=args.embed_latency).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    root = tempfile.mkdtemp(prefix="rechat-bench-service-")
+    service = RAGService(root, batch_window=args.window_ms / 1000)
+    socket_path = os.path.join(root, "rag.sock")
+    http_server = make_server(service, socket_path=socket_path)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    url = f"unix://{socket_path}"
+    try:
+        for i, conversation in enumerate(conversations):
+            RemoteUserRAG(USERS[i % len(USERS)], url).injest_data(conversation)
+
+        latencies = []
+
+        def client(user: str, n: int):
+            rag = RemoteUserRAG(user, url)
+            for query in retrieval_queries:
+                start = time.perf_counter()
+                rag.retrieve_data(f"{query} ({n})", 1)      # distinct per client, so the query cache can't answer
+                latencies.append(time.perf_counter() - start)
+            rag.close()
+
+        before = server.snapshot()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(user, n), daemon=True) for n in range(args.clients) for user in USERS]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+                "seconds": time.perf_counter() - start,
+                "retrievals": len(latencies),
+                "latency": percentiles(latencies),
+                "host": call_delta(before, server.snapshot()),
+                "service": service.stats(),
+            }
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+        service.close()
+        server.stop()
+        shutil.rmtree(root, ignore_errors=True)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed calls and latency of concurrent users on one rag service")
+    parser.add_argument("--clients", type=int, default=4, help="threads per user running the retrieval queries")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="micro-batching window, 0 turns batching off")
+    parser.add_argument("--chat-latency", type=float, default=0.05)
+    parser.add_argument("--embed-latency", type=float, default=0.03)
+    args = parser.parse_args()
+
+    with redirect_stdout(io.StringIO()):       # UserRAG prints every ingest decision
+        result = run(args)
+    host, batches = result["host"], result["service"]["embedding_batches"]
+    fmt = lambda stats: " ".join(f"{key} {value*1000:.0f}ms" for key, value in stats.items())
+    print(f"window {args.window_ms:g}ms: {result['retrievals']} retrievals in {result['seconds']:.2f}s, latency {fmt(result['latency'])}")
+    print(f"host    : {host.get('embed', 0)} embed / {host.get('chat', 0)} chat calls")
+    print(f"service : {batches['batches']} embedding batches, mean {batches['mean_size']:.2f} calls per batch (largest {batches['largest']})")
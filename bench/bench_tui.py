@@ -0,0 +1,108 @@
+"""
+Headless Textual benchmark of the chat history: appends messages in chunks and times each chunk (append + repaint) and a
+few scroll jumps, for the virtualized ChatLog or the old one-Static-per-message VerticalScroll.
+
+    python bench/bench_tui.py --messages 5000
+    python bench/bench_tui.py --messages 1000 --legacy
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import Dict, List
+import argparse
+import asyncio
+import random
+import time
+
+from textual.app import App, ComposeResult
+from textual.containers import VerticalScroll
+from textual.widgets import Static
+
+from chat_log import ChatLog
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+WORDS = ("memory retrieval keyboard podcast esp32 summary interpretability career gpu embeddings ollama terminal "
+         "conversation database search vector fact user assistant latency").split()
+
+def fake_message(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 120)))
+
+class LegacyChat(VerticalScroll):
+    """ The previous layout: one mounted Static per message, never unmounted """
+    DEFAULT_CSS = """
+    LegacyChat > Static { padding: 1 2; margin: 1 1; width: auto; max-width: 80%; height: auto; }
+    LegacyChat > .user { dock: right; background: $primary-darken-2; }
+    LegacyChat > .assistant { dock: left; background: $surface-lighten-1; }
+    """
+
+    async def add_message(self, text: str, is_user: bool):
+        bubble = Static(text, markup=False, classes="user" if is_user else "assistant")
+        await self.mount(bubble)
+        self.scroll_end(animate=False)
+        return bubble
+
+class BenchApp(App):
+    def __init__(self, legacy: bool):
+        super().__init__()
+        self.legacy = legacy
+
+    def compose(self) -> ComposeResult:
+        yield LegacyChat() if self.legacy else ChatLog()
+
+async def run(
+        messages: int,
+        chunk: int,
+        legacy: bool,
+        seed: int = 0,
+    ) -> Dict:
+    rng = random.Random(seed)
+    app = BenchApp(legacy)
+    chunk_times: List[float] = []
+    async with app.run_test(headless=True, size=(120, 40)) as pilot:
+        chat = app.query_one(LegacyChat if legacy else ChatLog)
+        for start in range(0, messages, chunk):
+            began = time.perf_counter()
+            for idx in range(start, min(start + chunk, messages)):
+                if legacy:
+                    await chat.add_message(fake_message(rng), is_user=idx % 2 == 0)
+                else:
+                    chat.add_message(fake_message(rng), is_user=idx % 2 == 0)
+            await pilot.pause()
+            chunk_times.append(time.perf_counter() - began)
+
+        # streaming into the last message, as a reply comes in
+        entry = await chat.add_message("", is_user=False) if legacy else chat.add_message("", is_user=False)
+        began, reply = time.perf_counter(), ""
+        for word in range(200):
+            reply += rng.choice(WORDS) + " "
+            entry.update(reply)
+            if word % 10 == 0:
+                await pilot.pause()
+        stream = (time.perf_counter() - began) / 200
+
+        scrolls = []
+        for y in (0, chat.max_scroll_y // 2, chat.max_scroll_y):
+            began = time.perf_counter()
+            chat.scroll_to(y=y, animate=False)
+            await pilot.pause()
+            scrolls.append(time.perf_counter() - began)
+
+    return {"chunk_times": chunk_times, "stream": stream, "scrolls": scrolls}
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time appending, streaming and scrolling in the chat history widget")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--chunk", type=int, default=250, help="messages appended between two repaints")
+    parser.add_argument("--legacy", action="store_true", help="one Static per message in a VerticalScroll (the old layout)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.messages, args.chunk, args.legacy))
+    print(f"{'legacy' if args.legacy else 'ChatLog'}: per-message cost by chunk of {args.chunk}")
+    for idx, seconds in enumerate(result["chunk_times"]):
+        print(f"  messages {idx * args.chunk:>6}-{(idx + 1) * args.chunk:<6} {seconds / args.chunk * 1000:7.3f}ms")
+    print(f"  streaming update       {result['stream'] * 1000:7.3f}ms")
+    print(f"  scroll top/mid/bottom  {' / '.join(f'{s * 1000:.1f}ms' for s in result['scrolls'])}")
@@ -0,0 +1,253 @@
+"""
+Deterministic local stand-in for the Ollama HTTP API (/api/chat, /api/embed, /api/generate).
+Point the ollama clients at it with OLLAMA_HOST and every UserRAG / agent call runs offline with configurable latency:
+
+    server = FakeOllama(chat_latency=0.2, embed_latency=0.02).start()
+    os.environ["OLLAMA_HOST"] = server.url
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import Counter, OrderedDict
+from typing import Dict, List
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+STOPWORDS = {"the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "was", "were", "i", "my", "me", "it",
+             "that", "this", "with", "at", "as", "be", "by", "user", "user's", "his", "her", "he", "she", "what", "s"}
+
+def words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+def content_words(text: str) -> set:
+    return {word for word in words(text) if word not in STOPWORDS}
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """ Hashed bag of words, so texts sharing words land close to each other """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in words(text):
+        digest = int(hashlib.md5(word.encode()).hexdigest(), 16)
+        vector[digest % dim] += 1.0 if word not in STOPWORDS else 0.2
+    norm = float(np.linalg.norm(vector))
+    return (vector / norm if norm else vector + 1.0 / np.sqrt(dim)).tolist()
+
+# ----------------------------------------------------- FAKE COMPLETIONS ------------------------------------------------------ #
+
+def split_queries(query: str) -> List[str]:
+    parts = [part.strip() for part in re.split(r"[?.;,]| and ", query) if len(content_words(part)) > 0]
+    return parts[:5] or [query.strip()]
+
+def extract_facts(conversation: str) -> List[str]:
+    """ Every reasonably long sentence the USER said becomes a fact, at most 8 per conversation like a real summary """
+    facts = []
+    turns = re.split(r"^(USER|ASSISTANT): ", conversation, flags=re.M)
+    for role, text in zip(turns[1::2], turns[2::2]):
+        if role != "USER":
+            continue
+        for sentence in re.split(r"[.!?]\s+", text):
+            if len(content_words(sentence)) >= 4:
+                facts.append("User said: " + " ".join(sentence.split()[:25]))
+    return facts[:8]
+
+def judge_replacement(query: str) -> bool:
+    """ Str-2 counts as covered by Str-1 when most of its content words appear there """
+    match = re.search(r"Str-1:(.*)\nStr-2:(.*)", query, re.S)
+    if not match:
+        return False
+    str1, str2 = content_words(match.group(1)), content_words(match.group(2))
+    return bool(str2) and len(str1 & str2) / len(str2) >= 0.6
+
+def structured_reply(schema_name: str, system: str, query: str) -> Dict:
+    if schema_name == "Choices":
+        return {"replacement": judge_replacement(query)}
+    if "list of facts" in system:
+        return {"queries": extract_facts(query)}
+    return {"queries": split_queries(query)}
+
+def schema_name_of(properties: Dict) -> str:
+    return "Choices" if "replacement" in properties else "StringList"
+
+# --------------------------------------------------------- SERVER ------------------------------------------------------------ #
+
+class FakeOllama:
+    def __init__(
+            self,
+            chat_latency: float = 0.0,          # seconds before the first chunk of every chat call
+            token_latency: float = 0.0,         # seconds between streamed text chunks
+            embed_latency: float = 0.0,         # seconds per embedding request (independent of batch size)
+            max_loaded: int = 0,                # models kept loaded at once like a small host, 0 = no limit
+            load_latency: float = 0.0,          # seconds to load a model that isn't loaded
+            dim: int = 256,
+            host: str = "127.0.0.1",
+            port: int = 0,
+        ):
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.dim = dim
+        self.max_loaded = max_loaded
+        self.load_latency = load_latency
+        self.calls = Counter()              # "chat", "chat[<model>]", "embed", "embed_texts", "generate", "model_loads", "model_swaps"
+        self._lock = threading.Lock()
+        self._loaded = OrderedDict()        # least recently used first
+        self._load_lock = threading.Lock()  # like ollama, one model loads at a time
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._json({"models": []} if self.path == "/api/tags" else {"version": "0.0.0-fake"})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if body.get("model"):
+                    fake._load(body["model"])
+                if self.path == "/api/embed":
+                    fake._count("embed", body.get("model"), texts=len(body["input"]) if isinstance(body["input"], list) else 1)
+                    time.sleep(fake.embed_latency)
+                    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+                    self._json({"model": body.get("model"), "embeddings": [fake_embedding(text, fake.dim) for text in inputs]})
+                elif self.path == "/api/chat":
+                    fake._count("chat", body.get("model"), request_bytes=len(json.dumps(body)))
+                    time.sleep(fake.chat_latency)
+                    self._chat(body)
+                elif self.path == "/api/generate":
+                    fake._count("generate", body.get("model"))
+                    self._json({"model": body.get("model"), "response": "", "done": True, "done_reason": "load"})
+                else:
+                    self.send_error(404)
+
+            def _json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chat(self, body):
+                message = fake.chat_reply(body)
+                model = body.get("model")
+                if not body.get("stream", True):
+                    self._json({"model": model, "created_at": "", "message": message, "done": True, "done_reason": "stop"})
+                    return
+
+                # ndjson stream, text is sent one word per chunk like real token deltas
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = re.findall(r"\S+\s*", message.get("content", "")) or [""]
+                for idx, piece in enumerate(pieces):
+                    chunk = {"role": "assistant", "content": piece}
+                    if idx == len(pieces) - 1 and message.get("tool_calls"):
+                        chunk["tool_calls"] = message["tool_calls"]
+                    self._chunk({"model": model, "created_at": "", "message": chunk, "done": False})
+                    if fake.token_latency:
+                        time.sleep(fake.token_latency)
+                self._chunk({"model": model, "created_at": "", "message": {"role": "assistant", "content": ""},
+                             "done": True, "done_reason": "stop", "eval_count": len(pieces), "prompt_eval_count": 1})
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, payload):
+                data = json.dumps(payload).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, kind: str, model: str, texts: int = 0, request_bytes: int = 0):
+        with self._lock:
+            self.calls[kind] += 1
+            self.calls[f"{kind}[{model}]"] += 1
+            if texts:
+                self.calls["embed_texts"] += texts
+            if request_bytes:
+                self.calls["chat_request_bytes"] += request_bytes      # prompt + schema/tool definitions, a proxy for prompt tokens
+
+    def _load(self, model: str):
+        with self._load_lock:
+            with self._lock:
+                if model in self._loaded:
+                    self._loaded.move_to_end(model)
+                    return
+                self.calls["model_loads"] += 1
+                if self.max_loaded and len(self._loaded) >= self.max_loaded:
+                    self._loaded.popitem(last=False)
+                    self.calls["model_swaps"] += 1
+                self._loaded[model] = True
+            time.sleep(self.load_latency)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.calls)
+
+    def chat_reply(self, body: Dict) -> Dict:
+        messages = body.get("messages", [])
+        system = "\n".join(m.get("content", "") for m in messages if m.get("role") == "system")
+        last = messages[-1] if messages else {"role": "user", "content": ""}
+        tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+
+        # structured output through a JSON schema in `format`
+        schema = body.get("format")
+        if isinstance(schema, dict) and "properties" in schema:
+            reply = structured_reply(schema_name_of(schema["properties"]), system, last.get("content", ""))
+            return {"role": "assistant", "content": json.dumps(reply)}
+
+        # structured output through langchain's tool strategy
+        for name in ("StringList", "Choices"):
+            if name in tool_names:
+                reply = structured_reply(name, system, last.get("content", ""))
+                return {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": name, "arguments": reply}}]}
+
+        # chat agent: look the user up once, then answer
+        if "user_data_retriever" in tool_names and last.get("role") == "user":
+            arguments = {"user_query": last["content"]}
+            return {"role": "assistant", "content": "", "tool_calls": [{"function": {"name": "user_data_retriever", "arguments": arguments}}]}
+        if last.get("role") == "tool":
+            return {"role": "assistant", "content": f"From what I remember: {last.get('content', '')[:300]}"}
+
+        # plain completion (rolling summary etc.)
+        return {"role": "assistant", "content": " ".join(words(last.get("content", ""))[:60])}
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake Ollama server in the foreground")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--chat-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--max-loaded", type=int, default=0)
+    parser.add_argument("--load-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeOllama(args.chat_latency, args.token_latency, args.embed_latency, args.max_loaded, args.load_latency, port=args.port)
+    print(f"fake ollama listening on {server.url}  (export OLLAMA_HOST={server.url})")
+    server._server.serve_forever()
@@ -0,0 +1,202 @@
+"""
+Offline UserRAG benchmark: replays test_data.conversations and neel_text.txt through injest_data and then runs a fixed
+set of retrieval queries, everything against the fake Ollama server in fake_ollama.py.
+
+    python bench/run_bench.py --chat-latency 0.3 --embed-latency 0.03 --save main
+    python bench/run_bench.py --chat-latency 0.3 --embed-latency 0.03 --compare main
+    python bench/run_bench.py --structured-output agent      # the create_agent path, for comparison
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from contextlib import redirect_stdout
+from typing import Dict, List
+import argparse
+import io
+import json
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from fake_ollama import FakeOllama
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+retrieval_queries = [
+    "RTX 3090",
+    "when was i born?",
+    "short summary of user's educational background",
+    "What is user's current job role? What's his educational background? Things that facinate the user.",
+    "what hardware projects is the user working on, ESP32 modules and shell scripts",
+    "which podcasts was the user invited to and what did he talk about",
+    "what keyboard does the user have",
+    "how many years would a random guy with a undergrad degree need to reach a career position where im right now",
+    "user's interests in AI safety and interpretability research",
+    "what communities is the user part of",
+]
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(samples))}
+
+def call_delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: after.get(key, 0) - before.get(key, 0) for key in after if after.get(key, 0) != before.get(key, 0)}
+
+def make_rag(db_path: str, args):
+    from rag import UserRAG
+    return UserRAG(
+            model_name="llama3.1",
+            embedding_model_name="embeddinggemma:300m",
+            db_path=db_path,
+            text_splitter="nothing yet",
+            hybrid_search=not args.no_hybrid,
+            lexical_fast_path=not args.no_lexical_fast_path,
+            vector_backend=args.backend,
+            vector_quantization=args.quantization,
+            structured_output=args.structured_output,
+        )
+
+def run(args) -> Dict:
+    from test_data import conversations
+
+    server = FakeOllama(chat_latency=args.chat_latency, token_latency=args.token_latency, embed_latency=args.embed_latency).start()
+    os.environ["OLLAMA_HOST"] = server.url
+    db_path = tempfile.mkdtemp(prefix="rechat-bench-")
+    try:
+        rag_system = make_rag(db_path, args)
+        with open(os.path.join(REPO_DIR, "neel_text.txt")) as f:
+            ingest_inputs = list(conversations) + [[{"role": "user", "content": f.read()}]]
+
+        # --- ingestion --- #
+        ingest_latencies, facts_seen, facts_stored = [], 0, 0
+        before = server.snapshot()
+        ingest_start = time.perf_counter()
+        for _ in range(args.ingest_rounds):
+            for conversation in ingest_inputs:
+                start = time.perf_counter()
+                _, stats = rag_system.injest_data(conversation, ret="ids", with_stats=True)
+                ingest_latencies.append(time.perf_counter() - start)
+                facts_seen += stats["facts"]
+                facts_stored += stats["ingested"]
+        ingest_time = time.perf_counter() - ingest_start
+        ingest_calls = call_delta(before, server.snapshot())
+
+        # --- retrieval: the first pass is cold, the repeats hit the caches --- #
+        cold, warm = [], []
+        before = server.snapshot()
+        for repeat in range(args.repeat):
+            for query in retrieval_queries:
+                start = time.perf_counter()
+                rag_system.retrieve_data(query=query, k=args.k)
+                (cold if repeat == 0 else warm).append(time.perf_counter() - start)
+        retrieve_calls = call_delta(before, server.snapshot())
+        n_retrievals = len(cold) + len(warm)
+
+        return {
+                "config": {key: value for key, value in vars(args).items() if key not in ("save", "compare", "verbose")},
+                "ingest": {
+                    "latency": percentiles(ingest_latencies),
+                    "conversations": len(ingest_latencies),
+                    "facts_extracted": facts_seen,
+                    "facts_stored": facts_stored,
+                    "facts_per_sec": facts_seen / ingest_time if ingest_time else 0.0,
+                    "calls": ingest_calls,
+                    "llm_calls_per_conversation": ingest_calls.get("chat", 0) / max(len(ingest_latencies), 1),
+                    "chat_bytes_per_call": ingest_calls.get("chat_request_bytes", 0) / max(ingest_calls.get("chat", 0), 1),
+                },
+                "retrieve": {
+                    "latency": percentiles(cold + warm),
+                    "cold_latency": percentiles(cold),
+                    "warm_latency": percentiles(warm),
+                    "queries": n_retrievals,
+                    "calls": retrieve_calls,
+                    "llm_calls_per_query": retrieve_calls.get("chat", 0) / max(n_retrievals, 1),
+                    "chat_bytes_per_call": retrieve_calls.get("chat_request_bytes", 0) / max(retrieve_calls.get("chat", 0), 1),
+                    "embed_calls_per_query": retrieve_calls.get("embed", 0) / max(n_retrievals, 1),
+                },
+            }
+    finally:
+        server.stop()
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """ Lists every latency percentile or per-call count that got worse than the baseline by more than `tolerance` """
+    regressions = []
+    for section in ("ingest", "retrieve"):
+        for metric in ("latency", "cold_latency", "warm_latency"):
+            for pct in ("p50", "p95", "p99"):
+                old = baseline.get(section, {}).get(metric, {}).get(pct)
+                new = result[section].get(metric, {}).get(pct)
+                if old and new is not None and new > old * (1 + tolerance):
+                    regressions.append(f"{section}.{metric}.{pct}: {old*1000:.1f}ms -> {new*1000:.1f}ms")
+        for metric in ("llm_calls_per_conversation", "llm_calls_per_query", "embed_calls_per_query"):
+            old, new = baseline.get(section, {}).get(metric), result[section].get(metric)
+            if old is not None and new is not None and new > old + 1e-9:
+                regressions.append(f"{section}.{metric}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+def print_report(result: Dict):
+    ingest, retrieve = result["ingest"], result["retrieve"]
+    fmt = lambda stats: " ".join(f"{key} {value*1000:.1f}ms" for key, value in stats.items())
+    print(f"ingest   : {ingest['conversations']} conversations, {ingest['facts_extracted']} facts extracted, "
+          f"{ingest['facts_stored']} stored, {ingest['facts_per_sec']:.1f} facts/s")
+    print(f"           latency {fmt(ingest['latency'])}")
+    print(f"           calls {ingest['calls']}, {ingest['chat_bytes_per_call']:.0f} request bytes per chat call")
+    print(f"retrieve : {retrieve['queries']} queries")
+    print(f"           all  {fmt(retrieve['latency'])}")
+    print(f"           cold {fmt(retrieve['cold_latency'])}")
+    print(f"           warm {fmt(retrieve['warm_latency'])}")
+    print(f"           calls {retrieve['calls']}, {retrieve['chat_bytes_per_call']:.0f} request bytes per chat call")
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark UserRAG ingestion and retrieval against a fake Ollama server")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="seconds added to every chat call")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds added to every embedding call")
+    parser.add_argument("--k", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the retrieval queries")
+    parser.add_argument("--ingest-rounds", type=int, default=1, help="passes over the ingestion inputs")
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma", help="vector store behind UserRAG")
+    parser.add_argument("--quantization", choices=["int8", "binary"], help="compact codes for the flat backend's scan")
+    parser.add_argument("--structured-output", choices=["direct", "agent"], default="direct",
+                        help="single schema-constrained calls or the create_agent graphs for summaries, sub-queries and decisions")
+    parser.add_argument("--no-hybrid", action="store_true", help="vector search only, no BM25 fusion")
+    parser.add_argument("--no-lexical-fast-path", action="store_true", help="always embed, even for confident BM25 hits")
+    parser.add_argument("--save", metavar="NAME", help="store the result as bench/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against bench/baselines/NAME.json")
+    parser.add_argument("--verbose", action="store_true", help="show UserRAG's own output")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before flagging")
+    args = parser.parse_args()
+
+    # UserRAG prints every ingest/skip decision, keep that out of the report unless asked for
+    with redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+        result = run(args)
+    print_report(result)
+
+    exit_code = 0
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS vs", args.compare)
+            print("\n".join(f"  {line}" for line in regressions))
+            exit_code = 1
+        else:
+            print(f"\nno regressions vs {args.compare}")
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save}.json"), "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved baseline {args.save}")
+    sys.exit(exit_code)
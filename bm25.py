@@ -0,0 +1,144 @@
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple
+import math
+import threading
+
+from rag_utils import normalize_text
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+# every stored fact talks about "the user", so those words carry no signal for ranking or for coverage
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "of", "to", "in", "on", "at", "for", "with", "by", "from", "as", "about", "into",
+    "is", "are", "was", "were", "be", "been", "has", "have", "had", "do", "does", "did", "it", "its", "this", "that", "these",
+    "those", "what", "when", "where", "who", "which", "how", "why", "i", "me", "my", "im", "you", "your", "he", "she", "his",
+    "her", "him", "they", "them", "their", "user", "users", "s",
+}
+
+def tokenize(text: str) -> List[str]:
+    """ Normalized words minus stopwords, with a crude plural strip so 'podcasts' matches 'podcast' """
+    tokens = []
+    for word in normalize_text(text).split():
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+class LexicalHit(NamedTuple):
+    """ A single stored fact returned by a BM25 search """
+    id: str
+    text: str
+    score: float
+    coverage: float                         # share of the distinct query terms that appear in the fact
+    matched: int = 0                        # how many distinct query terms appear in the fact
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring over the stored facts.
+    Facts are short, so postings keep plain term frequencies per document and the texts are kept alongside to answer
+    lexical-only searches without going back to the vector store. Thread safe, the ingest worker writes while chat reads.
+    """
+    def __init__(
+            self,
+            k1: float = 1.2,
+            b: float = 0.75,
+        ):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}      # term -> {doc id -> term frequency}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._texts: Dict[str, str] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def add(
+            self,
+            ids: Iterable[str],
+            texts: Iterable[str],
+        ):
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                if doc_id in self._texts:
+                    self._remove(doc_id)
+                terms = Counter(tokenize(text))
+                self._doc_terms[doc_id] = terms
+                self._texts[doc_id] = text
+                self._doc_lengths[doc_id] = sum(terms.values())
+                self._total_length += self._doc_lengths[doc_id]
+                for term, freq in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = freq
+
+    def remove(self, ids: Iterable[str]):
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._texts:
+                    self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id)
+        del self._texts[doc_id]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(
+            self,
+            query: str,
+            k: int,
+        ) -> List[LexicalHit]:
+        """ Top `k` facts by BM25 score, only facts sharing at least one query term are returned """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms or k <= 0:
+            return []
+
+        with self._lock:
+            n_docs = len(self._texts)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs
+
+            scores, matched = {}, Counter()
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1.0 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, freq in postings.items():
+                    norm = freq + self.k1 * (1.0 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1.0) / norm
+                    matched[doc_id] += 1
+
+            top_ids = sorted(scores, key=lambda doc_id: -scores[doc_id])[:k]
+            return [
+                    LexicalHit(id=doc_id, text=self._texts[doc_id], score=scores[doc_id],
+                               coverage=matched[doc_id] / len(query_terms), matched=matched[doc_id])
+                    for doc_id in top_ids
+                ]
+
+
+def reciprocal_rank_fusion(
+        rankings: List[List],
+        k: int,
+        rrf_k: int = 60,
+    ) -> List:
+    """
+    Merges ranked hit lists (anything with an `.id`) by summing 1 / (rrf_k + rank) per id.
+    Returns the top `k` hits, each represented by the first hit object seen for its id.
+    """
+    scores, first_hit = {}, {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            scores[hit.id] = scores.get(hit.id, 0.0) + 1.0 / (rrf_k + rank + 1)
+            first_hit.setdefault(hit.id, hit)
+    return [first_hit[doc_id] for doc_id in sorted(scores, key=lambda doc_id: -scores[doc_id])[:k]]
@@ -0,0 +1,305 @@
+from bisect import bisect_right
+from typing import Iterable, List, Tuple
+
+from rich.cells import cell_len
+from rich.style import Style
+from rich.text import Text
+from textual.cache import LRUCache
+from textual.geometry import Size
+from textual.message import Message
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class MessageStore:
+    """
+    The chat history as parallel lists (role, text, subtitle), no widget per message.
+    Every message has a stable id: appended ones count up, prepended (older, paged in) ones count down, so
+    `index = id - first_id` holds for the whole history.
+    """
+    def __init__(self):
+        self.is_user: List[bool] = []
+        self.texts: List[str] = []
+        self.subtitles: List[str] = []
+        self.first_id = 0
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def index_of(self, message_id: int) -> int:
+        return message_id - self.first_id
+
+    def append(self, text: str, is_user: bool) -> int:
+        self.is_user.append(is_user)
+        self.texts.append(text)
+        self.subtitles.append("")
+        return self.first_id + len(self.texts) - 1
+
+    def prepend(self, messages: List[Tuple[str, bool]]):
+        """ Older messages, oldest first """
+        self.is_user[:0] = [is_user for _, is_user in messages]
+        self.texts[:0] = [text for text, _ in messages]
+        self.subtitles[:0] = [""] * len(messages)
+        self.first_id -= len(messages)
+
+    def clear(self):
+        self.is_user.clear()
+        self.texts.clear()
+        self.subtitles.clear()
+        self.first_id = 0
+
+
+class ChatLogEntry:
+    """ Handle on one message of a ChatLog, stands in for the old per-message ChatBubble widget """
+    def __init__(self, log: "ChatLog", message_id: int):
+        self.log = log
+        self.message_id = message_id
+
+    def update(self, text: str):
+        self.log.update_message(self.message_id, text=text)
+
+    @property
+    def border_subtitle(self) -> str:
+        return self.log.store.subtitles[self.log.store.index_of(self.message_id)]
+
+    @border_subtitle.setter
+    def border_subtitle(self, subtitle: str):
+        self.log.update_message(self.message_id, subtitle=subtitle)
+
+
+class ChatLog(ScrollView, can_focus=True):
+    """
+    Virtualized chat history (Textual's Line API). Messages live in a `MessageStore` and only the lines inside the
+    viewport are rendered, from a small LRU of wrapped bubbles, so appending, streaming into the last message and
+    scrolling cost the same with ten messages or ten thousand. Heights are kept per message with their prefix sums;
+    they are recomputed for every message only when the width changes.
+    """
+    COMPONENT_CLASSES = {"chat-log--user", "chat-log--assistant", "chat-log--subtitle"}
+
+    DEFAULT_CSS = """
+    ChatLog {
+        background: $background;
+        overflow-y: scroll;
+        overflow-x: hidden;
+    }
+    ChatLog > .chat-log--user {
+        background: $primary-darken-2;
+        color: white;
+    }
+    ChatLog > .chat-log--assistant {
+        background: $surface-lighten-1;
+        color: $text;
+    }
+    ChatLog > .chat-log--subtitle {
+        color: $text-muted;
+    }
+    """
+
+    class NearTop(Message):
+        """ The view reached the first line (or was scrolled up while there), time to page in older messages """
+
+    max_bubble_ratio = 0.8                      # bubbles take at most this share of the width
+    padding_x = 2
+    margin = 1                                  # blank lines above every bubble
+
+    def __init__(
+            self,
+            cache_size: int = 256,
+            name: str = None,
+            id: str = None,
+            classes: str = None,
+        ):
+        super().__init__(name=name, id=id, classes=classes)
+        self.store = MessageStore()
+        self._heights: List[int] = []           # rendered lines per message, margin included
+        self._starts: List[int] = []            # first line of every message
+        self._layout_width = 0
+        self._bubbles: LRUCache[int, List[Strip]] = LRUCache(cache_size)    # message id -> its rendered lines
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    @property
+    def content_width(self) -> int:
+        return max(self.scrollable_content_region.width, 10)
+
+    def notify_style_update(self):
+        super().notify_style_update()
+        self._bubbles.clear()
+
+    def watch_scroll_y(self, old_value: float, new_value: float):
+        super().watch_scroll_y(old_value, new_value)
+        if new_value < 1 <= old_value:
+            self.post_message(self.NearTop())
+
+    def on_mouse_scroll_up(self):
+        if self.scroll_y < 1:
+            self.post_message(self.NearTop())
+
+    def on_resize(self):
+        if self.content_width != self._layout_width:
+            self._relayout()
+
+    def _relayout(self):
+        """ Heights of every message for the current width; a view that was at the bottom (or never laid out) stays there """
+        follow = self.is_vertical_scroll_end or not self._layout_width
+        self._layout_width = self.content_width
+        self._bubbles.clear()
+        self._heights = [self._measure(idx) for idx in range(len(self.store))]
+        self._starts = []
+        total = 0
+        for height in self._heights:
+            self._starts.append(total)
+            total += height
+        self._resize_virtual()
+        if follow:
+            self.scroll_end(animate=False, x_axis=False)
+
+    def _resize_virtual(self):
+        total = self._starts[-1] + self._heights[-1] if self._heights else 0
+        self.virtual_size = Size(self._layout_width, total)
+
+    def _measure(self, idx: int) -> int:
+        return len(self._render_bubble(idx))
+
+    def _render_bubble(self, idx: int) -> List[Strip]:
+        """ All lines of one message (margin, padded bubble, subtitle row) at the layout width, cached per message id """
+        message_id = self.store.first_id + idx
+        cached = self._bubbles.get(message_id)
+        if cached is not None:
+            return cached
+
+        width = self._layout_width or self.content_width
+        is_user, text, subtitle = self.store.is_user[idx], self.store.texts[idx], self.store.subtitles[idx]
+        base = self.rich_style
+        bubble = self.get_component_rich_style("chat-log--user" if is_user else "chat-log--assistant")
+        muted = Style(color=self.get_component_rich_style("chat-log--subtitle").color)
+
+        max_inner = max(int(width * self.max_bubble_ratio) - 2 * self.padding_x, 1)
+        natural = max((cell_len(line) for line in text.splitlines()), default=0)
+        inner = max(min(max(natural, cell_len(subtitle)), max_inner), 1)
+        outer = inner + 2 * self.padding_x
+        left = max(width - outer - 1, 0) if is_user else 1
+        right = max(width - left - outer, 0)
+
+        console = self.app.console
+        wrapped = console.render_lines(
+                Text(text, justify="right" if is_user else "left"),
+                console.options.update_width(inner),
+                style=base + bubble,
+                pad=True,
+            )
+        pad = Strip.blank(self.padding_x, base + bubble)
+        empty_row = Strip.blank(outer, base + bubble)
+
+        def row(content: Strip) -> Strip:
+            return Strip.join([Strip.blank(left, base), content, Strip.blank(right, base)])
+
+        bottom = empty_row
+        if subtitle:
+            # like a border subtitle: right-aligned in the bubble's last row
+            label = Text(f" {subtitle} ", style=base + bubble + muted)
+            label.truncate(outer)
+            bottom = Strip.join([Strip.blank(outer - label.cell_len, base + bubble), Strip(list(label.render(console)), label.cell_len)])
+        lines = [Strip.blank(width, base)] * self.margin + [row(empty_row)]
+        lines += [row(Strip.join([pad, Strip(segments, inner), pad])) for segments in wrapped]
+        lines.append(row(bottom))
+
+        self._bubbles[message_id] = lines
+        return lines
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    def add_message(self, text: str, is_user: bool) -> ChatLogEntry:
+        """ Appends a message and follows it if the view was at the bottom """
+        follow = self.is_vertical_scroll_end or not self._heights
+        message_id = self.store.append(text, is_user)
+        if self._layout_width:
+            start = self._starts[-1] + self._heights[-1] if self._heights else 0
+            self._starts.append(start)
+            self._heights.append(self._measure(len(self.store) - 1))
+            self._resize_virtual()
+        self._follow(follow)
+        return ChatLogEntry(self, message_id)
+
+    def add_messages(self, messages: Iterable[Tuple[str, bool]]):
+        """ Many messages at once (e.g. a restored conversation), laid out in one pass """
+        for text, is_user in messages:
+            self.store.append(text, is_user)
+        if self._layout_width:
+            self._relayout()
+        self._follow(True)
+
+    def prepend_messages(self, messages: List[Tuple[str, bool]]):
+        """ Older messages above the current ones; the lines in view stay in place """
+        if not messages:
+            return
+        self.store.prepend(messages)
+        if not self._layout_width:
+            return
+        heights = [self._measure(idx) for idx in range(len(messages))]
+        added = sum(heights)
+        self._heights[:0] = heights
+        starts, total = [], 0
+        for height in heights:
+            starts.append(total)
+            total += height
+        self._starts = starts + [start + added for start in self._starts]
+        self._resize_virtual()
+        self.scroll_to(y=self.scroll_y + added, animate=False, immediate=True)
+
+    def update_message(
+            self,
+            message_id: int,
+            text: str = None,
+            subtitle: str = None,
+        ):
+        """ Changes a message in place (a streaming reply); only the messages below it move """
+        idx = self.store.index_of(message_id)
+        if not 0 <= idx < len(self.store):
+            return
+        follow = self.is_vertical_scroll_end
+        if text is not None:
+            self.store.texts[idx] = text
+        if subtitle is not None:
+            self.store.subtitles[idx] = subtitle
+        self._bubbles.discard(message_id)
+        if self._layout_width:
+            height = self._measure(idx)
+            delta = height - self._heights[idx]
+            if delta:
+                self._heights[idx] = height
+                for later in range(idx + 1, len(self._starts)):
+                    self._starts[later] += delta
+                self._resize_virtual()
+        self.refresh()
+        self._follow(follow)
+
+    def clear(self):
+        self.store.clear()
+        self._bubbles.clear()
+        self._heights, self._starts = [], []
+        self.virtual_size = Size(self._layout_width, 0)
+        self.refresh()
+
+    def _follow(self, follow: bool):
+        if follow:
+            self.scroll_end(animate=False, immediate=True, x_axis=False)
+        self.refresh()
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    def render_line(self, y: int) -> Strip:
+        scroll_x, scroll_y = self.scroll_offset
+        line = scroll_y + y
+        width = self.size.width
+        if not self._layout_width:
+            self._relayout()
+        if not self._starts or line >= self._starts[-1] + self._heights[-1]:
+            return Strip.blank(width, self.rich_style)
+
+        idx = bisect_right(self._starts, line) - 1
+        lines = self._render_bubble(idx)
+        offset = line - self._starts[idx]
+        strip = lines[offset] if offset < len(lines) else Strip.blank(self._layout_width, self.rich_style)
+        return strip.crop_extend(scroll_x, scroll_x + width, self.rich_style).apply_offsets(scroll_x, line)
@@ -0,0 +1,203 @@
+"""
+Offline compaction of a memory database: folds paraphrased duplicate facts ("user was invited to a podcast..." x5) into one.
+Only facts added since the previous run are compared (against everything stored), so repeated runs stay cheap.
+Near-identical pairs are folded right away, the ambiguous band above them goes through the same decision model ingestion
+uses, so "user likes sushi" / "user no longer likes sushi" both stay.
+
+    python compaction.py "./private/chroma_db[main]"
+    python compaction.py ./private/work --ask-distance 0.3 --dry-run
+"""
+from typing import Dict, List, Tuple
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from prompt_gallery import analyze_strings_prompt
+from rag_utils import cosine_similarity_matrix, make_single_query
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def search_latency(
+        rag_system,
+        vectors: np.ndarray,
+        k: int = 5,
+        samples: int = 50,
+    ) -> float:
+    """ Median seconds of a top-k store search, stored vectors serve as queries """
+    if not len(vectors):
+        return 0.0
+    rng = np.random.default_rng(0)
+    timings = []
+    for idx in rng.integers(0, len(vectors), min(samples, len(vectors))):
+        start = time.perf_counter()
+        rag_system.store.search([vectors[idx]], k)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+def load_state(path: str) -> Dict:
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"processed": [], "runs": []}
+
+def save_state(path: str, state: Dict):
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+def find_redundant(
+        ids: List[str],
+        texts: List[str],
+        vectors: np.ndarray,
+        new_rows: List[int],
+        skip_distance: float,
+        ask_distance: float,
+        block_rows: int = 1024,
+    ) -> Tuple[Dict[str, str], List[Tuple[int, int]]]:
+    """
+    Greedy pass over the new facts: each one is compared with every fact still kept. When the closest is within
+    `skip_distance` cosine distance the older of the two is dropped in favour of the newer one (store order is insertion
+    order), when it is within `ask_distance` the pair is left for the decision model as (older row, newer row).
+    Comparing against a single kept representative, instead of linking whole chains of neighbours, keeps a run of
+    gradually drifting paraphrases from collapsing into one fact. Returns ({dropped id: id it was folded into}, pairs).
+    """
+    kept = np.ones(len(ids), dtype=bool)
+    dropped, pairs = {}, []
+    for start in range(0, len(new_rows), block_rows):
+        block = new_rows[start:start+block_rows]
+        similarities = cosine_similarity_matrix(vectors[block], vectors)
+        for row, row_similarities in zip(block, similarities):
+            if not kept[row]:
+                continue
+            candidates = np.where(kept, row_similarities, -np.inf)
+            candidates[row] = -np.inf
+            best = int(candidates.argmax())
+            if not np.isfinite(candidates[best]) or 1.0 - candidates[best] >= ask_distance:
+                continue
+            older, newer = min(row, best), max(row, best)
+            if 1.0 - candidates[best] <= skip_distance:
+                kept[older] = False
+                dropped[ids[older]] = ids[newer]
+            else:
+                pairs.append((older, newer))
+    return dropped, pairs
+
+def confirm_redundant(
+        rag_system,
+        ids: List[str],
+        texts: List[str],
+        pairs: List[Tuple[int, int]],
+        dropped: Dict[str, str],
+    ) -> int:
+    """
+    Asks the decision model whether everything the older fact says is already in the newer one, the older is dropped
+    into `dropped` only on a yes. A no keeps both: an updated value or a negation then lives next to the old fact until
+    the user says otherwise, instead of the newer one being lost. Returns the number of model calls.
+    """
+    pairs = [(older, newer) for older, newer in pairs if ids[older] not in dropped and ids[newer] not in dropped]
+    if not pairs:
+        return 0
+    decision_inputs = [
+            make_single_query(sys_prompt=analyze_strings_prompt, usr_query=f"Str-1: {texts[newer]}\nStr-2: {texts[older]}")
+            for older, newer in pairs
+        ]
+    decisions = rag_system.decision_completion.batch(decision_inputs, max_concurrency=rag_system.max_workers)
+    for (older, newer), decision in zip(pairs, decisions):
+        # an earlier pair may have dropped either side already
+        if decision.replacement and ids[older] not in dropped and ids[newer] not in dropped:
+            dropped[ids[older]] = ids[newer]
+    return len(decision_inputs)
+
+def compact(
+        rag_system,
+        skip_distance: float = None,
+        ask_distance: float = None,
+        dry_run: bool = False,
+        full: bool = False,
+        state_path: str = None,
+    ) -> Dict:
+    """
+    Removes facts that a newer stored fact repeats and reports the database before and after. The distances default to
+    the database's ingestion thresholds (`auto_skip_distance` / `auto_ingest_distance`).
+    Progress is kept in <db_path>/compaction_state.json; `full` ignores it and compares every fact again.
+    """
+    skip_distance = rag_system.auto_skip_distance if skip_distance is None else skip_distance
+    ask_distance = rag_system.auto_ingest_distance if ask_distance is None else ask_distance
+    state_path = state_path or os.path.join(rag_system.db_path, "compaction_state.json")
+    state = load_state(state_path)
+    processed = set() if full else set(state["processed"])
+
+    started = time.perf_counter()
+    ids, texts, vectors = [], [], []
+    for batch_ids, batch_texts, batch_vectors in rag_system.store.iter_batches(5000):
+        ids += batch_ids
+        texts += batch_texts
+        vectors += batch_vectors
+    vectors = np.asarray(vectors, dtype=np.float32)
+    new_rows = [row for row, doc_id in enumerate(ids) if doc_id not in processed]
+
+    report = {
+            "facts_before": len(ids), "new_facts": len(new_rows), "bytes_before": directory_size(rag_system.db_path),
+            "search_p50_before": search_latency(rag_system, vectors), "skip_distance": skip_distance,
+            "ask_distance": ask_distance, "dry_run": dry_run,
+        }
+
+    dropped, pairs = find_redundant(ids, texts, vectors, new_rows, skip_distance, ask_distance) if new_rows else ({}, [])
+    report["auto_removed"] = len(dropped)
+    report["llm_calls"] = confirm_redundant(rag_system, ids, texts, pairs, dropped)
+
+    # a fact that was folded into something later dropped itself points at that one's final survivor
+    for loser, winner in dropped.items():
+        while winner in dropped:
+            winner = dropped[winner]
+        dropped[loser] = winner
+    report["removed"] = len(dropped)
+    report["examples"] = [{"removed": texts[ids.index(loser)], "kept": texts[ids.index(winner)]} for loser, winner in list(dropped.items())[:5]]
+
+    if not dry_run:
+        if dropped:
+            rag_system.delete_facts(list(dropped))
+        state["processed"] = [doc_id for doc_id in ids if doc_id not in dropped]
+        state["runs"] = (state["runs"] + [{"at": time.time(), "new_facts": len(new_rows), "removed": len(dropped)}])[-50:]
+        save_state(state_path, state)
+
+    remaining = np.asarray([vector for doc_id, vector in zip(ids, vectors) if doc_id not in dropped]) if not dry_run else vectors
+    report.update({
+            "facts_after": rag_system.store.count(), "bytes_after": directory_size(rag_system.db_path),
+            "search_p50_after": search_latency(rag_system, remaining), "seconds": time.perf_counter() - started,
+        })
+    return report
+
+def print_report(report: Dict):
+    print(f"facts    : {report['facts_before']} -> {report['facts_after']} ({report['new_facts']} new since the last run, "
+          f"{report['removed']} {'would be ' if report['dry_run'] else ''}removed)")
+    print(f"decided  : {report['auto_removed']} near-identical, {report['llm_calls']} pairs asked the decision model")
+    print(f"size     : {report['bytes_before'] / 1024:.1f}KB -> {report['bytes_after'] / 1024:.1f}KB")
+    print(f"search   : p50 {report['search_p50_before'] * 1000:.2f}ms -> {report['search_p50_after'] * 1000:.2f}ms")
+    print(f"took     : {report['seconds']:.2f}s")
+    for example in report["examples"]:
+        print(f"  - {example['removed']}\n    kept: {example['kept']}")
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    from rag import UserRAG
+
+    parser = argparse.ArgumentParser(description="Merge near-duplicate facts of a memory database")
+    parser.add_argument("db_path", help="e.g. ./private/chroma_db[main]")
+    parser.add_argument("--skip-distance", type=float, help="cosine distance below which two facts count as the same (default: the ingestion one)")
+    parser.add_argument("--ask-distance", type=float, help="cosine distance below which the decision model is asked (default: the ingestion one)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    parser.add_argument("--full", action="store_true", help="compare every fact again, not just the ones added since the last run")
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--embedding-model", default="embeddinggemma:300m")
+    args = parser.parse_args()
+
+    rag_system = UserRAG(model_name=args.model, embedding_model_name=args.embedding_model, db_path=args.db_path, text_splitter="nothing yet")
+    print_report(compact(rag_system, skip_distance=args.skip_distance, ask_distance=args.ask_distance, dry_run=args.dry_run, full=args.full))
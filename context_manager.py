@@ -0,0 +1,81 @@
+from typing import List, Dict
+
+from prompt_gallery import rolling_summary_prompt
+from rag_utils import make_single_query, format_conversation, estimate_tokens
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class ConversationContext:
+    """
+    Keeps what is sent to the chat agent under a token budget.
+    The window is a stable prefix (one message holding the rolling summary) followed by the recent turns verbatim, so
+    Ollama can keep reusing its prompt cache between folds. Once the window grows past `token_budget`, the oldest turns
+    are folded into the summary in one go, leaving roughly half the budget verbatim.
+    The full, unfolded conversation stays in `transcript` for ingestion.
+    """
+    def __init__(
+            self,
+            summarizer,
+            token_budget: int = 4000,
+            keep_recent: int = 6,
+        ):
+        self.summarizer = summarizer            # any langchain chat model, e.g. ChatOllama(model="llama3.1")
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent          # these many latest messages are never folded
+
+        self.transcript = []
+        self.summary = ""
+        self.folded = 0                         # transcript[:folded] lives only in the summary
+
+    def append(self, role: str, content: str):
+        self.transcript.append({"role": role, "content": content})
+
+    def window(self) -> List[Dict]:
+        """ Messages to hand to the chat agent for the next turn """
+        recent = self.transcript[self.folded:]
+        if not self.summary:
+            return list(recent)
+        return [{"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}] + recent
+
+    def _fold_boundary(self) -> int:
+        """ Index up to which the transcript gets folded, 0 when the window still fits """
+        recent = self.transcript[self.folded:]
+        if len(recent) <= self.keep_recent or estimate_tokens(self.window()) <= self.token_budget:
+            return 0
+
+        # fold the oldest messages until about half the budget is left verbatim
+        boundary, tokens = self.folded, sum(estimate_tokens([message]) for message in recent)
+        while len(self.transcript) - boundary > self.keep_recent and tokens > self.token_budget // 2:
+            tokens -= estimate_tokens([self.transcript[boundary]])
+            boundary += 1
+
+        # never split a turn, the verbatim part starts at a user message
+        while boundary > self.folded and boundary < len(self.transcript) and self.transcript[boundary]["role"] != "user":
+            boundary -= 1
+        return boundary if boundary > self.folded else 0
+
+    def _fold_messages(self, boundary: int) -> List[Dict]:
+        new_turns = format_conversation(self.transcript[self.folded:boundary])
+        return make_single_query(
+                sys_prompt=rolling_summary_prompt,
+                usr_query=f"Current summary:\n{self.summary or '(empty)'}\n\nNew turns:\n{new_turns}"
+            )
+
+    def maybe_fold(self) -> bool:
+        """ Folds old turns into the summary if the window is over budget, returns True if it did """
+        boundary = self._fold_boundary()
+        if not boundary:
+            return False
+
+        self.summary = self.summarizer.invoke(self._fold_messages(boundary)).text.strip()
+        self.folded = boundary
+        return True
+
+    async def amaybe_fold(self) -> bool:
+        boundary = self._fold_boundary()
+        if not boundary:
+            return False
+
+        self.summary = (await self.summarizer.ainvoke(self._fold_messages(boundary))).text.strip()
+        self.folded = boundary
+        return True
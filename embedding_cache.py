@@ -0,0 +1,129 @@
+from langchain_core.embeddings import Embeddings
+
+from typing import List, Dict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from tracing import tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class CachedEmbeddings(Embeddings):
+    """
+    Disk backed, content addressed cache in front of any langchain `Embeddings`.
+    Vectors are keyed by (model name, text hash) and stored as float32 blobs in SQLite, the least recently used
+    entries get evicted once the cache grows past `max_entries`.
+    """
+    def __init__(
+            self,
+            embeddings: Embeddings,
+            model_name: str,
+            cache_path: str,
+            max_entries: int = 50_000,
+        ):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, texts: List[str]):
+        """ Returns the cached vectors (None where missing) and the unique texts that still need embedding """
+        keys = [self._key(text) for text in texts]
+        unique_keys = list(dict.fromkeys(keys))
+
+        found = {}
+        with self._lock:
+            for start in range(0, len(unique_keys), 500):        # stay under sqlite's bound parameter limit
+                chunk = unique_keys[start:start+500]
+                rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                found.update({key: np.frombuffer(blob, dtype=np.float32).tolist() for key, blob in rows})
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used=? WHERE key=?", [(now, key) for key in found])
+                self._conn.commit()
+
+        vectors = [found.get(key) for key in keys]
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        self.hits += len(texts) - sum(vector is None for vector in vectors)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def _store(self, texts: List[str], new_vectors: List[List[float]]):
+        now = time.time()
+        rows = [(self._key(text), np.asarray(vector, dtype=np.float32).tobytes(), now) for text, vector in zip(texts, new_vectors)]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._size += len(rows)
+            if self._size > self.max_entries:
+                self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                overflow = self._size - self.max_entries
+                if overflow > 0:
+                    self._conn.execute(
+                            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                            (overflow,)
+                        )
+                    self._size -= overflow
+            self._conn.commit()
+
+    @staticmethod
+    def _merge(texts: List[str], vectors: List, missing: List[str], new_vectors: List[List[float]]) -> List[List[float]]:
+        fresh = dict(zip(missing, new_vectors))
+        return [vector if vector is not None else list(fresh[text]) for text, vector in zip(texts, vectors)]
+
+    @tracer.traced("embed")
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._lookup(texts)
+        tracer.annotate(texts=len(texts), misses=len(missing))
+        if not missing:
+            return vectors
+
+        new_vectors = self.embeddings.embed_documents(missing)
+        self._store(missing, new_vectors)
+        return self._merge(texts, vectors, missing, new_vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    @tracer.traced("embed")
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        vectors, missing = self._lookup(texts)
+        tracer.annotate(texts=len(texts), misses=len(missing))
+        if not missing:
+            return vectors
+
+        new_vectors = await self.embeddings.aembed_documents(missing)
+        self._store(missing, new_vectors)
+        return self._merge(texts, vectors, missing, new_vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": self._size}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
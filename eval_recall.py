@@ -0,0 +1,115 @@
+"""
+Recall@k of the quantized flat index modes against exact float32 search.
+Queries are stored vectors with some gaussian noise added, so they behave like paraphrases of stored facts.
+Quantized modes always rerank on float32 vectors; --dtype only applies to the unquantized row.
+
+    python eval_recall.py "./private/chroma_db[main]" --k 5
+    python eval_recall.py --synthetic 50000 --dim 768 --rerank-factors 1 4 10
+"""
+from typing import Dict, List, Optional
+import argparse
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from vector_backends import ChromaBackend, FlatIndexBackend, flat_index_path
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def load_vectors(db_path: str) -> np.ndarray:
+    source = FlatIndexBackend(flat_index_path(db_path)) if FlatIndexBackend.exists(flat_index_path(db_path)) else ChromaBackend(db_path)
+    batches = [np.asarray(vectors, dtype=np.float32) for _, _, vectors in source.iter_batches(5000)]
+    return np.concatenate(batches) if batches else np.zeros((0, 0), dtype=np.float32)
+
+def synthetic_vectors(
+        n: int,
+        dim: int,
+        clusters: int = 200,
+        seed: int = 0,
+    ) -> np.ndarray:
+    """ Clustered unit vectors, a rough stand-in for embeddings of facts about a handful of topics """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)] + 0.8 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def build_index(
+        path: str,
+        vectors: np.ndarray,
+        dtype: str,
+        quantization: Optional[str],
+    ) -> FlatIndexBackend:
+    index = FlatIndexBackend(path, dtype=dtype, quantization=quantization)
+    for start in range(0, len(vectors), 10_000):
+        batch = vectors[start:start+10_000]
+        index.add([str(start + offset) for offset in range(len(batch))], [""] * len(batch), batch)
+    return index
+
+def evaluate(
+        vectors: np.ndarray,
+        k: int = 10,
+        n_queries: int = 200,
+        noise: float = 0.3,
+        modes: List[str] = ("int8", "binary"),
+        rerank_factors: List[int] = (1, 4),
+        dtype: str = "float16",
+        seed: int = 0,
+    ) -> List[Dict]:
+    rng = np.random.default_rng(seed)
+    dim = vectors.shape[1]
+    queries = vectors[rng.integers(0, len(vectors), n_queries)] + noise * rng.standard_normal((n_queries, dim)).astype(np.float32) / np.sqrt(dim)
+
+    # ground truth: float32 vectors, no codes
+    workdir = tempfile.mkdtemp(prefix="rechat-recall-")
+    try:
+        exact = build_index(f"{workdir}/exact", vectors, "float32", None)
+        truth = [{hit.id for hit in hits} for hits in exact.search(queries, k)]
+
+        rows = []
+        for mode in [None, *modes]:
+            index = build_index(f"{workdir}/{mode or 'none'}", vectors, dtype, mode)
+            for factor in (rerank_factors if mode else [1]):
+                index.rerank_factor = factor
+                start = time.perf_counter()
+                results = [index.search(queries[i:i+1], k)[0] for i in range(n_queries)]
+                elapsed = time.perf_counter() - start
+                recall = np.mean([len(truth_ids & {hit.id for hit in hits}) / k for truth_ids, hits in zip(truth, results)])
+                rows.append({
+                        "mode": mode or dtype, "rerank_factor": factor if mode else None, f"recall@{k}": float(recall),
+                        "ms_per_query": elapsed / n_queries * 1000, **index.memory_bytes(),
+                    })
+        return rows
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall@k of quantized flat index search versus exact search")
+    parser.add_argument("db_path", nargs="?", help="memory db to take the vectors from, e.g. ./private/chroma_db[main]")
+    parser.add_argument("--synthetic", type=int, metavar="N", help="use N synthetic vectors instead of a db")
+    parser.add_argument("--dim", type=int, default=768, help="dimension of the synthetic vectors")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.3, help="norm of the noise added to each query vector")
+    parser.add_argument("--modes", nargs="+", choices=["int8", "binary"], default=["int8", "binary"])
+    parser.add_argument("--rerank-factors", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16", help="dtype of the unquantized index (quantized ones rerank on float32)")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    elif args.db_path:
+        vectors = load_vectors(args.db_path)
+    else:
+        parser.error("give a db path or --synthetic N")
+    if len(vectors) < args.k:
+        parser.error(f"need at least k={args.k} stored vectors, found {len(vectors)}")
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, {args.queries} queries, k={args.k}\n")
+    print(f"{'mode':<10}{'rerank':>8}{'recall@' + str(args.k):>12}{'ms/query':>11}{'scanned':>12}{'vectors':>12}")
+    for row in evaluate(vectors, args.k, args.queries, args.noise, args.modes, args.rerank_factors, args.dtype):
+        print(f"{row['mode']:<10}{row['rerank_factor'] or '-':>8}{row[f'recall@{args.k}']:>12.3f}{row['ms_per_query']:>11.2f}"
+              f"{row['scanned'] / 2**20:>10.1f}MB{row['vectors'] / 2**20:>10.1f}MB")
@@ -0,0 +1,49 @@
+"""
+Streams a text file (notes, exports, neel_text.txt, ...) into a memory database as passages.
+Interrupted runs pick up from their checkpoint when started again with the same file.
+
+    python ingest_document.py neel_text.txt "./private/chroma_db[main]"
+    python ingest_document.py notes_export.txt ./private/work --splitter recursive --batch-size 128
+"""
+import argparse
+import sys
+import time
+
+from rag import UserRAG
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def print_progress(stats):
+    percent = stats["bytes_read"] / stats["total_bytes"] * 100 if stats["total_bytes"] else 100.0
+    sys.stdout.write(f"\r{percent:5.1f}%  {stats['chunks']} chunks, {stats['stored']} stored, {stats['duplicates']} duplicates")
+    sys.stdout.flush()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream a text file into a memory database")
+    parser.add_argument("path", help="text file to ingest")
+    parser.add_argument("db_path", help="e.g. ./private/chroma_db[main]")
+    parser.add_argument("--splitter", default="sentence", help="'recursive' for ~800 character passages, anything else splits into sentences")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks embedded and written per batch")
+    parser.add_argument("--read-size", type=int, default=64 * 1024, help="bytes read from the file at a time")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and go through the whole file again")
+    parser.add_argument("--embedding-model", default="embeddinggemma:300m")
+    parser.add_argument("--model", default="llama3.1")
+    args = parser.parse_args()
+
+    rag_system = UserRAG(
+            model_name=args.model,
+            embedding_model_name=args.embedding_model,
+            db_path=args.db_path,
+            text_splitter=args.splitter,
+        )
+    start = time.perf_counter()
+    stats = rag_system.ingest_document(
+            args.path,
+            batch_size=args.batch_size,
+            read_size=args.read_size,
+            on_progress=print_progress,
+            resume=not args.restart,
+        )
+    elapsed = time.perf_counter() - start
+    resumed = f", resumed after {stats['resumed_from']} chunks" if stats["resumed_from"] else ""
+    print(f"\ndone in {elapsed:.1f}s{resumed}")
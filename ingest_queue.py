@@ -0,0 +1,226 @@
+from typing import List, Dict, Optional, Callable
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from session_log import SessionLogReader
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class IngestQueue:
+    """
+    Durable job queue for conversation ingestion, stored in SQLite next to the vector store (<db_path>/ingest_queue.sqlite3).
+    Claiming a job takes a lease of `lease_seconds` that the worker keeps renewing while it runs; a 'running' job whose
+    lease ran out (its worker crashed or was killed) can be claimed again, by this process or any other on the same db.
+    """
+    def __init__(
+            self,
+            db_path: str,
+            max_attempts: int = 3,
+            retry_backoff: float = 30.0,
+            lease_seconds: float = 120.0,
+        ):
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff          # seconds, doubled after every failed attempt
+        self.lease_seconds = lease_seconds
+
+        os.makedirs(db_path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(db_path, "ingest_queue.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, status TEXT NOT NULL DEFAULT 'pending', "
+                "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, next_attempt_at REAL NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        if "claimed_at" not in {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN claimed_at REAL")   # queues from before leases
+        self._conn.commit()
+
+    def enqueue(
+            self,
+            conversation: List[Dict],
+        ) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                    "INSERT INTO jobs (payload, created_at, updated_at) VALUES (?, ?, ?)",
+                    (json.dumps(conversation), now, now)
+                )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def enqueue_log(self, log_path: str) -> int:
+        """ Queues a session log (session_log.py) by path, its messages are read when the job runs """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                    "INSERT INTO jobs (payload, created_at, updated_at) VALUES (?, ?, ?)",
+                    (json.dumps({"session_log": log_path}), now, now)
+                )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def claim(self) -> Optional[Dict]:
+        """ Marks the oldest ready job (or one whose lease expired) as running and returns it, None when nothing is due """
+        ready = "((status='pending' AND next_attempt_at <= ?) OR (status='running' AND COALESCE(claimed_at, 0) < ?))"
+        with self._lock:
+            while True:
+                now = time.time()
+                row = self._conn.execute(
+                        f"SELECT id, payload, attempts FROM jobs WHERE {ready} ORDER BY id LIMIT 1",
+                        (now, now - self.lease_seconds)
+                    ).fetchone()
+                if row is None:
+                    return None
+                # another process on the same db may have claimed it since the select, only one update wins
+                claimed = self._conn.execute(
+                        f"UPDATE jobs SET status='running', claimed_at=?, updated_at=? WHERE id=? AND {ready}",
+                        (now, now, row[0], now, now - self.lease_seconds)
+                    ).rowcount
+                self._conn.commit()
+                if claimed:
+                    break
+        payload = json.loads(row[1])
+        if isinstance(payload, dict) and "session_log" in payload:
+            try:
+                conversation = SessionLogReader(payload["session_log"]).messages()
+            except OSError:
+                conversation = []               # log deleted since, nothing left to ingest
+        else:
+            conversation = payload
+        return {"id": row[0], "conversation": conversation, "attempts": row[2]}
+
+    def renew(self, job_id: int):
+        """ Extends the lease of a running job """
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET claimed_at=? WHERE id=? AND status='running'", (time.time(), job_id))
+            self._conn.commit()
+
+    def complete(self, job_id: int):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status='done', last_error=NULL, updated_at=? WHERE id=?", (time.time(), job_id))
+            self._conn.commit()
+
+    def fail(
+            self,
+            job_id: int,
+            error: str,
+        ) -> bool:
+        """ Records a failed attempt, returns True if the job will be retried """
+        now = time.time()
+        with self._lock:
+            attempts = self._conn.execute("SELECT attempts FROM jobs WHERE id=?", (job_id,)).fetchone()[0] + 1
+            retry = attempts < self.max_attempts
+            self._conn.execute(
+                    "UPDATE jobs SET status=?, attempts=?, last_error=?, next_attempt_at=?, updated_at=? WHERE id=?",
+                    ("pending" if retry else "failed", attempts, error, now + self.retry_backoff * 2 ** (attempts - 1), now, job_id)
+                )
+            self._conn.commit()
+        return retry
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"pending": 0, "running": 0, "done": 0, "failed": 0, **dict(rows)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class IngestWorker(threading.Thread):
+    """
+    Background thread that drains an `IngestQueue` through `rag_system.injest_data`.
+    `on_progress` receives a dict per job event (started / done / retry / failed) plus the queue counts.
+    """
+    def __init__(
+            self,
+            queue: IngestQueue,
+            rag_system,
+            on_progress: Callable[[Dict], None] = None,
+            poll_interval: float = 5.0,
+        ):
+        super().__init__(name="ingest-worker", daemon=True)    # never keeps the app alive, unfinished jobs resume next start
+        self.queue = queue
+        self.rag_system = rag_system
+        self.on_progress = on_progress
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def _report(self, event: Dict):
+        if self.on_progress:
+            try:
+                self.on_progress({**event, **self.queue.counts()})
+            except Exception:
+                pass
+
+    def process_one(self) -> bool:
+        """ Runs a single due job, returns False if there was nothing to do """
+        job = self.queue.claim()
+        if job is None:
+            return False
+
+        self._report({"job": job["id"], "status": "started"})
+        if not job["conversation"]:
+            self.queue.complete(job["id"])
+            self._report({"job": job["id"], "status": "done", "stats": {"ingested": 0}})
+            return True
+
+        # keeps the lease alive for as long as the ingestion takes, so no other queue hands the job out again
+        finished = threading.Event()
+        def heartbeat():
+            while not finished.wait(self.queue.lease_seconds / 3):
+                self.queue.renew(job["id"])
+        threading.Thread(target=heartbeat, name=f"ingest-lease-{job['id']}", daemon=True).start()
+        try:
+            _, stats = self.rag_system.injest_data(job["conversation"], ret="ids", with_stats=True)
+        except Exception as e:
+            retry = self.queue.fail(job["id"], "".join(traceback.format_exception_only(type(e), e)).strip())
+            self._report({"job": job["id"], "status": "retry" if retry else "failed", "error": str(e)})
+        else:
+            self.queue.complete(job["id"])
+            self._report({"job": job["id"], "status": "done", "stats": stats})
+        finally:
+            finished.set()
+        return True
+
+    def notify(self):
+        """ Wakes the worker up, e.g. right after enqueueing """
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            if not self.process_one():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    from rag import UserRAG
+
+    parser = argparse.ArgumentParser(description="Drain the pending ingestion jobs of a database")
+    parser.add_argument("db_path", help="e.g. ./private/chroma_db[main]")
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--embedding-model", default="embeddinggemma:300m")
+    args = parser.parse_args()
+
+    worker = IngestWorker(
+            IngestQueue(args.db_path),
+            UserRAG(model_name=args.model, embedding_model_name=args.embedding_model, db_path=args.db_path, text_splitter="nothing yet"),
+            on_progress=print,
+        )
+    while worker.process_one():
+        pass
+    print(worker.queue.counts())
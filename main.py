@@ -9,10 +9,21 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.agents.middleware import ModelRequest, ModelResponse, wrap_model_call
 
 from pydantic import BaseModel, Field
+import requests
 from typing import List
+import os
 
 from rag import UserRAG
-from prompt_gallery import system_prompt, retriever_desc
+from rag_service import SERVICE_ENV, RemoteUserRAG
+from ingest_queue import IngestQueue, IngestWorker
+from context_manager import ConversationContext
+from tracing import tracer, format_breakdown
+from tracing_callbacks import TracingCallback
+from ollama_pool import pool
+from prefetch import MemoryPrefetcher
+from session_log import SessionLogReader, open_session_log
+from prompt_gallery import system_prompt, retriever_desc, web_search_desc
+from search.searxng_client import SearxngClient, format_results
 
 # ------------------------------------------------------------------------------------------------------------------------------- #
 
@@ -20,53 +31,114 @@ query_model = "llama3.1"
 embedding_model = "embeddinggemma:300m"
 vector_db_path = "./private/chroma_db[main]"
 text_splitter = "nothing yet"
+prefetch_memory = False         # start retrieving on the raw message while the chat model decides whether to call the tool
+max_loaded_models = 1           # models the ollama host keeps loaded at once, requests are grouped by model to avoid swaps
 
 # ------------------------------------------------------------------------------------------------------------------------------- #
 
-rag_system = UserRAG(
-        model_name=query_model,
-        embedding_model_name=embedding_model,
-        db_path=vector_db_path,
-        text_splitter=text_splitter,
-    )
+# per-stage spans go to a rolling jsonl + prometheus textfile, each turn's breakdown is printed after the reply
+tracer.configure(jsonl_path="./private/traces.jsonl", prom_path="./private/metrics.prom")
+tracer.on_turn_end.append(lambda breakdown: print(f"[latency] {format_breakdown(breakdown)}\n"))
+callbacks = [TracingCallback(tracer, chat_model_name="gpt-oss:20b")]
+
+# every ollama client shares one connection pool; queued calls are grouped by model and the chat model streams one at a time
+pool.configure(max_loaded=max_loaded_models, limits={"gpt-oss:20b": 1, query_model: 4, embedding_model: 2})
+
+# with RECHAT_RAG_SERVICE set (e.g. unix:///tmp/rechat-rag.sock) retrieval and ingestion go to a shared rag_service.py,
+# which serves the stores under ./private/ for everyone on the box; otherwise this process opens the store itself
+if os.getenv(SERVICE_ENV):
+    rag_system = RemoteUserRAG(os.path.basename(vector_db_path), os.getenv(SERVICE_ENV), db_path=vector_db_path)
+else:
+    rag_system = UserRAG(
+            model_name=query_model,
+            embedding_model_name=embedding_model,
+            db_path=vector_db_path,
+            text_splitter=text_splitter,
+        )
+
+# drains conversations queued by earlier runs while this one is in use
+ingest_queue = IngestQueue(vector_db_path)
+ingest_worker = IngestWorker(ingest_queue, rag_system, on_progress=lambda event: print(f"[ingest] {event}"))
+ingest_worker.start()
+
+prefetcher = MemoryPrefetcher(rag_system, k=1) if prefetch_memory else None
 
 @tool("user_data_retriever", description=retriever_desc)
 def get_user_data(user_query: str) -> List[str]:
+    if prefetcher:
+        return prefetcher.get(user_query, k=1)
     data_list = rag_system.retrieve_data(query=user_query, k=1)
     return data_list
 
+# pooled session + on-disk cache, repeated searches within the hour don't hit SearxNG again
+search_client = SearxngClient()
+
+@tool("web_search", description=web_search_desc)
+def web_search(search_query: str) -> str:
+    try:
+        return format_results(search_client.search_and_read(search_query, max_results=3))
+    except requests.RequestException:
+        return "Web search unavailable right now (the search service could not be reached)."
+
 
 chat_agent = create_agent(
-        model=ChatOllama(model="gpt-oss:20b"),
+        model=ChatOllama(model="gpt-oss:20b", **pool.client_kwargs()),
         system_prompt=system_prompt,
-        tools=[get_user_data],
+        tools=[get_user_data, web_search],
 )
 
 # ------------------------------------------------------------------------------------------------------------------------------- #
 
-conversation = []
+# the agent only sees a token-bounded window, the full transcript is kept for ingestion
+conversation = ConversationContext(ChatOllama(model=query_model, **pool.client_kwargs()))
+
+# every turn is appended to <db>/sessions/*.jsonl right away; a session that was cut short continues from its tail
+session_log, _ = open_session_log(vector_db_path)
+if session_log.count:
+    for message in SessionLogReader(session_log.path).tail(40)[0]:
+        conversation.append(message["role"], message["content"])
+    print(f"[resumed the last session, {session_log.count} messages]")
 
 while True:
     user_query = input("You: ")
     if user_query == "xx":
         break 
-    conversation.append({"role": "user", "content": user_query})
-
-    for chunk in chat_agent.stream({"messages": conversation}, stream_mode="updates"):
-        for step, data in chunk.items():
-            last_content_block = data['messages'][-1].content_blocks
-
-            # Checking if the message is to the user or not
-            if step == "model" and last_content_block[-1]["type"] == "text":    # last_content_block is a list - batch ig - so 1 
-                model_response = last_content_block[-1]["text"]
-                print(f"Model Response: {model_response}\n")
-                conversation.append({"role": "assistant", "content": model_response}) 
-            else:
-                print(f"step: {step}")
-                print(f"content: {data['messages'][-1].content_blocks}\n")
+    conversation.append("user", user_query)
+    session_log.append("user", user_query)
+
+    with tracer.turn(chars=len(user_query)):
+        if prefetcher:
+            prefetcher.start(user_query)
+        for chunk in chat_agent.stream({"messages": conversation.window()}, stream_mode="updates", config={"callbacks": callbacks}):
+            for step, data in chunk.items():
+                last_content_block = data['messages'][-1].content_blocks
+
+                # Checking if the message is to the user or not
+                if step == "model" and last_content_block[-1]["type"] == "text":    # last_content_block is a list - batch ig - so 1 
+                    model_response = last_content_block[-1]["text"]
+                    print(f"Model Response: {model_response}\n")
+                    conversation.append("assistant", model_response)
+                    session_log.append("assistant", model_response)
+                else:
+                    print(f"step: {step}")
+                    print(f"content: {data['messages'][-1].content_blocks}\n")
+
+    with tracer.span("fold"):
+        conversation.maybe_fold()
+
+if prefetcher:
+    print(f"[{prefetcher.summary()}]")
+    prefetcher.close()
+print(f"[{pool.scheduler.summary()}]")
 
 # ------------------------------------------------------------------------------------------------------------------------------- #
 
 if input("Do we injest the convo(y/n): ") == "y":
-    rag_system.injest_data(conversation)
+    # the job points at the session log, the worker reads the conversation from there
+    job_id = ingest_queue.enqueue_log(session_log.path)
+    session_log.close(ingest_job=job_id)
+    print(f"Queued as ingestion job #{job_id}, it is processed in the background on the next run "
+          f"(or now with `python ingest_queue.py \"{vector_db_path}\"`)")
+else:
+    session_log.close()
 
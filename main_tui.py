@@ -1,20 +1,29 @@
+import time
+STARTUP_T0 = time.perf_counter()  # Everything in the startup report is measured from here
+
 from textual.app import App, ComposeResult
-from textual.containers import VerticalScroll, Horizontal, Vertical
-from textual.widgets import Header, Footer, Input, Static, Button, Label, ListView, ListItem
+from textual.containers import Horizontal, Vertical
+from textual.widgets import Header, Footer, Input, Static, Button, Label, ListView, ListItem, SelectionList
 from textual.screen import Screen, ModalScreen
 from textual import work, on
 from textual.message import Message
 
+import asyncio
 import os
-from langchain_ollama import ChatOllama
-from langchain.agents import create_agent
-from langchain.tools import tool
+import threading
+from concurrent.futures import Future
 from typing import List
 
 # Import your custom modules
 # Assuming rag.py and prompt_gallery.py are in the same folder
-from rag import UserRAG
-from prompt_gallery import system_prompt, retriever_desc
+# langchain, chroma and rag are heavy to import, they are only pulled in by the background workers below
+from ingest_queue import IngestQueue
+from session_log import SessionLog, SessionLogReader
+from session_manager import ChatSession, SessionPool, FederatedRetriever
+from prompt_gallery import system_prompt, retriever_desc, web_search_desc
+from startup_profile import StartupTimer
+from tracing import tracer, format_breakdown
+from chat_log import ChatLog
 
 # --- CSS Styles for the TUI ---
 CSS = """
@@ -39,33 +48,31 @@ Screen {
     scrollbar-size: 1 1;
 }
 
+#status-bar {
+    height: 1;
+    color: $text-muted;
+    padding: 0 1;
+}
+
 #input-container {
     height: auto;
     dock: bottom;
     padding: 0 1 1 1;
 }
 
-/* Message Bubbles */
-.message {
-    padding: 1 2;
-    margin: 1 1;
-    width: auto;
-    max-width: 80%;
+/* Database switch / federation pickers */
+#picker-dialog {
+    width: 60;
     height: auto;
-    border: wide $background;
-}
-
-.user-message {
-    dock: right;
-    background: $primary-darken-2;
-    color: white;
-    text-align: right;
+    max-height: 80%;
+    border: thick $background 80%;
+    background: $surface;
+    padding: 1 2;
 }
 
-.assistant-message {
-    dock: left;
-    background: $surface-lighten-1;
-    color: $text;
+#picker-dialog ListView, #picker-dialog SelectionList {
+    height: auto;
+    max-height: 20;
 }
 
 /* Ingest Modal */
@@ -96,17 +103,33 @@ Button {
 }
 """
 
+# Upper bound on bubble redraws per second while a reply streams in
+STREAM_FPS = 20
+
+QUERY_MODEL = "llama3.1"
+EMBEDDING_MODEL = "embeddinggemma:300m"
+CHAT_MODEL = "gpt-oss:20b"
+KEEP_ALIVE = 30 * 60  # Seconds Ollama keeps each model loaded after its last call
+STARTUP_LOG = "./private/startup_times.jsonl"
+TRACE_LOG = "./private/traces.jsonl"  # Rolling span log, one line per span
+METRICS_FILE = "./private/metrics.prom"  # Prometheus textfile with per-stage counters and histograms
+DB_DIR = "./private/"
+SESSION_POOL_SIZE = 3  # Opened databases kept warm for instant switching
+RESUME_TAIL = 40  # Messages loaded when a session that was cut short is picked up again, older ones page in on scroll
+HISTORY_PAGE = 50  # Messages paged in per scroll to the top
+PREFETCH_MEMORY = False  # Start retrieving on the raw message while the chat model decides whether to call the tool
+MAX_LOADED_MODELS = 1  # Models the Ollama host keeps loaded at once; queued calls are grouped by model so they don't swap
+MODEL_CONCURRENCY = {CHAT_MODEL: 1, QUERY_MODEL: 4, EMBEDDING_MODEL: 2}  # Requests in flight per model
+RAG_SERVICE = os.getenv("RECHAT_RAG_SERVICE")  # e.g. unix:///tmp/rechat-rag.sock: use a shared rag_service.py serving DB_DIR instead of opening the stores here
+
 # --- Global / Shared State Wrapper ---
 class GlobalState:
+    session = None  # ChatSession of the active database
     rag_system = None
     chat_agent = None
-    messages = []  # Stores the conversation history for ingestion
-
-# --- Custom Widgets ---
-
-class ChatBubble(Static):
-    """A widget to display a single chat message."""
-    pass
+    ingest_queue = None
+    ingest_worker = None
+    context = None  # ConversationContext: bounded window for the agent, full transcript for ingestion
 
 class DBSelectionScreen(Screen):
     """Screen to select the database at startup."""
@@ -117,12 +140,7 @@ class DBSelectionScreen(Screen):
             yield Label("Select a Database:", classes="header")
             
             # Scan directory
-            db_dir_path = "./private/"
-            items = []
-            if os.path.exists(db_dir_path):
-                dirs = [d for d in os.listdir(db_dir_path) if os.path.isdir(os.path.join(db_dir_path, d))]
-                for d in dirs:
-                    items.append(ListItem(Label(d), name=d))
+            items = [ListItem(Label(d), name=d) for d in list_databases()]
             
             if not items:
                 yield Label("No databases found in ./private/", style="red")
@@ -130,43 +148,153 @@ class DBSelectionScreen(Screen):
                 yield ListView(*items, id="db-list")
         yield Footer()
 
-    def on_list_view_selected(self, event: ListView.Selected):
+    def on_mount(self):
+        self.app.startup.mark("db_list_shown")
+        self.app.start_warm_up()
+        db_list = self.query(ListView)
+        if db_list and db_list.first().highlighted_child is not None:
+            self.app.prepare_session(db_list.first().highlighted_child.name)
+
+    def on_list_view_highlighted(self, event: ListView.Highlighted):
+        # Start opening whatever is highlighted, it is most likely the one that gets picked
+        if event.item is not None:
+            self.app.prepare_session(event.item.name)
+
+    async def on_list_view_selected(self, event: ListView.Selected):
         chosen_db = event.item.name
-        self.initialize_rag(chosen_db)
-        
-    def initialize_rag(self, chosen_db):
-        query_model = "llama3.1"
-        embedding_model = "embeddinggemma:300m"
-        vector_db_path = f"./private/{chosen_db}"
-        text_splitter = "nothing yet"
-
-        # Initialize the UserRAG system
-        rag_instance = UserRAG(
-            model_name=query_model,
-            embedding_model_name=embedding_model,
-            db_path=vector_db_path,
-            text_splitter=text_splitter,
-        )
-
-        # Define the tool (re-wrapped to access the specific instance)
-        @tool("user_data_retriever", description=retriever_desc)
-        def get_user_data(user_query: str) -> List[str]:
-            data_list = rag_instance.retrieve_data(query=user_query, k=1)
-            return data_list
+        self.app.startup.mark("db_selected")
+        self.notify(f"Opening {chosen_db}...")
+        session = await self.app.open_session(chosen_db)
+        if session is None:
+            return
+        self.app.activate_session(session)
 
-        # Create the agent
-        agent = create_agent(
-            model=ChatOllama(model="gpt-oss:20b"),
+        # Switch to the main chat screen
+        self.app.push_screen(ChatScreen())
+        self.app.startup.mark("chat_ready")
+        self.app.report_startup()
+
+def list_databases():
+    """Every directory under ./private/ is a memory database."""
+    if not os.path.exists(DB_DIR):
+        return []
+    return sorted(d for d in os.listdir(DB_DIR) if os.path.isdir(os.path.join(DB_DIR, d)))
+
+_search_client = None
+_search_client_lock = threading.Lock()
+
+def get_search_client():
+    """One SearxngClient (pooled connections, on-disk cache) shared by every session, created on first use."""
+    global _search_client
+    with _search_client_lock:
+        if _search_client is None:
+            from search.searxng_client import SearxngClient     # pulls in requests, kept out of startup
+            _search_client = SearxngClient()
+        return _search_client
+
+_ollama_pool = None
+_ollama_pool_lock = threading.Lock()
+
+def get_ollama_pool():
+    """The shared Ollama clients and their model scheduler, configured on first use."""
+    global _ollama_pool
+    with _ollama_pool_lock:
+        if _ollama_pool is None:
+            from ollama_pool import pool
+            _ollama_pool = pool.configure(keep_alive=KEEP_ALIVE, max_loaded=MAX_LOADED_MODELS, limits=MODEL_CONCURRENCY)
+        return _ollama_pool
+
+def build_session(chosen_db, startup):
+    """Opens the vector store and builds the agents for a database. Runs in a background thread."""
+    with startup.phase("import_langchain"):
+        from langchain_ollama import ChatOllama
+        from langchain.agents import create_agent
+        from langchain.tools import tool
+        from rag import UserRAG
+        from context_manager import ConversationContext
+        ollama_pool = get_ollama_pool()
+
+    vector_db_path = os.path.join(DB_DIR, chosen_db)
+    text_splitter = "nothing yet"
+
+    # Initialize the UserRAG system
+    with startup.phase(f"open_db[{chosen_db}]"):
+        if RAG_SERVICE:
+            from rag_service import RemoteUserRAG
+            rag_instance = RemoteUserRAG(chosen_db, RAG_SERVICE, db_path=vector_db_path)
+        else:
+            rag_instance = UserRAG(
+                model_name=QUERY_MODEL,
+                embedding_model_name=EMBEDDING_MODEL,
+                db_path=vector_db_path,
+                text_splitter=text_splitter,
+                keep_alive=KEEP_ALIVE,
+            )
+
+    context = ConversationContext(ChatOllama(model=QUERY_MODEL, keep_alive=KEEP_ALIVE, **ollama_pool.client_kwargs()))
+    session = ChatSession(chosen_db, vector_db_path, rag_instance, context=context)
+    if PREFETCH_MEMORY:
+        from prefetch import MemoryPrefetcher
+        session.prefetcher = MemoryPrefetcher(session.retriever, k=1)
+
+    # Define the tool (re-wrapped to access the specific instance)
+    # async, so the agent can run on Textual's event loop instead of blocking a worker thread;
+    # it searches session.retriever, so federating more stores later needs no new agent
+    @tool("user_data_retriever", description=retriever_desc)
+    async def get_user_data(user_query: str) -> List[str]:
+        if session.prefetcher:
+            return await session.prefetcher.aget(user_query, k=1)
+        data_list = await session.retriever.aretrieve_data(query=user_query, k=1)
+        return data_list
+
+    @tool("web_search", description=web_search_desc)
+    async def web_search(search_query: str) -> str:
+        import requests
+        from search.searxng_client import format_results
+        try:
+            results = await get_search_client().asearch_and_read(search_query, max_results=3)
+        except requests.RequestException:
+            return "Web search unavailable right now (the search service could not be reached)."
+        return format_results(results)
+
+    # Create the agent
+    with startup.phase("build_agent"):
+        session.chat_agent = create_agent(
+            model=ChatOllama(model=CHAT_MODEL, keep_alive=KEEP_ALIVE, **ollama_pool.client_kwargs()),
             system_prompt=system_prompt,
-            tools=[get_user_data],
+            tools=[get_user_data, web_search],
         )
+    return session
 
-        # Save to global state
-        GlobalState.rag_system = rag_instance
-        GlobalState.chat_agent = agent
-        
-        # Switch to the main chat screen
-        self.app.push_screen(ChatScreen())
+def run_in_background(fn, *args) -> Future:
+    """Runs fn on a daemon thread, so a slow model load never holds up app exit."""
+    future = Future()
+
+    def runner():
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=runner, daemon=True).start()
+    return future
+
+def warm_up_models(startup):
+    """Loads the models into Ollama ahead of the first message. Runs in a background thread."""
+    client = get_ollama_pool().client()
+    # only as many as the host keeps loaded, warming more would just evict the first ones again
+    models = [EMBEDDING_MODEL, QUERY_MODEL, CHAT_MODEL][-MAX_LOADED_MODELS:]
+    try:
+        if EMBEDDING_MODEL in models:
+            with startup.phase(f"warm[{EMBEDDING_MODEL}]"):
+                client.embed(model=EMBEDDING_MODEL, input="warm up", keep_alive=KEEP_ALIVE)
+        # an empty prompt only loads the model, nothing is generated
+        for model in (QUERY_MODEL, CHAT_MODEL):
+            if model in models:
+                with startup.phase(f"warm[{model}]"):
+                    client.generate(model=model, prompt="", keep_alive=KEEP_ALIVE)
+    except Exception:
+        pass  # Ollama being down shows up on the first real call, warm-up is best effort
 
 class IngestModal(ModalScreen):
     """Modal to ask for ingestion."""
@@ -184,14 +312,136 @@ class IngestModal(ModalScreen):
         else:
             self.dismiss(False)
 
+class SwitchDBModal(ModalScreen):
+    """Picks the database to chat with next; already opened ones (marked ●) switch instantly."""
+
+    BINDINGS = [("escape", "dismiss", "Cancel")]
+
+    def compose(self) -> ComposeResult:
+        current = GlobalState.session.db_name if GlobalState.session else None
+        with Vertical(id="picker-dialog"):
+            yield Label("Switch to database:")
+            yield ListView(*[
+                ListItem(Label(f"{'●' if d in self.app.sessions else ' '} {d}{'  (current)' if d == current else ''}"), name=d)
+                for d in list_databases()
+            ])
+
+    def on_list_view_selected(self, event: ListView.Selected):
+        self.dismiss(event.item.name)
+
+class FederateModal(ModalScreen):
+    """Picks other databases whose memories the assistant searches along with the current one."""
+
+    BINDINGS = [("escape", "dismiss", "Cancel")]
+
+    def compose(self) -> ComposeResult:
+        session = GlobalState.session
+        others = [d for d in list_databases() if d != session.db_name]
+        with Vertical(id="picker-dialog"):
+            yield Label(f"Also search these databases from {session.db_name}:")
+            yield SelectionList(*[(d, d, d in session.federated_with) for d in others])
+            with Horizontal(id="ingest-buttons"):
+                yield Button("Apply", variant="success", id="btn-apply")
+                yield Button("Cancel", variant="error", id="btn-cancel")
+
+    def on_button_pressed(self, event: Button.Pressed):
+        if event.button.id == "btn-apply":
+            self.dismiss(list(self.query_one(SelectionList).selected))
+        else:
+            self.dismiss(None)
+
 class ChatScreen(Screen):
     """The main chat interface."""
+
+    BINDINGS = [
+        ("ctrl+o", "switch_db", "Switch DB"),
+        ("ctrl+f", "federate", "Search other DBs"),
+    ]
     
     def compose(self) -> ComposeResult:
         yield Header()
-        yield VerticalScroll(id="chat-container")
+        yield ChatLog(id="chat-container")
         with Vertical(id="input-container"):
+            yield Static("", id="status-bar")
             yield Input(placeholder="Type your message... (type 'xx' to exit)")
+        yield Footer()
+
+    async def on_mount(self):
+        tracer.on_turn_end.append(self.show_turn_breakdown)
+        session = GlobalState.session
+        self.title = f"Re-Chat · {session.db_name}" if session else "Re-Chat"
+        self.show_federation()
+        self.query_one(Input).focus()
+
+        # Coming back to an already opened (or resumed) database: show where its conversation left off
+        self.history_cursor = session.history_start if session else 0
+        if session and session.context.transcript:
+            self.query_one(ChatLog).add_messages(
+                (message["content"], message["role"] == "user") for message in session.context.transcript
+            )
+
+    def on_chat_log_near_top(self, event: ChatLog.NearTop):
+        """Pages older messages of a resumed session in from its log."""
+        session = GlobalState.session
+        if session is None or self.history_cursor <= 0:
+            return
+        messages, self.history_cursor = session.older_messages(self.history_cursor, HISTORY_PAGE)
+        self.query_one(ChatLog).prepend_messages([(message["content"], message["role"] == "user") for message in messages])
+
+    def show_federation(self):
+        session = GlobalState.session
+        self.sub_title = f"+ {', '.join(session.federated_with)}" if session and session.federated_with else ""
+
+    def action_switch_db(self):
+        async def switch(chosen_db):
+            if not chosen_db or chosen_db == GlobalState.session.db_name:
+                return
+            self.notify(f"Opening {chosen_db}..." if chosen_db not in self.app.sessions else f"Switching to {chosen_db}")
+            session = await self.app.open_session(chosen_db)
+            if session is not None:
+                self.app.activate_session(session)
+                self.app.switch_screen(ChatScreen())
+
+        self.app.push_screen(SwitchDBModal(), switch)
+
+    def action_federate(self):
+        async def federate(chosen_dbs):
+            if chosen_dbs is None:
+                return
+            session = GlobalState.session
+            stores = {session.db_name: session.rag_system}
+            # pinned before opening, or opening the third one could evict (and close) one already in `stores`
+            self.app.sessions.pinned |= {session.db_name, *chosen_dbs}
+            for db_name in chosen_dbs:
+                other = await self.app.open_session(db_name)
+                if other is not None:
+                    stores[db_name] = other.rag_system
+
+            session.federated_with = [db_name for db_name in stores if db_name != session.db_name]
+            if not session.federated_with:
+                session.set_retriever(session.rag_system)
+            elif RAG_SERVICE:
+                session.set_retriever(session.rag_system.federated(list(stores)))   # merged on the service
+            else:
+                session.set_retriever(FederatedRetriever(session.rag_system, stores))
+            self.app.update_pins()
+            self.show_federation()
+            self.notify(f"Searching {', '.join(stores)}")
+
+        self.app.push_screen(FederateModal(), federate)
+
+    def on_unmount(self):
+        if self.show_turn_breakdown in tracer.on_turn_end:
+            tracer.on_turn_end.remove(self.show_turn_breakdown)
+
+    def show_turn_breakdown(self, breakdown):
+        """Compact per-stage latency of the last turn, e.g. 'turn 6.21s │ chat_model 5.10s · decompose 0.80s'."""
+        status = format_breakdown(breakdown)
+        prefetcher = GlobalState.session.prefetcher if GlobalState.session else None
+        if prefetcher:
+            status += f" │ {prefetcher.summary()}"
+        status += f" │ {get_ollama_pool().scheduler.summary()}"
+        self.query_one("#status-bar", Static).update(status)
 
     async def on_input_submitted(self, event: Input.Submitted):
         user_query = event.value
@@ -209,75 +459,99 @@ class ChatScreen(Screen):
         await self.add_message(user_query, is_user=True)
         
         # Add User Message to History
-        GlobalState.messages.append({"role": "user", "content": user_query})
+        GlobalState.session.record("user", user_query)
 
         # Create a placeholder for the assistant's response
         assistant_bubble = await self.add_message("Thinking...", is_user=False)
         
-        # Run the agent in a background thread
+        # Stream the reply in an async worker on the event loop, the input stays responsive meanwhile
         self.stream_agent_response(user_query, assistant_bubble)
 
     async def add_message(self, text, is_user):
-        container = self.query_one("#chat-container")
-        bubble = ChatBubble(text)
-        bubble.add_class("message")
-        bubble.add_class("user-message" if is_user else "assistant-message")
-        await container.mount(bubble)
-        container.scroll_end(animate=False)
-        return bubble
-
-    # --- FIX START ---
-    # Removed 'async'. This forces Textual to run it in a separate thread.
-    @work(exclusive=True, thread=True)
-    def stream_agent_response(self, user_query, bubble_widget):
-        """Runs the LangChain agent loop in a thread to avoid freezing UI."""
+        # Only the visible part of the history is rendered, no widget per message
+        return self.query_one(ChatLog).add_message(text, is_user)
+
+    @work(exclusive=True)
+    async def stream_agent_response(self, user_query, bubble_widget):
+        """Streams the reply token by token; the bubble is redrawn at most STREAM_FPS times a second."""
         
         full_response = ""
-        first_token_received = False
+        current_message_id = None
+        token_count = 0
+        dirty = False
+        started_at = time.perf_counter()
+        first_token_at = None
 
         # Access the agent from global state
         chat_agent = GlobalState.chat_agent
-        messages = GlobalState.messages 
-
+        messages = GlobalState.context.window()
+
+        from langchain_core.messages import AIMessageChunk
+        from tracing_callbacks import TracingCallback
+
+        def flush():
+            nonlocal dirty
+            if dirty:
+                bubble_widget.update(full_response)
+                dirty = False
+
+        flush_timer = self.set_interval(1 / STREAM_FPS, flush)
+        callbacks = [TracingCallback(tracer, chat_model_name=CHAT_MODEL)]
+        with tracer.turn(chars=len(user_query)):
+            # Speculative memory lookup on the raw message, runs while the model takes its first step
+            if GlobalState.session.prefetcher:
+                GlobalState.session.prefetcher.astart(user_query)
+            try:
+                async for message_chunk, metadata in chat_agent.astream(
+                    {"messages": messages}, stream_mode="messages", config={"callbacks": callbacks}
+                ):
+                    if metadata.get("langgraph_node") != "model" or not isinstance(message_chunk, AIMessageChunk):
+                        continue
+                    delta = message_chunk.text
+                    if not delta:
+                        continue
+
+                    # A new model step (e.g. after a tool call) starts a new message, only the last one is the reply
+                    if message_chunk.id != current_message_id:
+                        current_message_id = message_chunk.id
+                        full_response = ""
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+
+                    full_response += delta
+                    token_count += 1
+                    dirty = True
+
+                flush_timer.stop()
+                if full_response:
+                    dirty = True
+                    flush()
+                    GlobalState.session.record("assistant", full_response)
+
+                    generation_time = max(time.perf_counter() - first_token_at, 1e-6)
+                    tracer.annotate(ttft=round(first_token_at - started_at, 4), tokens=token_count)
+                    bubble_widget.border_subtitle = (
+                        f"ttft {first_token_at - started_at:.2f}s · {token_count / generation_time:.1f} tok/s"
+                    )
+                else:
+                    bubble_widget.update("No text response generated (Tool used).")
+
+            except Exception as e:
+                bubble_widget.update(f"Error: {str(e)}")
+            finally:
+                flush_timer.stop()
+
+        # Fold old turns into the rolling summary now, so the next turn starts within the token budget
         try:
-            # This is a blocking generator, so it MUST run in a thread (not async)
-            for chunk in chat_agent.stream({"messages": messages}, stream_mode="updates"):
-                for step, data in chunk.items():
-                    last_content_block = data['messages'][-1].content_blocks
-                    
-                    if step == "model" and last_content_block[-1]["type"] == "text":
-                        model_chunk = last_content_block[-1]["text"]
-                        
-                        if not first_token_received:
-                            # Safely update UI from thread
-                            self.app.call_from_thread(bubble_widget.update, "")
-                            first_token_received = True
-                        
-                        full_response = model_chunk 
-                        self.app.call_from_thread(bubble_widget.update, full_response)
-                        
-                    else:
-                        pass
-
-            if full_response:
-                GlobalState.messages.append({"role": "assistant", "content": full_response})
-            else:
-                if not first_token_received:
-                     self.app.call_from_thread(bubble_widget.update, "No text response generated (Tool used).")
-
+            with tracer.span("fold"):
+                await GlobalState.context.amaybe_fold()
         except Exception as e:
-            self.app.call_from_thread(bubble_widget.update, f"Error: {str(e)}")
-    # --- FIX END ---
+            self.notify(f"Could not summarize older turns: {e}", severity="warning")
 
     def trigger_exit_sequence(self):
         def check_ingest(should_ingest: bool):
-            if should_ingest:
-                if GlobalState.rag_system:
-                    try:
-                        self.notify("Ingesting data...")
-                        GlobalState.rag_system.injest_data(GlobalState.messages)
-                    except Exception as e:
-                        pass 
+            # Only queue the job here, the worker ingests it in the background (or on the next start)
+            self.app.end_sessions(ingest=should_ingest)
             self.app.exit()
 
         self.app.push_screen(IngestModal(), check_ingest)
@@ -286,9 +560,130 @@ class ChatScreen(Screen):
 class RagTuiApp(App):
     CSS = CSS
 
+    def __init__(self):
+        super().__init__()
+        self.startup = StartupTimer(started_at=STARTUP_T0)
+        tracer.configure(jsonl_path=TRACE_LOG, prom_path=METRICS_FILE)
+        self.sessions = SessionPool(
+            lambda chosen_db: run_in_background(build_session, chosen_db, self.startup),
+            capacity=SESSION_POOL_SIZE,
+            on_evict=self.park_log,
+        )
+        self.parked_logs = []  # (db_path, session log path) of sessions closed by the pool, ended at exit
+        self.warm_up_future = None
+
     def on_mount(self):
+        self.startup.mark("app_mounted")
         self.push_screen(DBSelectionScreen())
 
+    def start_warm_up(self):
+        if self.warm_up_future is None:
+            self.warm_up_future = run_in_background(warm_up_models, self.startup)
+
+    def prepare_session(self, chosen_db) -> Future:
+        """Starts opening a database in the background (once, while it stays in the pool) and returns its future."""
+        return self.sessions.get(chosen_db)
+
+    async def open_session(self, chosen_db):
+        """Waits for the database to be opened, None (after telling the user) if that failed."""
+        try:
+            return await asyncio.wrap_future(self.prepare_session(chosen_db))
+        except Exception as e:
+            self.sessions.discard(chosen_db)
+            self.notify(f"Could not open {chosen_db}: {e}", severity="error")
+            return None
+
+    def activate_session(self, session):
+        """Makes the session the one the chat screen talks to."""
+        # Background ingestion: jobs left over from earlier sessions start draining right away
+        session.start_ingest(on_progress=lambda event: self.call_from_thread(self.report_ingest_progress, event))
+
+        # Every turn is appended to <db>/sessions/*.jsonl; a session the app never closed is continued from its tail.
+        # Opened here and not in build_session: a database that was only highlighted (prefetched) holds no log
+        if session.session_log is None:
+            with self.startup.phase(f"session_log[{session.db_name}]"):
+                session.open_log(tail=RESUME_TAIL)
+
+        if session.resumed:
+            self.notify(f"Picked up the last {session.db_name} session where it was cut off ({session.resumed} messages, scroll up for more)")
+            session.resumed = 0
+
+        GlobalState.session = session
+        GlobalState.context = session.context
+        GlobalState.rag_system = session.rag_system
+        GlobalState.chat_agent = session.chat_agent
+        GlobalState.ingest_queue = session.ingest_queue
+        GlobalState.ingest_worker = session.ingest_worker
+        self.update_pins()
+
+    def update_pins(self):
+        """
+        Keeps the active database and every store a pooled session federates with out of the pool's eviction, a
+        background session's FederatedRetriever would otherwise be left searching a closed store.
+        """
+        pinned = set()
+        if GlobalState.session is not None:
+            pinned.add(GlobalState.session.db_name)
+        for session in [GlobalState.session, *self.sessions.open_sessions()]:
+            if session is not None:
+                pinned.update(session.federated_with)
+        self.sessions.pinned = pinned
+
+    def park_log(self, session):
+        """Called before the pool closes a session, its conversation is still offered for ingestion at exit."""
+        if session.session_log is not None and session.session_log.count:
+            self.parked_logs.append((session.db_path, session.session_log.path))
+        # safety net: nothing should keep searching the store once it is closed
+        for other in self.sessions.open_sessions():
+            if session.db_name in other.federated_with:
+                other.federated_with = []
+                other.set_retriever(other.rag_system)
+        self.update_pins()                  # what only the evicted session federated with may go now
+
+    def end_sessions(self, ingest: bool):
+        """
+        Closes the session log of every database used in this run. With `ingest` each log is queued first, the workers
+        read it and ingest the conversation now or on the next start.
+        """
+        open_logs = set()
+        for session in self.sessions.open_sessions():
+            if session.session_log is not None:
+                open_logs.add(session.session_log.path)
+            session.end_log(ingest)
+        for db_path, log_path in self.parked_logs:
+            # reopened later in this run (then ended above) or already closed
+            if log_path in open_logs or not os.path.exists(log_path) or SessionLogReader(log_path).is_closed():
+                continue
+            try:
+                session_log = SessionLog(db_path, path=log_path)
+            except (BlockingIOError, ValueError):
+                continue                    # another instance resumed it after it was parked, it is theirs now
+            job_id = None
+            if ingest:
+                queue = IngestQueue(db_path)
+                job_id = queue.enqueue_log(log_path)
+                queue.close()
+            session_log.close(ingest_job=job_id)
+
+    def report_startup(self):
+        self.notify(self.startup.report(), title="Startup timings", timeout=8)
+        try:
+            self.startup.save(STARTUP_LOG)
+        except OSError:
+            pass
+
+    def report_ingest_progress(self, event):
+        """Shows background ingestion progress as notifications."""
+        queued = f"{event['pending']} job(s) still queued"
+        if event["status"] == "started":
+            self.notify(f"Ingesting conversation #{event['job']}... ({queued})")
+        elif event["status"] == "done":
+            self.notify(f"Ingested conversation #{event['job']}: {event['stats']['ingested']} new fact(s). ({queued})")
+        elif event["status"] == "retry":
+            self.notify(f"Ingestion #{event['job']} failed, will retry: {event['error']}", severity="warning")
+        else:
+            self.notify(f"Ingestion #{event['job']} gave up: {event['error']}", severity="error")
+
 if __name__ == "__main__":
     app = RagTuiApp()
     app.run()
@@ -0,0 +1,78 @@
+"""
+Converts a Chroma memory store (`./private/<db>`) into the flat NumPy index that UserRAG opens with vector_backend="auto".
+The stored vectors are copied as they are, nothing gets re-embedded. The Chroma files are left in place; delete
+`<db>/flat` to go back to them.
+
+    python migrate_store.py "./private/chroma_db[main]"
+    python migrate_store.py ./private/work --dtype float32 --verify
+"""
+from typing import Dict
+import argparse
+import os
+import shutil
+import time
+
+import numpy as np
+
+from vector_backends import ChromaBackend, FlatIndexBackend, flat_index_path
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def migrate(
+        db_path: str,
+        dtype: str = "float16",
+        quantization: str = None,
+        batch_size: int = 1000,
+        overwrite: bool = False,
+    ) -> Dict:
+    target = flat_index_path(db_path)
+    if FlatIndexBackend.exists(target):
+        if not overwrite:
+            raise FileExistsError(f"{target} already exists, pass --overwrite to rebuild it")
+        shutil.rmtree(target)
+
+    # built next to the target and renamed at the end, so an interrupted run never leaves a half index that "auto" would pick
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+
+    start = time.perf_counter()
+    source = ChromaBackend(db_path)
+    flat = FlatIndexBackend(staging, dtype=dtype, quantization=quantization)
+    for ids, texts, vectors in source.iter_batches(batch_size):
+        flat.add(ids, texts, vectors)
+    flat.close()
+    os.replace(staging, target)
+
+    return {"facts": source.count(), "path": target, "dtype": flat.dtype.name, "quantization": quantization, "seconds": time.perf_counter() - start}
+
+def verify(
+        db_path: str,
+        k: int = 5,
+        samples: int = 50,
+    ) -> float:
+    """ Share of Chroma's top-k ids the flat index also returns, using stored vectors as queries """
+    source, flat = ChromaBackend(db_path), FlatIndexBackend(flat_index_path(db_path))
+    ids, _, vectors = next(source.iter_batches(samples), ([], [], []))
+    if not ids:
+        return 1.0
+    expected = source.search(vectors, k)
+    got = flat.search(vectors, k)
+    overlaps = [len({hit.id for hit in a} & {hit.id for hit in b}) / max(len(a), 1) for a, b in zip(expected, got)]
+    return float(np.mean(overlaps))
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a Chroma memory store into the flat NumPy index")
+    parser.add_argument("db_path", help="e.g. ./private/chroma_db[main]")
+    parser.add_argument("--dtype", choices=["float16", "float32"], default="float16")
+    parser.add_argument("--quantize", choices=["int8", "binary"], help="also keep compact codes for the scan (see eval_recall.py)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--overwrite", action="store_true", help="rebuild an existing flat index")
+    parser.add_argument("--verify", action="store_true", help="compare top-k results of both stores afterwards")
+    args = parser.parse_args()
+
+    result = migrate(args.db_path, dtype=args.dtype, quantization=args.quantize, batch_size=args.batch_size, overwrite=args.overwrite)
+    print(f"migrated {result['facts']} facts to {result['path']} ({result['dtype']}) in {result['seconds']:.2f}s")
+    if args.verify:
+        print(f"top-5 overlap with chroma: {verify(args.db_path):.1%}")
@@ -0,0 +1,435 @@
+"""
+One pooled Ollama client per host for every ChatOllama / OllamaEmbeddings in the app, with a scheduler in front that
+groups the queued requests by model. A turn mixes the chat model, the query model (summaries, sub-queries, decisions)
+and the embedding model; on a CPU host that can't keep them all loaded, sending those calls in arrival order makes
+Ollama unload and reload models all the time. The scheduler keeps a running model busy with its own queued requests
+and only moves on when that queue drains (or after `max_batch` grants while others wait, so nobody starves).
+
+    from ollama_pool import pool
+    llm = ChatOllama(model="llama3.1", keep_alive=1800, **pool.client_kwargs())
+    pool.scheduler.snapshot()       # queue depth, in flight, loads / swaps, time spent waiting
+
+Only public APIs are used: the scheduling sits in an httpx transport handed to ollama's clients through their httpx
+keyword arguments (written against ollama 0.6.3, langchain-ollama 1.1.0 and httpx 0.28.1).
+"""
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import json
+import math
+import os
+import re
+import threading
+import time
+import weakref
+
+import httpx
+from ollama import Client
+
+from tracing import tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def keep_alive_seconds(
+        value,
+        default: float,
+    ) -> float:
+    """ Ollama's keep_alive (seconds, or a duration like "30m"; negative keeps the model loaded for good) in seconds """
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return math.inf if value < 0 else float(value)
+    match = re.fullmatch(r"\s*(-?\d+(?:\.\d+)?)\s*(ms|s|m|h)?\s*", str(value))
+    if not match:
+        return default
+    seconds = float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+    return math.inf if seconds < 0 else seconds
+
+
+class _Waiter:
+    __slots__ = ("model", "keep_alive", "enqueued_at", "granted", "event", "loop", "future")
+
+    def __init__(
+            self,
+            model: str,
+            keep_alive: float,
+            loop: asyncio.AbstractEventLoop = None,
+        ):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+            return
+        try:
+            self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+        except RuntimeError:
+            pass                                # the loop is gone, nobody is waiting anymore
+
+
+class ModelScheduler:
+    """
+    Admission control per model. A request for a model that is already running starts right away while that model is
+    under its concurrency limit; a request for any other model waits until fewer than `max_loaded` models are running.
+    When a model finishes, the next one is a model Ollama still has loaded (within its keep-alive) if any is queued,
+    otherwise the one with the oldest waiting request.
+    The loaded set is the scheduler's own model of the host: loading a model counts as a load, and a load that pushes
+    out a model whose keep-alive had not run out yet counts as a swap.
+    """
+    def __init__(
+            self,
+            max_loaded: int = 1,                # models the host keeps loaded side by side (OLLAMA_MAX_LOADED_MODELS)
+            limits: Dict[str, int] = None,      # concurrent requests per model, e.g. {"gpt-oss:20b": 1}
+            default_limit: int = 2,
+            max_batch: int = 8,                 # grants to one model in a row while other models are queued
+            default_keep_alive: float = 300.0,  # ollama's default when a request doesn't say
+        ):
+        self.max_loaded = max_loaded
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.max_batch = max_batch
+        self.default_keep_alive = default_keep_alive
+
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._running: Dict[str, int] = {}
+        self._loaded: "OrderedDict[str, float]" = OrderedDict()    # model -> when its keep-alive runs out, least recent first
+        self._keep_alive: Dict[str, float] = {}
+        self._current: Optional[str] = None
+        self._streak = 0
+        self.stats = {"requests": 0, "queued": 0, "loads": 0, "swaps": 0, "wait_seconds": 0.0, "max_queue_depth": 0}
+        self.per_model: Dict[str, Dict] = {}
+
+    def configure(
+            self,
+            max_loaded: int = None,
+            limits: Dict[str, int] = None,
+            default_limit: int = None,
+            max_batch: int = None,
+        ):
+        with self._lock:
+            self.max_loaded = max_loaded if max_loaded is not None else self.max_loaded
+            self.limits.update(limits or {})
+            self.default_limit = default_limit if default_limit is not None else self.default_limit
+            self.max_batch = max_batch if max_batch is not None else self.max_batch
+            self._dispatch_locked()
+
+    def limit(self, model: str) -> int:
+        return max(self.limits.get(model, self.default_limit), 1)
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    def _expire_locked(self, now: float):
+        for model in [model for model, until in self._loaded.items() if until <= now]:
+            del self._loaded[model]
+
+    def _pick_locked(self) -> Optional[str]:
+        waiting = sorted((model for model, queue in self._queues.items() if queue), key=lambda model: self._queues[model][0].enqueued_at)
+        if not waiting:
+            return None
+        running = {model for model, count in self._running.items() if count}
+        # a model that had its batch while others wait gets nothing new until it drains
+        exhausted = self._current if self._streak >= self.max_batch and len(waiting) > 1 else None
+
+        for model in waiting:
+            if model in running and model != exhausted and self._running[model] < self.limit(model):
+                return model
+        if len(running) >= self.max_loaded:
+            return None
+        self._expire_locked(time.monotonic())
+        candidates = [model for model in waiting if model not in running and model != exhausted]
+        candidates = candidates or [model for model in waiting if model not in running]
+        resident = [model for model in candidates if model in self._loaded]
+        return (resident or candidates or [None])[0]
+
+    def _start_locked(self, waiter: _Waiter):
+        model = waiter.model
+        if model not in self._loaded:
+            self.stats["loads"] += 1
+            idle = [name for name in self._loaded if not self._running.get(name)]
+            while len(self._loaded) >= self.max_loaded and idle:
+                del self._loaded[idle.pop(0)]
+                self.stats["swaps"] += 1
+        self._loaded[model] = math.inf          # never expires while a request runs
+        self._loaded.move_to_end(model)
+        self._running[model] = self._running.get(model, 0) + 1
+        self._keep_alive[model] = waiter.keep_alive
+
+        if model != self._current:
+            self._current, self._streak = model, 0
+        if any(queue for name, queue in self._queues.items() if name != model):
+            self._streak += 1
+
+        waited = time.perf_counter() - waiter.enqueued_at
+        self.stats["wait_seconds"] += waited
+        self.per_model[model]["wait_seconds"] += waited
+        waiter.granted = True
+        waiter.wake()
+
+    def _dispatch_locked(self):
+        while True:
+            model = self._pick_locked()
+            if model is None:
+                return
+            self._start_locked(self._queues[model].popleft())
+
+    def _enqueue(self, waiter: _Waiter):
+        with self._lock:
+            self.stats["requests"] += 1
+            self.per_model.setdefault(waiter.model, {"requests": 0, "wait_seconds": 0.0})["requests"] += 1
+            self._queues.setdefault(waiter.model, deque()).append(waiter)
+            self._dispatch_locked()
+            if not waiter.granted:
+                self.stats["queued"] += 1
+                depth = sum(len(queue) for queue in self._queues.values())
+                self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+
+    def release(self, model: str):
+        with self._lock:
+            self._running[model] -= 1
+            if not self._running[model] and model in self._loaded:
+                self._loaded[model] = time.monotonic() + self._keep_alive.get(model, self.default_keep_alive)
+            self._dispatch_locked()
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    def acquire(
+            self,
+            model: str,
+            keep_alive=None,
+        ) -> float:
+        """ Blocks until `model` may send a request, returns the seconds spent waiting; pair with `release` """
+        waiter = _Waiter(model, keep_alive_seconds(keep_alive, self.default_keep_alive))
+        self._enqueue(waiter)
+        if not waiter.granted:
+            waiter.event.wait()
+        return time.perf_counter() - waiter.enqueued_at
+
+    async def aacquire(
+            self,
+            model: str,
+            keep_alive=None,
+        ) -> float:
+        waiter = _Waiter(model, keep_alive_seconds(keep_alive, self.default_keep_alive), loop=asyncio.get_running_loop())
+        self._enqueue(waiter)
+        if not waiter.granted:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    granted = waiter.granted
+                    if not granted:
+                        self._queues[model].remove(waiter)
+                if granted:
+                    self.release(model)
+                raise
+        return time.perf_counter() - waiter.enqueued_at
+
+    # ------------------------------------------------------------------------------------------------------------------ #
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            return {
+                    **self.stats,
+                    "queue_depth": {model: len(queue) for model, queue in self._queues.items() if queue},
+                    "in_flight": {model: count for model, count in self._running.items() if count},
+                    "loaded": list(self._loaded),
+                    "models": {model: dict(stats) for model, stats in self.per_model.items()},
+                }
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        return (f"ollama {snapshot['loads']} loads / {snapshot['swaps']} swaps, "
+                f"{sum(snapshot['queue_depth'].values())} queued, {snapshot['wait_seconds']:.2f}s waited")
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def _scheduled_request(
+        pool: "OllamaPool",
+        request: httpx.Request,
+    ) -> Tuple[httpx.Request, Optional[str], object]:
+    """ The request with the pool's keep_alive filled in, the model it is for (None for /api/tags etc.) and its keep_alive """
+    if request.method != "POST":
+        return request, None, None
+    try:
+        body = json.loads(request.content)
+    except (httpx.RequestNotRead, ValueError):
+        return request, None, None
+    if not isinstance(body, dict) or not body.get("model"):
+        return request, None, None
+    if pool.keep_alive is not None and body.get("keep_alive") is None:
+        body["keep_alive"] = pool.keep_alive
+        headers = [(name, value) for name, value in request.headers.multi_items() if name.lower() != "content-length"]
+        request = httpx.Request(request.method, request.url, headers=headers, content=json.dumps(body).encode(),
+                                extensions=request.extensions)
+    return request, body["model"], body.get("keep_alive")
+
+
+class _HeldStream(httpx.SyncByteStream):
+    """ Response body that gives the model's slot back once it is closed (read to the end, or dropped half way) """
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        release, self._release = self._release, None
+        try:
+            self._stream.close()
+        finally:
+            if release:
+                release()
+
+
+class _AsyncHeldStream(httpx.AsyncByteStream):
+    def __init__(self, stream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        release, self._release = self._release, None
+        try:
+            await self._stream.aclose()
+        finally:
+            if release:
+                release()
+
+
+class ScheduledTransport(httpx.BaseTransport):
+    """
+    httpx transport on the pool's shared connections; a model request waits for its slot before it goes out and holds
+    it until the response body is closed, which for a streamed chat is when the last chunk was read.
+    """
+    def __init__(
+            self,
+            pool: "OllamaPool",
+            **transport_kwargs,
+        ):
+        self.pool = pool
+        self.transport = httpx.HTTPTransport(**transport_kwargs)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request, model, keep_alive = _scheduled_request(self.pool, request)
+        if model is None:
+            return self.transport.handle_request(request)
+        scheduler = self.pool.scheduler
+        waited = scheduler.acquire(model, keep_alive)
+        if waited > 0.001:
+            tracer.record("ollama_queue", waited, model=model)
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            scheduler.release(model)
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=_HeldStream(response.stream, lambda: scheduler.release(model)))
+
+    def close(self):
+        pass                                    # shared by every client, OllamaPool.close closes the connections
+
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    """ Async ScheduledTransport, with one connection pool per event loop (pooled connections can't cross loops) """
+    def __init__(
+            self,
+            pool: "OllamaPool",
+            **transport_kwargs,
+        ):
+        self.pool = pool
+        self._transport_kwargs = transport_kwargs
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _current(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(**self._transport_kwargs)
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request, model, keep_alive = _scheduled_request(self.pool, request)
+        if model is None:
+            return await self._current().handle_async_request(request)
+        scheduler = self.pool.scheduler
+        waited = await scheduler.aacquire(model, keep_alive)
+        if waited > 0.001:
+            tracer.record("ollama_queue", waited, model=model)
+        try:
+            response = await self._current().handle_async_request(request)
+        except BaseException:
+            scheduler.release(model)
+            raise
+        return httpx.Response(response.status_code, headers=response.headers, extensions=response.extensions,
+                              stream=_AsyncHeldStream(response.stream, lambda: scheduler.release(model)))
+
+    async def aclose(self):
+        pass                                    # shared, see ScheduledTransport.close
+
+
+class OllamaPool:
+    """
+    The shared transports plus the scheduler they report to. Models get them through their public client arguments,
+    `ChatOllama(model=..., **pool.client_kwargs())`; `client()` is a plain ollama.Client on them.
+    """
+    def __init__(
+            self,
+            scheduler: ModelScheduler = None,
+            keep_alive=None,                    # filled into requests that don't set their own
+            max_connections: int = 16,
+        ):
+        self.scheduler = scheduler or ModelScheduler()
+        self.keep_alive = keep_alive
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.transport = ScheduledTransport(self, limits=limits)
+        self.async_transport = AsyncScheduledTransport(self, limits=limits)
+        self._clients: Dict[Optional[str], Client] = {}
+        self._lock = threading.Lock()
+
+    def configure(
+            self,
+            keep_alive=None,
+            **scheduler_kwargs,
+        ) -> "OllamaPool":
+        """ keep_alive plus any of ModelScheduler.configure's arguments """
+        if keep_alive is not None:
+            self.keep_alive = keep_alive
+            self.scheduler.default_keep_alive = keep_alive_seconds(keep_alive, self.scheduler.default_keep_alive)
+        self.scheduler.configure(**scheduler_kwargs)
+        return self
+
+    def client_kwargs(self) -> Dict:
+        """ ChatOllama / OllamaEmbeddings arguments that put the model's ollama clients on the pool """
+        return {"sync_client_kwargs": {"transport": self.transport}, "async_client_kwargs": {"transport": self.async_transport}}
+
+    def client(self, host: str = None) -> Client:
+        # resolved per call, OLLAMA_HOST may be set after import (the bench does)
+        host = host or os.getenv("OLLAMA_HOST")
+        with self._lock:
+            if host not in self._clients:
+                self._clients[host] = Client(host, transport=self.transport)
+            return self._clients[host]
+
+    def close(self):
+        with self._lock:
+            self._clients = {}
+        self.transport.transport.close()
+
+
+pool = OllamaPool()
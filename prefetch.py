@@ -0,0 +1,165 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+import asyncio
+import contextvars
+import threading
+import time
+
+from tracing import tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class MemoryPrefetcher:
+    """
+    Speculative retrieval: `start(message)` runs `retriever.retrieve_data` on the raw user message while the chat model is
+    still deciding whether to call the memory tool, and `get(query, k)` (the tool) serves that result when the tool's
+    query is close enough to the message. Anything else falls back to a normal retrieval.
+    A query counts as close when at least `min_overlap` of its content words also appear in the prefetched message;
+    prefetches older than `ttl_seconds` are dropped.
+    """
+    def __init__(
+            self,
+            retriever,
+            k: int = 1,
+            min_overlap: float = 0.5,
+            ttl_seconds: float = 60.0,
+            max_entries: int = 4,
+        ):
+        self.retriever = retriever                  # UserRAG or FederatedRetriever, can be swapped between turns
+        self.k = k
+        self.min_overlap = min_overlap
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "unused": 0, "seconds_saved": 0.0}
+        self._entries: List[Dict] = []              # newest last: {"tokens", "result", "started_at", "done_at", "used"}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def _tokens(text: str):
+        from bm25 import tokenize                   # pulls in numpy, kept out of the TUI's startup imports
+        return set(tokenize(text))
+
+    def _add(self, message: str, result) -> Dict:
+        entry = {"tokens": self._tokens(message), "result": result, "started_at": time.perf_counter(), "done_at": None, "used": False}
+        with self._lock:
+            self._entries.append(entry)
+            for old in self._entries[:-self.max_entries]:
+                self.stats["unused"] += not old["used"]
+            self._entries = self._entries[-self.max_entries:]
+            self.stats["started"] += 1
+        return entry
+
+    def _match(
+            self,
+            query: str,
+            k: int,
+        ) -> Optional[Dict]:
+        if k != self.k:
+            return None
+        tokens, now = self._tokens(query), time.perf_counter()
+        with self._lock:
+            for old in [entry for entry in self._entries if now - entry["started_at"] > self.ttl_seconds]:
+                self.stats["unused"] += not old["used"]
+                self._entries.remove(old)
+            best, best_overlap = None, 0.0
+            for entry in self._entries:
+                overlap = len(tokens & entry["tokens"]) / len(tokens) if tokens else float(not entry["tokens"])
+                if overlap >= self.min_overlap and overlap >= best_overlap:
+                    best, best_overlap = entry, overlap
+        return best
+
+    def _record(
+            self,
+            entry: Optional[Dict],
+            waited_from: float,
+        ):
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                tracer.annotate(prefetch="miss")
+                return
+            self.stats["hits"] += 1
+            entry["used"] = True
+            # the part of the retrieval that was already done when the tool asked for it
+            self.stats["seconds_saved"] += max(0.0, min(entry["done_at"] or waited_from, waited_from) - entry["started_at"])
+        tracer.annotate(prefetch="hit")
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def summary(self) -> str:
+        return (f"prefetch {self.stats['hits']} hit / {self.stats['misses']} miss ({self.hit_rate():.0%}), "
+                f"{self.stats['unused']} unused, {self.stats['seconds_saved']:.2f}s saved")
+
+    # ------------------------------------------------------- SYNC API ------------------------------------------------------- #
+
+    def start(self, message: str) -> Future:
+        """ Starts retrieving for `message` on a background thread (in the caller's trace context) """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        entry = self._add(message, None)
+
+        def run():
+            try:
+                with tracer.span("prefetch"):
+                    return self.retriever.retrieve_data(query=message, k=self.k)
+            finally:
+                entry["done_at"] = time.perf_counter()
+
+        entry["result"] = self._executor.submit(contextvars.copy_context().run, run)
+        return entry["result"]
+
+    def get(
+            self,
+            query: str,
+            k: int,
+        ):
+        """ What the memory tool calls instead of `retrieve_data` """
+        entry, now = self._match(query, k), time.perf_counter()
+        if entry is not None and isinstance(entry["result"], Future):
+            try:
+                result = entry["result"].result()
+                self._record(entry, now)
+                return result
+            except Exception:
+                pass                                # the speculative run failed, retrieve normally
+        self._record(None, now)
+        return self.retriever.retrieve_data(query=query, k=k)
+
+    # ------------------------------------------------------ ASYNC API ------------------------------------------------------- #
+
+    def astart(self, message: str) -> asyncio.Task:
+        """ Same as `start`, as a task on the running event loop """
+        entry = self._add(message, None)
+
+        async def run():
+            try:
+                with tracer.span("prefetch"):
+                    return await self.retriever.aretrieve_data(query=message, k=self.k)
+            finally:
+                entry["done_at"] = time.perf_counter()
+
+        entry["result"] = asyncio.get_running_loop().create_task(run())
+        return entry["result"]
+
+    async def aget(
+            self,
+            query: str,
+            k: int,
+        ):
+        entry, now = self._match(query, k), time.perf_counter()
+        if entry is not None and isinstance(entry["result"], asyncio.Task):
+            try:
+                result = await asyncio.shield(entry["result"])
+                self._record(entry, now)
+                return result
+            except Exception:
+                pass
+        self._record(None, now)
+        return await self.retriever.aretrieve_data(query=query, k=k)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -96,8 +96,21 @@ analyze_strings_prompt = (
     "Return ONLY 'replacement'"
 )
 
+rolling_summary_prompt = (
+    "You maintain a running summary of a conversation between a USER and an ASSISTANT. "
+    "Given the current summary and the new turns below, return the updated summary. "
+    "Keep every detail that later turns might refer back to: facts about the user, decisions, open questions, names and "
+    "numbers. Drop greetings and filler. Write it as short plain sentences, no headings, and keep it under 250 words. "
+    "Return ONLY the updated summary."
+)
+
 retriever_desc = "Gives you user-details. They *might* contain information you need to answer the query"
 
+web_search_desc = (
+        "Searches the web and reads the top result pages. Use it for current events, prices, weather or anything else "
+        "that is not about the user and may have changed since you were trained"
+    )
+
 # ------------------------------------------------------ NOT - IN - USE -------------------------------------------------------- #
  
 # retriever_desc = (
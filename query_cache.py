@@ -0,0 +1,79 @@
+from collections import OrderedDict
+from typing import List, Optional
+import threading
+import time
+
+import numpy as np
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class DecompositionCache:
+    """
+    In-memory LRU cache of query -> sub-queries with a TTL.
+    Entries are keyed on the normalized query and also remember the query embedding, so a paraphrased query
+    can be matched to an earlier one through cosine similarity instead of another LLM expansion.
+    """
+    def __init__(
+            self,
+            max_entries: int = 256,
+            ttl_seconds: float = 3600,
+            similarity_threshold: float = 0.92,
+        ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()            # key -> (sub_queries, unit query vector, created_at)
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float) -> bool:
+        return time.monotonic() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[List[str]]:
+        """ Exact lookup on the normalized query """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[2]):
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def get_similar(self, query_vector: List[float]) -> Optional[List[str]]:
+        """ Near-duplicate lookup, returns the sub-queries of the most similar live entry above the threshold """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+
+        with self._lock:
+            best_key, best_similarity = None, self.similarity_threshold
+            for key, (_, vector, created_at) in list(self._entries.items()):
+                if self._expired(created_at):
+                    del self._entries[key]
+                    continue
+                similarity = float(vector @ query_vector)
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return list(self._entries[best_key][0])
+
+    def put(self, key: str, sub_queries: List[str], query_vector: List[float]):
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+
+        with self._lock:
+            self._entries[key] = (list(sub_queries), query_vector, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses, "entries": len(self._entries)}
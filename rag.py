@@ -1,15 +1,26 @@
-from langchain_chroma import Chroma
-from langchain_ollama import ChatOllama, OllamaEmbeddings
-from langchain.agents import create_agent
+from langchain_ollama import OllamaEmbeddings
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 from pydantic import BaseModel, Field
-from typing import List, Dict, Literal
+from typing import Callable, List, Dict, Literal, Optional
+import asyncio
+import codecs
+import json
+import os
+import uuid
 
 from prompt_gallery import query_gen_prompt, convo_summary_prompt, analyze_strings_prompt
 from test_data import conversations
-from rag_utils import make_single_query, format_conversation
+from embedding_cache import CachedEmbeddings
+from query_cache import DecompositionCache
+from tracing import tracer
+from structured_completion import make_completion
+from ollama_pool import pool
+from bm25 import BM25Index, LexicalHit, reciprocal_rank_fusion
+from vector_backends import SearchHit, make_backend
+from rag_utils import make_single_query, format_conversation, normalize_text, cosine_similarity_matrix, is_keyword_query, text_hash
 
 # ------------------------------------------------------------------------------------------------------------------------------ #
 
@@ -31,86 +42,610 @@ class UserRAG:
             embedding_model_name: str,
             db_path: str,
             text_splitter: str,
+            max_workers: int = 4,
+            embedding_cache_path: str = None,
+            embedding_cache_size: int = 50_000,
+            keyword_query_max_words: int = 3,
+            auto_skip_distance: float = 0.05,
+            auto_ingest_distance: float = 0.45,
+            keep_alive: int = None,            # seconds ollama keeps the models loaded after a call
+            hybrid_search: bool = True,
+            lexical_fast_path: bool = True,
+            lexical_min_coverage: float = 0.75,
+            lexical_min_terms: int = 2,
+            lexical_min_margin: float = 1.5,
+            vector_backend: Literal["auto", "chroma", "flat"] = "auto",
+            vector_quantization: Literal["int8", "binary"] = None,
+            structured_output: Literal["direct", "agent"] = "direct",
+            embeddings: Embeddings = None,      # embedding client to put the cache in front of, e.g. one shared by several users
         ):
-        self.stringlist_agent = create_agent(
-                ChatOllama(model=model_name),
-                response_format=StringList,
-            )
-        self.decision_agent = create_agent(
-                ChatOllama(model=model_name, format="json"),
-                response_format=Choices,
-            )
+        self.db_path = db_path
+        self.max_workers = max_workers          # upper bound on concurrent decision calls
+        # "direct" is a single schema-constrained chat call per step, "agent" the old create_agent graphs (kept for the bench)
+        self.stringlist_completion = make_completion(structured_output, model_name, StringList, keep_alive=keep_alive)
+        self.decision_completion = make_completion(structured_output, model_name, Choices, keep_alive=keep_alive, json_mode=True)
 
-        self.vector_store = Chroma(
-                collection_name="chroma_db",
-                embedding_function=OllamaEmbeddings(model=embedding_model_name),
-                persist_directory=db_path,
+        # repeated facts and popular sub-queries are served from disk instead of re-embedding them
+        self.embeddings = CachedEmbeddings(
+                embeddings or OllamaEmbeddings(model=embedding_model_name, keep_alive=keep_alive, **pool.client_kwargs()),
+                model_name=embedding_model_name,
+                cache_path=embedding_cache_path or os.path.join(db_path, "embedding_cache.sqlite3"),
+                max_entries=embedding_cache_size,
             )
+        # "auto" opens <db_path>/flat when migrate_store.py has converted this db, chroma otherwise; the flat index can keep
+        # int8 / binary codes for the scan and rerank the shortlist from the full precision vectors
+        self.store = make_backend(vector_backend, db_path, embedding_function=self.embeddings, quantization=vector_quantization)
+        # repeated or paraphrased tool queries skip the LLM expansion
+        self.query_cache = DecompositionCache()
+        self.keyword_query_max_words = keyword_query_max_words
+
+        # ingestion only asks the decision model about facts whose nearest neighbour falls between these cosine distances
+        self.auto_skip_distance = auto_skip_distance
+        self.auto_ingest_distance = auto_ingest_distance
+        self._fact_hashes = None                # trimmed-text hashes of every stored fact, loaded on first ingest
+
+        # BM25 over the stored facts, fused with the vector hits; when every sub-query's best lexical hit covers at least
+        # `lexical_min_coverage` of its terms the embedding model is not called at all. A one or two word sub-query covers
+        # itself with any fact containing the word, so the hit must also match `lexical_min_terms` terms or outscore the
+        # runner-up by `lexical_min_margin`
+        self.hybrid_search = hybrid_search
+        self.lexical_fast_path = lexical_fast_path
+        self.lexical_min_coverage = lexical_min_coverage
+        self.lexical_min_terms = lexical_min_terms
+        self.lexical_min_margin = lexical_min_margin
+        self._bm25 = None                       # loaded on first retrieval, kept in sync by add_with_vectors
+        self.last_ingest_stats = {}
+
         self.text_sep_splitter = RecursiveCharacterTextSplitter(
                 separators=".",
                 keep_separator=False,
                 chunk_size=1,               # force splitting at separator
                 chunk_overlap=0,
             )
+        # used by ingest_document: "recursive" gives ~800 character passages, anything else splits into sentences
+        self.text_splitter = text_splitter
+        self.document_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=800,
+                chunk_overlap=80,
+            ) if text_splitter == "recursive" else self.text_sep_splitter
     
+    @tracer.traced("summarize")
     def extract_user_summary(
             self,
             conversation: List,
         ):
         convo_str = format_conversation(conversation)
-        user_data_list = self.stringlist_agent.invoke({
-                "messages": make_single_query(sys_prompt=convo_summary_prompt, usr_query=convo_str)
-            })["structured_response"].queries
+        user_data_list = self.stringlist_completion.invoke(
+                make_single_query(sys_prompt=convo_summary_prompt, usr_query=convo_str)
+            ).queries
 
         return user_data_list
 
  
+    @tracer.traced("decompose")
+    def decompose_query(
+            self,
+            query: str,
+        ) -> List[str]:
+        """
+        Breaks a query into semantic search sub-queries.
+        Short keyword queries are used as they are, anything seen before (word for word or paraphrased) comes from the cache.
+        """
+        if is_keyword_query(query, max_words=self.keyword_query_max_words):
+            tracer.annotate(cache="keyword")
+            return [query.strip()]
+
+        cache_key = normalize_text(query)
+        sub_queries = self.query_cache.get(cache_key)
+        if sub_queries is not None:
+            tracer.annotate(cache="exact")
+            return sub_queries
+
+        query_vector = self.embeddings.embed_query(query)
+        sub_queries = self.query_cache.get_similar(query_vector)
+        tracer.annotate(cache="miss" if sub_queries is None else "semantic")
+        if sub_queries is None:
+            sub_queries = self.stringlist_completion.invoke(
+                    make_single_query(sys_prompt=query_gen_prompt, usr_query=query)
+                ).queries
+
+        self.query_cache.put(cache_key, sub_queries, query_vector)
+        return sub_queries
+
+    @tracer.traced("retrieve")
     def retrieve_data(
             self,
             query,
             k,
         ):
-        sub_queries = self.stringlist_agent.invoke({
-                "messages": make_single_query(sys_prompt=query_gen_prompt, usr_query=query)
-            })["structured_response"].queries
+        sub_queries = self.decompose_query(query)
+
+        sub_queries = list(dict.fromkeys(sub_queries))     # exact repeats cost an embedding for nothing
+        if not sub_queries:
+            return []
+
+        lexical_results = self.lexical_search(sub_queries, k=2*k) if self.hybrid_search else None
+        if self._lexical_confident(lexical_results):
+            tracer.annotate(path="lexical")
+            return self._stitch_hits(self._confident_hits(lexical_results, k))
+
+        # one embedding request and one chroma query for all the sub-queries
+        query_vectors = self.embeddings.embed_documents(sub_queries)
+        search_results = self.search_by_vectors(query_vectors, k=2*k if lexical_results else k)
+        tracer.annotate(path="hybrid" if lexical_results else "vector")
+        return self._stitch_hits(self._fuse_hits(search_results, lexical_results, k))
+
+    def search_sub_queries(
+            self,
+            sub_queries: List[str],
+            query_vectors: List[List[float]],
+            k: int,
+        ) -> List[List]:
+        """ Hybrid top-k per sub-query when the vectors are already known, e.g. embedded once for several stores """
+        lexical_results = self.lexical_search(sub_queries, k=2*k) if self.hybrid_search else None
+        search_results = self.search_by_vectors(query_vectors, k=2*k if lexical_results else k)
+        return self._fuse_hits(search_results, lexical_results, k)
+
+    @tracer.traced("lexical")
+    def lexical_search(
+            self,
+            queries: List[str],
+            k: int,
+        ) -> List[List[LexicalHit]]:
+        """ BM25 hits for every query, best first """
+        bm25 = self._load_bm25()
+        return [bm25.search(query, k=k) for query in queries]
+
+    def _load_bm25(self) -> BM25Index:
+        """ Builds the lexical index over everything already stored, once per instance """
+        if self._bm25 is None:
+            bm25 = BM25Index()
+            bm25.add(*self.store.get_all())
+            self._bm25 = bm25
+        return self._bm25
+
+    def _strong_hit(self, hit: LexicalHit) -> bool:
+        return hit.coverage >= self.lexical_min_coverage and hit.matched >= self.lexical_min_terms
+
+    def _lexical_winner(self, hits: List[LexicalHit]) -> bool:
+        """ The best hit of a sub-query is good enough to skip the vector search """
+        if not hits or hits[0].coverage < self.lexical_min_coverage:
+            return False
+        runner_up = hits[1].score if len(hits) > 1 else 0.0
+        return hits[0].matched >= self.lexical_min_terms or hits[0].score >= runner_up * self.lexical_min_margin
+
+    def _lexical_confident(
+            self,
+            lexical_results: Optional[List[List[LexicalHit]]],
+        ) -> bool:
+        return bool(
+                self.lexical_fast_path and lexical_results
+                and all(self._lexical_winner(hits) for hits in lexical_results)
+            )
+
+    def _confident_hits(
+            self,
+            lexical_results: List[List[LexicalHit]],
+            k: int,
+        ) -> List[List[LexicalHit]]:
+        # the winner, plus whatever else is strong on its own
+        return [([hits[0]] + [hit for hit in hits[1:] if self._strong_hit(hit)])[:k] for hits in lexical_results]
+
+    @staticmethod
+    def _fuse_hits(
+            search_results: List[List[SearchHit]],
+            lexical_results: Optional[List[List[LexicalHit]]],
+            k: int,
+        ) -> List[List]:
+        """ Reciprocal-rank fusion of the vector and BM25 rankings of each sub-query """
+        if not lexical_results:
+            return search_results
+        return [
+                reciprocal_rank_fusion([vector_hits, lexical_hits], k=k)
+                for vector_hits, lexical_hits in zip(search_results, lexical_results)
+            ]
 
+    def _stitch_hits(
+            self,
+            search_results: List[List[SearchHit]],
+        ) -> List[str]:
+        # the same fact tends to come back for several sub-queries, keep only its first appearance
         retrieved_data = []
-        for query in sub_queries:
-            retrieved_docs = self.vector_store.similarity_search(query, k=k)
-            stitched_text_data = "\n".join([doc.page_content for doc in retrieved_docs])
-            retrieved_data.append(stitched_text_data)
+        seen_ids = set()
+        for hits in search_results:
+            unique_docs = []
+            for hit in hits:
+                if hit.id not in seen_ids:
+                    seen_ids.add(hit.id)
+                    unique_docs.append(hit.text)
+            if unique_docs:
+                retrieved_data.append("\n".join(unique_docs))
 
         return retrieved_data
 
+    @tracer.traced("search")
+    def search_by_vectors(
+            self,
+            query_vectors: List[List[float]],
+            k: int,
+        ) -> List[List[SearchHit]]:
+        """
+        Runs a single multi-vector query against the store.
+        Returns one list of hits per query vector, closest first, with cosine distances.
+        """
+        if not len(query_vectors):
+            return []
+        return self.store.search(query_vectors, k=k)
 
-    def injest_data(
+    @tracer.traced("store")
+    def add_with_vectors(
             self,
-            conversation: List,
-            ret: Literal["items","ids"]=None,
+            texts: List[str],
+            vectors: List[List[float]],
+        ) -> List[str]:
+        """ Stores texts whose embeddings are already known, so nothing gets embedded twice """
+        if not texts:
+            return []
+
+        ids = [str(uuid.uuid4()) for _ in texts]
+        self.store.add(ids, texts, vectors)
+        if self._fact_hashes is not None:
+            self._fact_hashes.update(text_hash(text) for text in texts)
+        if self._bm25 is not None:
+            self._bm25.add(ids, texts)
+        return ids
+
+    def delete_facts(
+            self,
+            ids: List[str],
+        ):
+        """ Removes stored facts and keeps the in-process indexes in step """
+        if not ids:
+            return
+        self.store.delete(ids)
+        if self._bm25 is not None:
+            self._bm25.remove(ids)
+        self._fact_hashes = None                # rebuilt on the next ingest, deletes are rare
+
+
+    def _load_fact_hashes(self):
+        """ Builds the exact-duplicate index over everything already stored, once per instance """
+        if self._fact_hashes is None:
+            _, stored_docs = self.store.get_all()
+            self._fact_hashes = {text_hash(doc) for doc in stored_docs}
+        return self._fact_hashes
+
+    def _dedupe_facts(
+            self,
+            user_data_list: List[str],
         ):
-        user_data_list = self.extract_user_summary(conversation)
+        """ Drops facts that repeat each other or something already stored, word for word """
+        fact_hashes = self._load_fact_hashes()
+        stats = {"facts": len(user_data_list), "exact_duplicates": 0, "auto_skipped": 0, "auto_ingested": 0, "llm_calls": 0}
 
-        new_user_info = []
+        unique_facts = {}
         for item in user_data_list:
-            try:
-                closest_item = self.vector_store.similarity_search(item, k=1)[0].page_content
-            except Exception:
-                closest_item = ""
+            item_hash = text_hash(item)
+            if item_hash in fact_hashes or item_hash in unique_facts:
+                print(f"Skipping: {item}")
+                stats["exact_duplicates"] += 1
+                continue
+            unique_facts[item_hash] = item
+
+        return list(unique_facts.values()), stats
+
+    def _triage_facts(
+            self,
+            user_data_list: List[str],
+            fact_vectors: List[List[float]],
+            nearest_stored: List[List[SearchHit]],
+            stats: Dict,
+        ):
+        """
+        Every fact is compared with its closest neighbour, which is either a stored fact or an earlier fact of this batch.
+        Clearly unrelated facts are ingested and near-identical ones skipped right away, only the ambiguous band in between
+        gets a decision model input. Returns the per-fact verdicts (None = ask the model) and those model inputs.
+        """
+        batch_similarity = cosine_similarity_matrix(fact_vectors, fact_vectors)
+
+        verdicts, decision_inputs = [], []
+        for idx, item in enumerate(user_data_list):
+            closest_item, closest_distance = "", float("inf")
+            if nearest_stored[idx]:
+                closest_item, closest_distance = nearest_stored[idx][0].text, nearest_stored[idx][0].distance
+            if idx > 0:
+                batch_idx = int(batch_similarity[idx, :idx].argmax())
+                if 1.0 - batch_similarity[idx, batch_idx] < closest_distance:
+                    closest_item, closest_distance = user_data_list[batch_idx], 1.0 - float(batch_similarity[idx, batch_idx])
 
-            messages = make_single_query(sys_prompt=analyze_strings_prompt, usr_query=f"Str-1: {closest_item}\nStr-2: {item}")
-            is_replacement = self.decision_agent.invoke({"messages": messages})["structured_response"].replacement
+            if closest_distance >= self.auto_ingest_distance:
+                verdicts.append(True)
+                stats["auto_ingested"] += 1
+            elif closest_distance <= self.auto_skip_distance:
+                verdicts.append(False)
+                stats["auto_skipped"] += 1
+            else:
+                verdicts.append(None)
+                messages = make_single_query(sys_prompt=analyze_strings_prompt, usr_query=f"Str-1: {closest_item}\nStr-2: {item}")
+                decision_inputs.append(messages)
+
+        stats["llm_calls"] = len(decision_inputs)
+        stats["llm_calls_avoided"] = stats["facts"] - stats["llm_calls"]
+        return verdicts, decision_inputs
+
+    def _store_facts(
+            self,
+            user_data_list: List[str],
+            fact_vectors: List[List[float]],
+            verdicts: List[Optional[bool]],
+            decisions: List[Dict],
+            stats: Dict,
+        ):
+        decisions = iter(decisions)
+        new_user_info, new_vectors = [], []
+        for item, vector, verdict in zip(user_data_list, fact_vectors, verdicts):
+            if verdict is None:
+                verdict = not next(decisions).replacement
 
-            if not is_replacement:
+            if verdict:
                 print(f"Injesting: {item}")
                 new_user_info.append(item)
+                new_vectors.append(vector)
             else:
                 print(f"Skipping: {item}")
 
-        ids = self.vector_store.add_texts(texts=new_user_info)
-        if ret == "items":
-            return new_user_info 
-        if ret == "ids":
-            return ids
+        ids = self.add_with_vectors(texts=new_user_info, vectors=new_vectors)
+        stats["ingested"] = len(ids)
+        self.last_ingest_stats = stats
+        return new_user_info, ids
+
+    @tracer.traced("ingest")
+    def injest_data(
+            self,
+            conversation: List,
+            ret: Literal["items","ids"]=None,
+            with_stats: bool = False,
+        ):
+        """
+        Summarizes the conversation into facts and stores the ones that are new.
+        With `with_stats` the result comes back as a (result, stats) pair, stats counting how many decision model calls
+        the duplicate index and distance thresholds avoided.
+        """
+        user_data_list, stats = self._dedupe_facts(self.extract_user_summary(conversation))
+
+        new_user_info, ids = [], []
+        if user_data_list:
+            # one embedding request and one chroma query for the whole batch
+            fact_vectors = self.embeddings.embed_documents(user_data_list)
+            nearest_stored = self.search_by_vectors(fact_vectors, k=1)
+            verdicts, decision_inputs = self._triage_facts(user_data_list, fact_vectors, nearest_stored, stats)
+
+            decisions = []
+            if decision_inputs:
+                with tracer.span("decide", calls=len(decision_inputs)):
+                    decisions = self.decision_completion.batch(decision_inputs, max_concurrency=self.max_workers)
+            new_user_info, ids = self._store_facts(user_data_list, fact_vectors, verdicts, decisions, stats)
+        else:
+            stats.update(llm_calls=0, llm_calls_avoided=stats["facts"], ingested=0)
+            self.last_ingest_stats = stats
+
+        result = {"items": new_user_info, "ids": ids}.get(ret)
+        return (result, stats) if with_stats else result
+
+    # --------------------------------------------------- DOCUMENT INGESTION ------------------------------------------------ #
+
+    def _stream_chunks(
+            self,
+            path: str,
+            read_size: int,
+            min_chars: int,
+        ):
+        """
+        Yields (chunk, bytes read so far) while reading `path` block by block. The last piece of every block may be cut
+        mid-sentence, so it is carried over and split again together with the next block.
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        carry, bytes_read = "", 0
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(read_size)
+                bytes_read += len(block)
+                text = carry + decoder.decode(block, final=not block)
+                pieces = self.document_splitter.split_text(text) if text.strip() else []
+
+                # keep the raw tail (with its separators) for the next round, unless the file ended or it keeps growing
+                # without a split point
+                carry = ""
+                if block and pieces and len(pieces[-1]) < 4 * read_size:
+                    tail_start = text.rfind(pieces[-1])
+                    if tail_start >= 0:
+                        carry = text[tail_start:]
+                        pieces.pop()
+                for piece in pieces:
+                    piece = " ".join(piece.split())
+                    if len(piece) >= min_chars:
+                        yield piece, bytes_read
+                if not block:
+                    return
+
+    def _checkpoint_path(self, path: str) -> str:
+        return os.path.join(self.db_path, "ingest_checkpoints", f"{text_hash(os.path.abspath(path))}.json")
+
+    @tracer.traced("ingest_document")
+    def ingest_document(
+            self,
+            path: str,
+            batch_size: int = 64,
+            read_size: int = 64 * 1024,
+            min_chars: int = 20,
+            on_progress: Callable[[Dict], None] = None,
+            resume: bool = True,
+        ) -> Dict:
+        """
+        Streams a text file into the store as passages, split by the configured `text_splitter`.
+        Chunks are embedded and written `batch_size` at a time, so memory stays flat however big the file is. After every
+        batch a checkpoint under <db_path>/ingest_checkpoints/ records how many chunks are done; a rerun on the unchanged
+        file skips those without embedding them again. Passages already stored word for word are skipped too.
+        No LLM is involved, documents are stored as they are rather than summarized into facts.
+        """
+        file_stat = os.stat(path)
+        fingerprint = {"path": os.path.abspath(path), "size": file_stat.st_size, "mtime": file_stat.st_mtime,
+                       "splitter": self.text_splitter, "read_size": read_size}
+        checkpoint_path = self._checkpoint_path(path)
+
+        done = 0
+        if resume and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if checkpoint.get("fingerprint") == fingerprint:
+                done = checkpoint["chunks"]
+        stats = {"path": path, "total_bytes": file_stat.st_size, "bytes_read": 0, "chunks": done, "stored": 0,
+                 "duplicates": 0, "resumed_from": done, "finished": False}
+
+        fact_hashes = self._load_fact_hashes()
+
+        def write_batch(batch: List[str]):
+            unique = {}
+            for chunk in batch:
+                chunk_hash = text_hash(chunk)
+                if chunk_hash in fact_hashes or chunk_hash in unique:
+                    stats["duplicates"] += 1
+                else:
+                    unique[chunk_hash] = chunk
+            if unique:
+                texts = list(unique.values())
+                self.add_with_vectors(texts, self.embeddings.embed_documents(texts))
+                stats["stored"] += len(texts)
+            stats["chunks"] += len(batch)
+            self._save_checkpoint(checkpoint_path, fingerprint, stats)
+            if on_progress:
+                on_progress(dict(stats))
+
+        batch, seen = [], 0
+        for chunk, bytes_read in self._stream_chunks(path, read_size, min_chars):
+            stats["bytes_read"] = bytes_read
+            seen += 1
+            if seen <= done:
+                continue
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                write_batch(batch)
+                batch = []
+        stats["bytes_read"] = file_stat.st_size
+        stats["finished"] = True
+        write_batch(batch)
+
+        tracer.annotate(chunks=stats["chunks"], stored=stats["stored"])
+        return stats
+
+    @staticmethod
+    def _save_checkpoint(
+            checkpoint_path: str,
+            fingerprint: Dict,
+            stats: Dict,
+        ):
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        with open(checkpoint_path + ".tmp", "w") as f:
+            json.dump({"fingerprint": fingerprint, "chunks": stats["chunks"], "stored": stats["stored"],
+                       "finished": stats["finished"]}, f)
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+    def close(self):
+        """ Releases the embedding cache and the vector store, the instance is unusable afterwards """
+        self.embeddings.close()
+        self.store.close()
+
+    # ------------------------------------------------------ ASYNC API ------------------------------------------------------- #
+
+    @tracer.traced("summarize")
+    async def aextract_user_summary(
+            self,
+            conversation: List,
+        ):
+        convo_str = format_conversation(conversation)
+        response = await self.stringlist_completion.ainvoke(
+                make_single_query(sys_prompt=convo_summary_prompt, usr_query=convo_str)
+            )
+        return response.queries
+
+    @tracer.traced("decompose")
+    async def adecompose_query(
+            self,
+            query: str,
+        ) -> List[str]:
+        if is_keyword_query(query, max_words=self.keyword_query_max_words):
+            tracer.annotate(cache="keyword")
+            return [query.strip()]
+
+        cache_key = normalize_text(query)
+        sub_queries = self.query_cache.get(cache_key)
+        if sub_queries is not None:
+            tracer.annotate(cache="exact")
+            return sub_queries
+
+        query_vector = await self.embeddings.aembed_query(query)
+        sub_queries = self.query_cache.get_similar(query_vector)
+        tracer.annotate(cache="miss" if sub_queries is None else "semantic")
+        if sub_queries is None:
+            response = await self.stringlist_completion.ainvoke(
+                    make_single_query(sys_prompt=query_gen_prompt, usr_query=query)
+                )
+            sub_queries = response.queries
+
+        self.query_cache.put(cache_key, sub_queries, query_vector)
+        return sub_queries
+
+    @tracer.traced("retrieve")
+    async def aretrieve_data(
+            self,
+            query,
+            k,
+        ):
+        sub_queries = list(dict.fromkeys(await self.adecompose_query(query)))
+        if not sub_queries:
+            return []
+
+        lexical_results = None
+        if self.hybrid_search:
+            # the first call loads the index from chroma, keep that off the event loop
+            lexical_results = (self.lexical_search(sub_queries, 2*k) if self._bm25 is not None
+                               else await asyncio.to_thread(self.lexical_search, sub_queries, 2*k))
+        if self._lexical_confident(lexical_results):
+            tracer.annotate(path="lexical")
+            return self._stitch_hits(self._confident_hits(lexical_results, k))
+
+        # sub-queries still share one embedding request; chroma is sync, so its query runs off the event loop
+        query_vectors = await self.embeddings.aembed_documents(sub_queries)
+        search_results = await asyncio.to_thread(self.search_by_vectors, query_vectors, 2*k if lexical_results else k)
+        tracer.annotate(path="hybrid" if lexical_results else "vector")
+        return self._stitch_hits(self._fuse_hits(search_results, lexical_results, k))
+
+    @tracer.traced("ingest")
+    async def ainjest_data(
+            self,
+            conversation: List,
+            ret: Literal["items","ids"]=None,
+            with_stats: bool = False,
+        ):
+        """ Async counterpart of `injest_data`, decision model calls are fanned out with at most `max_workers` in flight """
+        user_data_list = await self.aextract_user_summary(conversation)
+        user_data_list, stats = await asyncio.to_thread(self._dedupe_facts, user_data_list)
+
+        new_user_info, ids = [], []
+        if user_data_list:
+            fact_vectors = await self.embeddings.aembed_documents(user_data_list)
+            nearest_stored = await asyncio.to_thread(self.search_by_vectors, fact_vectors, 1)
+            verdicts, decision_inputs = self._triage_facts(user_data_list, fact_vectors, nearest_stored, stats)
+
+            with tracer.span("decide", calls=len(decision_inputs)):
+                decisions = await self.decision_completion.abatch(decision_inputs, max_concurrency=self.max_workers)
+            new_user_info, ids = await asyncio.to_thread(self._store_facts, user_data_list, fact_vectors, verdicts, decisions, stats)
+        else:
+            stats.update(llm_calls=0, llm_calls_avoided=stats["facts"], ingested=0)
+            self.last_ingest_stats = stats
+
+        result = {"items": new_user_info, "ids": ids}.get(ret)
+        return (result, stats) if with_stats else result
 
 # ------------------------------------------------------------------------------------------------------------------------------ #
 
@@ -134,9 +669,10 @@ def test(user_query, str1, str2):
     # print(rag_agent.get_relation(prompt=analyze_strings_prompt, str1=str1, str2=str2))
 
     
-# move this to test_data.py
-str1 = "user was invited to a podcast where he spoke about his research work and his journey"
-str2 = "he was also invited to some other podcasts in the past"
-test_query = "how many years would a random guy with a undergrad degree need to reach a career position where im right now"
-test_query = "RTX 3090"
-test(user_query=test_query, str1=str1, str2=str2)
+if __name__ == "__main__":
+    # move this to test_data.py
+    str1 = "user was invited to a podcast where he spoke about his research work and his journey"
+    str2 = "he was also invited to some other podcasts in the past"
+    test_query = "how many years would a random guy with a undergrad degree need to reach a career position where im right now"
+    test_query = "RTX 3090"
+    test(user_query=test_query, str1=str1, str2=str2)
@@ -0,0 +1,665 @@
+"""
+Long-running local RAG service, so several users (or several TUIs and scripts of one user) on the same box share one
+process: one UserRAG per user, each on its own store under the service root (<root>/<user>, the same layout as
+./private/<db>), one pooled Ollama client for all of them. Embedding requests from concurrent clients are micro-batched
+into shared embed calls, and concurrent searches of the same user's store into one multi-vector query.
+
+    python rag_service.py --root ./private/                               # unix:///tmp/rechat-rag.sock
+    python rag_service.py --root ./private/ --port 8765                   # http://127.0.0.1:8765, needs tokens
+    python rag_service.py --root ./private/ --token alice                 # creates <root>/alice/.rag_token
+
+A caller may only use the stores it owns. On the unix socket that is checked against the peer's uid (SO_PEERCRED): the
+store directory must belong to it. TCP can't tell local users apart, so there every store needs its token, a secret
+the service keeps in <root>/<user>/.rag_token (mode 600) and RemoteUserRAG reads from next to its db_path.
+
+Clients use `RemoteUserRAG` in place of a UserRAG; main.py and main_tui.py switch to it when RECHAT_RAG_SERVICE is set
+(e.g. RECHAT_RAG_SERVICE=unix:///tmp/rechat-rag.sock).
+"""
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import hmac
+import http.client
+import json
+import os
+import re
+import secrets
+import socket
+import socketserver
+import stat
+import struct
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from tracing import tracer
+from vector_backends import VectorBackend
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+SERVICE_ENV = "RECHAT_RAG_SERVICE"
+DEFAULT_SOCKET = "/tmp/rechat-rag.sock"
+TOKEN_FILE = ".rag_token"
+
+def read_token(
+        root: str,
+        user: str,
+    ) -> Optional[str]:
+    """ The store's token, None if it has none (or it isn't readable by this process) """
+    try:
+        with open(os.path.join(root, user, TOKEN_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def issue_token(
+        root: str,
+        user: str,
+    ) -> str:
+    """ The store's token for TCP clients, created on first use and readable by this process's user only """
+    path = os.path.join(root, RAGService.check_user(user), TOKEN_FILE)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return read_token(root, user)
+    with os.fdopen(fd, "w") as f:
+        f.write(secrets.token_hex(32))
+    return read_token(root, user)
+
+def peer_uid(sock: socket.socket) -> Optional[int]:
+    """ uid of the process on the other end of a unix socket, None over TCP or where SO_PEERCRED is missing """
+    if sock.family != socket.AF_UNIX or not hasattr(socket, "SO_PEERCRED"):
+        return None
+    _, uid, _ = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid
+
+class _Batch:
+    __slots__ = ("items", "size", "results", "error", "full", "done")
+
+    def __init__(self):
+        self.items: List = []
+        self.size = 0
+        self.results: List = []
+        self.error: Optional[BaseException] = None
+        self.full = False
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    Collects the items that concurrent callers `submit` within `window` seconds of the first one (or until `max_items`)
+    and runs `run_batch(items) -> results` once for all of them, on the first caller's thread. The others wait for it.
+    With `size`, `max_items` caps the sum of `size(item)` instead of the number of items; an item that would go over
+    closes the batch and starts the next one (alone, if it is over the cap by itself).
+    """
+    def __init__(
+            self,
+            run_batch: Callable[[List], List],
+            window: float = 0.005,
+            max_items: int = 64,
+            size: Callable[[object], int] = None,
+        ):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_items = max_items
+        self.size = size
+        self.stats = {"batches": 0, "items": 0, "largest": 0}
+        self._cond = threading.Condition()
+        self._batch = _Batch()
+
+    def _close_locked(self, batch: _Batch):
+        batch.full = True
+        self._batch = _Batch()
+        self._cond.notify_all()
+
+    def submit(self, item):
+        size = self.size(item) if self.size else 1
+        with self._cond:
+            batch = self._batch
+            if batch.items and batch.size + size > self.max_items:
+                self._close_locked(batch)
+                batch = self._batch
+            batch.items.append(item)
+            batch.size += size
+            idx = len(batch.items) - 1
+            if batch.size >= self.max_items:
+                self._close_locked(batch)
+        if idx == 0:
+            self._lead(batch)
+        batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[idx]
+
+    def _lead(self, batch: _Batch):
+        with self._cond:
+            self._cond.wait_for(lambda: batch.full, timeout=self.window)
+            if self._batch is batch:
+                self._batch = _Batch()
+            self.stats["batches"] += 1
+            self.stats["items"] += len(batch.items)
+            self.stats["largest"] = max(self.stats["largest"], len(batch.items))
+        try:
+            batch.results = self.run_batch(batch.items)
+        except BaseException as e:
+            batch.error = e
+        finally:
+            batch.done.set()
+
+    def mean_size(self) -> float:
+        return self.stats["items"] / self.stats["batches"] if self.stats["batches"] else 0.0
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Embedding client shared by every user: concurrent embed calls become one request, repeated texts embedded once.
+    A batch holds at most `max_texts` texts across its calls (a single bigger call still goes out as one batch).
+    """
+    def __init__(
+            self,
+            embeddings,
+            window: float = 0.005,
+            max_texts: int = 256,
+        ):
+        self.embeddings = embeddings
+        self.batcher = MicroBatcher(self._embed_batch, window=window, max_items=max_texts, size=len)
+
+    def _embed_batch(self, requests: List[List[str]]) -> List[List[List[float]]]:
+        unique = list(dict.fromkeys(text for texts in requests for text in texts))
+        with tracer.span("embed_batch", requests=len(requests), texts=len(unique)):
+            vectors = dict(zip(unique, self.embeddings.embed_documents(unique)))
+        return [[vectors[text] for text in texts] for texts in requests]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.batcher.submit(list(texts)) if texts else []
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class BatchedStore(VectorBackend):
+    """ One user's vector store with concurrent searches merged into a single multi-vector query (at the largest k) """
+    def __init__(
+            self,
+            store,
+            window: float = 0.005,
+            max_queries: int = 64,
+        ):
+        self.store = store
+        self.batcher = MicroBatcher(self._search_batch, window=window, max_items=max_queries)
+
+    def _search_batch(self, requests: List[Tuple[List[List[float]], int]]) -> List[List]:
+        vectors = [vector for query_vectors, _ in requests for vector in query_vectors]
+        k = max(k for _, k in requests)
+        with tracer.span("search_batch", requests=len(requests), vectors=len(vectors)):
+            hits = self.store.search(vectors, k=k)
+        results, start = [], 0
+        for query_vectors, k in requests:
+            results.append([row[:k] for row in hits[start:start + len(query_vectors)]])
+            start += len(query_vectors)
+        return results
+
+    def search(self, query_vectors, k):
+        return self.batcher.submit((list(query_vectors), k)) if len(query_vectors) else []
+
+    def add(self, ids, texts, vectors):
+        self.store.add(ids, texts, vectors)
+
+    def get_all(self):
+        return self.store.get_all()
+
+    def iter_batches(self, batch_size=1000):
+        return self.store.iter_batches(batch_size)
+
+    def delete(self, ids):
+        self.store.delete(ids)
+
+    def count(self):
+        return self.store.count()
+
+    def close(self):
+        self.store.close()
+
+
+class RAGService:
+    """
+    The users' UserRAGs, opened on first use and kept open. `user` names are store directories under `root`; anything
+    that isn't a plain directory name is refused. Callers are checked with `authorize` before a store is touched.
+    """
+    def __init__(
+            self,
+            root: str,
+            model_name: str = "llama3.1",
+            embedding_model_name: str = "embeddinggemma:300m",
+            keep_alive: int = None,
+            batch_window: float = 0.005,
+            **rag_kwargs,
+        ):
+        from langchain_ollama import OllamaEmbeddings
+        from ollama_pool import pool
+
+        self.root = root
+        self.model_name = model_name
+        self.embedding_model_name = embedding_model_name
+        self.keep_alive = keep_alive
+        self.batch_window = batch_window
+        self.rag_kwargs = rag_kwargs
+        self.embeddings = BatchedEmbeddings(
+                OllamaEmbeddings(model=embedding_model_name, keep_alive=keep_alive, **pool.client_kwargs()),
+                window=batch_window,
+            )
+        self.requests = {"retrieve": 0, "ingest": 0, "errors": 0}
+        self._users: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def check_user(user: str) -> str:
+        if not isinstance(user, str) or not re.fullmatch(r"[\w\-\[\]]+(?:\.[\w\-\[\]]+)*", user):
+            raise ValueError(f"invalid user name {user!r}")
+        return user
+
+    def owner(self, user: str) -> Optional[int]:
+        """ uid that owns the user's store directory, None while there is none """
+        try:
+            info = os.lstat(os.path.join(self.root, self.check_user(user)))
+        except FileNotFoundError:
+            return None
+        if not stat.S_ISDIR(info.st_mode):
+            raise ValueError(f"{user!r} is not a store directory")
+        return info.st_uid
+
+    def authorize(
+            self,
+            users: List[str],
+            uid: int = None,
+            tokens: Dict[str, str] = None,
+        ):
+        """
+        PermissionError unless the caller may use every store in `users`. A unix socket peer (`uid`) must own the store
+        directory; one that doesn't exist yet is only created for the service's own user. Without a peer uid (TCP) the
+        caller has to present each store's token.
+        """
+        for user in users:
+            if uid is not None:
+                owner = self.owner(user)
+                if owner != uid and not (owner is None and uid == os.getuid()):
+                    raise PermissionError(f"store {user!r} does not belong to uid {uid}")
+                continue
+            expected, given = read_token(self.root, self.check_user(user)), (tokens or {}).get(user)
+            if not expected or not isinstance(given, str) or not hmac.compare_digest(expected, given):
+                raise PermissionError(f"missing or wrong token for store {user!r}")
+
+    def _open(self, user: str):
+        from rag import UserRAG
+
+        rag = UserRAG(
+                model_name=self.model_name,
+                embedding_model_name=self.embedding_model_name,
+                db_path=os.path.join(self.root, user),
+                text_splitter="nothing yet",
+                keep_alive=self.keep_alive,
+                embeddings=self.embeddings,
+                **self.rag_kwargs,
+            )
+        rag.store = BatchedStore(rag.store, window=self.batch_window)
+        return rag
+
+    def user(self, user: str):
+        """ The UserRAG of `user`; opening one doesn't hold up requests for the others """
+        self.check_user(user)
+        with self._lock:
+            future, opener = self._users.get(user), False
+            if future is None:
+                future, opener = Future(), True
+                self._users[user] = future
+        if opener:
+            try:
+                future.set_result(self._open(user))
+            except Exception as e:
+                with self._lock:
+                    del self._users[user]       # let the next request try again
+                future.set_exception(e)
+        return future.result()
+
+    def retrieve(
+            self,
+            user: str,
+            query: str,
+            k: int = 1,
+            federate: List[str] = None,
+        ) -> List[str]:
+        self.requests["retrieve"] += 1
+        rag = self.user(user)
+        others = [name for name in dict.fromkeys(federate or []) if name != user]
+        if not others:
+            return rag.retrieve_data(query=query, k=k)
+        from session_manager import FederatedRetriever
+        stores = {user: rag, **{name: self.user(name) for name in others}}
+        return FederatedRetriever(rag, stores).retrieve_data(query=query, k=k)
+
+    def ingest(
+            self,
+            user: str,
+            conversation: List[Dict],
+            ret: str = None,
+        ) -> Tuple[object, Dict]:
+        self.requests["ingest"] += 1
+        return self.user(user).injest_data(conversation, ret=ret, with_stats=True)
+
+    def stats(self) -> Dict:
+        from ollama_pool import pool
+
+        with self._lock:
+            opened = {user: future.result() for user, future in self._users.items() if future.done() and not future.exception()}
+        return {
+                "users": sorted(opened),
+                "requests": dict(self.requests),
+                "embedding_batches": {**self.embeddings.batcher.stats, "mean_size": self.embeddings.batcher.mean_size()},
+                "search_batches": {
+                    user: {**rag.store.batcher.stats, "mean_size": rag.store.batcher.mean_size()} for user, rag in opened.items()
+                },
+                "ollama": pool.scheduler.snapshot(),
+            }
+
+    def close(self):
+        with self._lock:
+            futures, self._users = list(self._users.values()), {}
+        for future in futures:
+            if future.done() and not future.exception():
+                future.result().close()
+
+# --------------------------------------------------------- SERVER ------------------------------------------------------------ #
+
+def make_handler(service: RAGService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            self.peer_uid = peer_uid(self.request)
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status: int, payload: Dict):
+            data = json.dumps(payload, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                # every user's counters, so only for the service's own user on the socket
+                if self.peer_uid != os.getuid():
+                    self._json(403, {"error": "stats are only served to the service's user over the unix socket"})
+                else:
+                    self._json(200, service.stats())
+            else:
+                self._json(404, {"error": f"no such endpoint {self.path}"})
+
+        def do_POST(self):
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path not in ("/retrieve", "/ingest"):
+                    self._json(404, {"error": f"no such endpoint {self.path}"})
+                    return
+                federate = body.get("federate") or []
+                if not isinstance(federate, list):
+                    raise ValueError("federate must be a list of store names")
+                service.authorize([body["user"], *federate], uid=self.peer_uid, tokens=body.get("tokens"))
+                if self.path == "/retrieve":
+                    results = service.retrieve(body["user"], body["query"], k=int(body.get("k", 1)), federate=federate)
+                    self._json(200, {"results": results})
+                else:
+                    result, stats = service.ingest(body["user"], body["conversation"], ret=body.get("ret"))
+                    self._json(200, {"result": result, "stats": stats})
+            except PermissionError as e:
+                service.requests["errors"] += 1
+                self._json(403, {"error": str(e)})
+            except (KeyError, ValueError) as e:
+                service.requests["errors"] += 1
+                self._json(400, {"error": f"bad request: {e!r}"})
+            except Exception as e:
+                service.requests["errors"] += 1
+                self._json(500, {"error": repr(e)})
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+        service: RAGService,
+        host: str = "127.0.0.1",
+        port: int = 8765,
+        socket_path: str = None,
+        socket_mode: int = 0o660,
+    ):
+    """ Threaded HTTP server on localhost, or on a unix socket (readable by the owner's group) when `socket_path` is set """
+    handler = make_handler(service)
+    if socket_path is None:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        return server
+    if os.path.exists(socket_path):
+        os.remove(socket_path)                  # left behind by a service that didn't shut down cleanly
+    server = UnixHTTPServer(socket_path, handler)
+    os.chmod(socket_path, socket_mode)
+    return server
+
+# --------------------------------------------------------- CLIENT ------------------------------------------------------------ #
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _connect(url: str, timeout: float) -> http.client.HTTPConnection:
+    """ "http://host:port" or "unix:///path/to.sock" """
+    if url.startswith("unix://"):
+        return _UnixHTTPConnection(url[len("unix://"):], timeout)
+    match = re.fullmatch(r"(?:http://)?([^:/]+)(?::(\d+))?/?", url)
+    if not match:
+        raise ValueError(f"unsupported rag service url {url!r}, expected http://host:port or unix:///path")
+    return http.client.HTTPConnection(match.group(1), int(match.group(2) or 80), timeout=timeout)
+
+
+class RemoteUserRAG:
+    """
+    Stands in for a UserRAG (`retrieve_data`, `injest_data` and their async versions) by calling the service. `db_path`
+    stays local: session logs and the ingestion queue are still kept next to the store. Keeps one connection per thread.
+    Store tokens (needed over TCP) are read from `token_root`/<user>/.rag_token, by default next to `db_path`.
+    """
+    def __init__(
+            self,
+            user: str,
+            url: str = None,
+            db_path: str = None,
+            timeout: float = 600.0,
+            token_root: str = None,
+        ):
+        self.user = RAGService.check_user(user)
+        self.url = url or os.environ[SERVICE_ENV]
+        self.db_path = db_path
+        self.timeout = timeout
+        self.token_root = token_root or (os.path.dirname(os.path.abspath(db_path)) if db_path else None)
+        self.last_ingest_stats = {}
+        self._tokens: Dict[str, str] = {}
+        self._local = threading.local()
+
+    def _with_tokens(
+            self,
+            payload: Dict,
+            users: List[str],
+        ) -> Dict:
+        if self.token_root is not None:
+            for user in users:
+                if user not in self._tokens:
+                    token = read_token(self.token_root, user)
+                    if token:
+                        self._tokens[user] = token
+            tokens = {user: self._tokens[user] for user in users if user in self._tokens}
+            if tokens:
+                payload["tokens"] = tokens
+        return payload
+
+    def _call(
+            self,
+            method: str,
+            path: str,
+            payload: Dict = None,
+            idempotent: bool = True,
+        ) -> Dict:
+        body = json.dumps(payload, ensure_ascii=False).encode() if payload is not None else None
+        for attempt in range(2):
+            connection = getattr(self._local, "connection", None)
+            reused = connection is not None
+            connection = connection or _connect(self.url, self.timeout)
+            self._local.connection = connection
+            sent = False
+            try:
+                connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+                sent = True
+                response = connection.getresponse()
+                data = json.loads(response.read() or b"{}")
+                break
+            except BaseException as exc:
+                # refused, timed out or interrupted, the connection is stuck mid-request and would raise CannotSendRequest
+                # on every later call: drop it so the next one starts fresh
+                connection.close()
+                self._local.connection = None
+                # one retry on a fresh connection when the service dropped a kept-alive one (e.g. it restarted), and for a
+                # non idempotent call (/ingest) only if the request never made it out
+                stale = reused and isinstance(exc, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+                if attempt or not stale or not (idempotent or not sent):
+                    raise
+        if response.status != 200:
+            raise RuntimeError(f"rag service {path} failed ({response.status}): {data.get('error')}")
+        return data
+
+    @tracer.traced("remote_retrieve")
+    def retrieve_data(
+            self,
+            query,
+            k,
+            federate: List[str] = None,
+        ) -> List[str]:
+        payload = {"user": self.user, "query": query, "k": k}
+        if federate:
+            payload["federate"] = list(federate)
+        return self._call("POST", "/retrieve", self._with_tokens(payload, [self.user, *(federate or [])]))["results"]
+
+    async def aretrieve_data(
+            self,
+            query,
+            k,
+            federate: List[str] = None,
+        ) -> List[str]:
+        return await asyncio.to_thread(self.retrieve_data, query, k, federate)
+
+    @tracer.traced("remote_ingest")
+    def injest_data(
+            self,
+            conversation: List,
+            ret: str = None,
+            with_stats: bool = False,
+        ):
+        payload = {"user": self.user, "conversation": conversation, "ret": ret}
+        data = self._call("POST", "/ingest", self._with_tokens(payload, [self.user]), idempotent=False)
+        self.last_ingest_stats = data["stats"]
+        return (data["result"], data["stats"]) if with_stats else data["result"]
+
+    async def ainjest_data(
+            self,
+            conversation: List,
+            ret: str = None,
+            with_stats: bool = False,
+        ):
+        return await asyncio.to_thread(self.injest_data, conversation, ret, with_stats)
+
+    def federated(self, stores: List[str]) -> "RemoteFederatedRetriever":
+        """ Searches the given users' stores as one, on the service (like session_manager.FederatedRetriever) """
+        return RemoteFederatedRetriever(self, stores)
+
+    def service_stats(self) -> Dict:
+        return self._call("GET", "/stats")
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+class RemoteFederatedRetriever:
+    def __init__(
+            self,
+            primary: RemoteUserRAG,
+            stores: List[str],
+        ):
+        self.primary = primary
+        self.stores = list(stores)
+
+    def retrieve_data(self, query, k):
+        return self.primary.retrieve_data(query, k, federate=self.stores)
+
+    async def aretrieve_data(self, query, k):
+        return await self.primary.aretrieve_data(query, k, federate=self.stores)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve retrieval and ingestion for every store under a directory")
+    parser.add_argument("--root", default="./private/", help="one store per user: <root>/<user>")
+    parser.add_argument("--socket", metavar="PATH", default=DEFAULT_SOCKET, help="unix socket to listen on (the default)")
+    parser.add_argument("--port", type=int, help="listen on TCP instead; every store then needs a token (--token)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--token", metavar="USER", help="create USER's token for TCP clients if needed, print its path and exit")
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--embedding-model", default="embeddinggemma:300m")
+    parser.add_argument("--keep-alive", type=int, default=30 * 60, help="seconds ollama keeps each model loaded")
+    parser.add_argument("--max-loaded", type=int, default=1, help="models the ollama host keeps loaded at once")
+    parser.add_argument("--batch-window-ms", type=float, default=5.0, help="how long embeddings and searches wait for company")
+    args = parser.parse_args()
+    if args.token:
+        issue_token(args.root, args.token)
+        print(os.path.join(args.root, args.token, TOKEN_FILE))
+        raise SystemExit(0)
+    socket_path = None if args.port is not None else args.socket
+
+    from ollama_pool import pool
+    pool.configure(keep_alive=args.keep_alive, max_loaded=args.max_loaded, limits={args.model: 4, args.embedding_model: 2})
+    tracer.configure(jsonl_path=os.path.join(args.root, "rag_service_traces.jsonl"))
+
+    service = RAGService(args.root, args.model, args.embedding_model, keep_alive=args.keep_alive, batch_window=args.batch_window_ms / 1000)
+    server = make_server(service, args.host, args.port, socket_path=socket_path)
+    print(f"rag service on {f'unix://{socket_path}' if socket_path else f'http://{args.host}:{args.port}'}, stores under {args.root}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -1,4 +1,9 @@
-from typing import List, Dict
+from typing import List, Dict, Awaitable
+import asyncio
+import hashlib
+import re
+
+import numpy as np
 
 # ------------------------------------------------------------------------------------------------------------------------------ #
 
@@ -15,3 +20,44 @@ def format_conversation(conversation: List):
         
     return formatted_conversation.strip() 
 
+def estimate_tokens(messages: List[Dict]) -> int:
+    """ Rough token count of chat messages (~4 characters per token plus a little per-message overhead) """
+    return sum(len(message["content"]) // 4 + 4 for message in messages)
+
+def normalize_text(text: str) -> str:
+    """ Lowercases and strips punctuation/extra whitespace so trivially different strings compare equal """
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+def text_hash(text: str) -> str:
+    """
+    Content hash of the text with surrounding whitespace trimmed, used to spot exact duplicates. Not normalized: "uses C++"
+    and "uses C#" are different facts, near-duplicates are left to the embedding distance and the decision model
+    """
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+question_words = {"what", "when", "where", "who", "whom", "whose", "why", "how", "which", "is", "are", "do", "does", "did", "can", "should"}
+
+def is_keyword_query(query: str, max_words: int = 3) -> bool:
+    """ True for short keyword-style queries (e.g. 'RTX 3090') where decomposing them adds latency and no recall """
+    words = normalize_text(query).split()
+    return 0 < len(words) <= max_words and "?" not in query and words[0] not in question_words
+
+async def gather_bounded(awaitables: List[Awaitable], limit: int) -> List:
+    """ asyncio.gather with at most `limit` awaitables running at once, results keep the input order """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable):
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(*(run(awaitable) for awaitable in awaitables))
+
+def cosine_similarity_matrix(a, b) -> np.ndarray:
+    """ Pairwise cosine similarity between the rows of `a` and the rows of `b` """
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return a @ b.T
+
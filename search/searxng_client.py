@@ -0,0 +1,282 @@
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import Dict, List, Optional
+import asyncio
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tracing import tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class SearchCache:
+    """ SQLite key/value cache with a TTL, shared by search results and fetched pages """
+    def __init__(
+            self,
+            path: str,
+            ttl_seconds: float = 3600.0,
+            max_entries: int = 5000,
+        ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key=?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)", (key, json.dumps(value), time.time()))
+            # expired rows go first, then the oldest ones past max_entries
+            self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+            self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class _TextExtractor(HTMLParser):
+    """ Visible text of an HTML page, without scripts, styles and page chrome """
+    skipped_tags = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "svg", "template"}
+    block_tags = {"p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6", "tr", "section", "article", "pre", "blockquote"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.title = ""
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.skipped_tags:
+            self._skip_depth += 1
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.block_tags:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.skipped_tags and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        elif not self._skip_depth:
+            self.parts.append(data)
+
+    def text(self) -> str:
+        lines = (" ".join(line.split()) for line in "".join(self.parts).splitlines())
+        return "\n".join(line for line in lines if line)
+
+def extract_text(html: str, max_chars: int = 4000) -> Dict[str, str]:
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        pass                                    # broken markup, keep whatever was parsed
+    return {"title": " ".join(parser.title.split()), "text": parser.text()[:max_chars]}
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class SearxngClient:
+    """
+    Client for a SearxNG instance's JSON API (`/search?format=json`).
+    One pooled `requests.Session` (keep-alive, retries on 5xx) is shared by every call, results and fetched pages are
+    cached on disk for `cache_ttl` seconds, and several queries or pages run concurrently with at most `max_concurrency`
+    requests in flight.
+    """
+    def __init__(
+            self,
+            base_url: str = None,
+            timeout: float = 10.0,
+            cache_path: str = "./private/search_cache.sqlite3",
+            cache_ttl: float = 3600.0,
+            max_concurrency: int = 4,
+            max_page_chars: int = 4000,
+            max_page_bytes: int = None,
+        ):
+        self.base_url = (base_url or os.environ.get("SEARXNG_URL", "http://localhost:8080")).rstrip("/")
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_page_chars = max_page_chars
+        # pages are read only this far, markup and inline scripts come first so it is well above the kept text
+        self.max_page_bytes = max_page_bytes or max_page_chars * 64
+        self.cache = SearchCache(cache_path, ttl_seconds=cache_ttl) if cache_path else None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+                pool_connections=max_concurrency,
+                pool_maxsize=max_concurrency * 2,
+                max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",)),
+            )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = "re-chat/1.0 (+local assistant)"
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="searxng")
+
+    @staticmethod
+    def _key(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def _cached(self, key: str, compute):
+        value = self.cache.get(key) if self.cache else None
+        if value is None:
+            value = compute()
+            if self.cache and not (isinstance(value, dict) and value.get("error")):    # failed fetches are retried next time
+                self.cache.put(key, value)
+        return value
+
+    @tracer.traced("web_search")
+    def search(
+            self,
+            query: str,
+            max_results: int = 5,
+            categories: str = None,
+            language: str = None,
+        ) -> List[Dict]:
+        """ Top results as {title, url, content, engine} dicts """
+        params = {"q": query, "format": "json"}
+        if categories:
+            params["categories"] = categories
+        if language:
+            params["language"] = language
+
+        def fetch():
+            response = self.session.get(f"{self.base_url}/search", params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return [
+                    {"title": result.get("title", ""), "url": result.get("url", ""), "content": result.get("content", ""),
+                     "engine": result.get("engine", "")}
+                    for result in response.json().get("results", [])
+                ]
+
+        return self._cached(self._key("search", params), fetch)[:max_results]
+
+    @tracer.traced("fetch_page")
+    def fetch_page(self, url: str) -> Optional[Dict[str, str]]:
+        """ Title and extracted text of a result page, None if it could not be fetched or is not HTML/text """
+        def fetch():
+            try:
+                with self.session.get(url, timeout=self.timeout, stream=True) as response:
+                    response.raise_for_status()
+                    # decided from the headers, a PDF or a video is never downloaded
+                    content_type = response.headers.get("Content-Type", "")
+                    if "html" not in content_type and not content_type.startswith("text/"):
+                        return {"title": "", "text": "", "error": True}
+                    body = bytearray()
+                    for chunk in response.iter_content(chunk_size=16384):
+                        body += chunk
+                        if len(body) >= self.max_page_bytes:
+                            break
+                    text = bytes(body[:self.max_page_bytes]).decode(response.encoding or "utf-8", errors="replace")
+            except (requests.RequestException, LookupError):        # LookupError: a charset python doesn't know
+                return {"title": "", "text": "", "error": True}
+            if "html" in content_type:
+                return extract_text(text, self.max_page_chars)
+            return {"title": "", "text": text[:self.max_page_chars]}
+
+        page = self._cached(self._key("page", url, self.max_page_chars), fetch)
+        return None if page.get("error") else page
+
+    def _run_all(self, fn, items: List) -> List:
+        # each call runs in a copy of the caller's context so its spans nest under the caller's
+        futures = [self._executor.submit(contextvars.copy_context().run, fn, item) for item in items]
+        return [future.result() for future in futures]
+
+    def search_many(
+            self,
+            queries: List[str],
+            max_results: int = 5,
+        ) -> List[List[Dict]]:
+        return self._run_all(lambda query: self.search(query, max_results=max_results), queries)
+
+    def fetch_pages(self, urls: List[str]) -> List[Optional[Dict[str, str]]]:
+        return self._run_all(self.fetch_page, urls)
+
+    def search_and_read(
+            self,
+            query: str,
+            max_results: int = 3,
+        ) -> List[Dict]:
+        """ Search results with the text of their pages fetched in parallel (under `page`) """
+        results = self.search(query, max_results=max_results)
+        for result, page in zip(results, self.fetch_pages([result["url"] for result in results])):
+            result["page"] = page
+        return results
+
+    # ------------------------------------------------------ ASYNC API ------------------------------------------------------- #
+
+    async def asearch(self, query: str, max_results: int = 5) -> List[Dict]:
+        return await asyncio.to_thread(self.search, query, max_results)
+
+    async def asearch_many(self, queries: List[str], max_results: int = 5) -> List[List[Dict]]:
+        from rag_utils import gather_bounded
+
+        return await gather_bounded([self.asearch(query, max_results) for query in queries], limit=self.max_concurrency)
+
+    async def afetch_pages(self, urls: List[str]) -> List[Optional[Dict[str, str]]]:
+        from rag_utils import gather_bounded
+
+        return await gather_bounded([asyncio.to_thread(self.fetch_page, url) for url in urls], limit=self.max_concurrency)
+
+    async def asearch_and_read(self, query: str, max_results: int = 3) -> List[Dict]:
+        results = await self.asearch(query, max_results)
+        for result, page in zip(results, await self.afetch_pages([result["url"] for result in results])):
+            result["page"] = page
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+        if self.cache:
+            self.cache.close()
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def format_results(results: List[Dict], max_chars: int = 1500) -> str:
+    """ Compact text for the agent: one numbered block per result, page text trimmed to `max_chars` """
+    if not results:
+        return "No web results found."
+    blocks = []
+    for idx, result in enumerate(results, 1):
+        block = f"[{idx}] {result['title']}\n{result['url']}\n{result['content']}"
+        page = result.get("page")
+        if page and page.get("text"):
+            block += f"\n---\n{page['text'][:max_chars]}"
+        blocks.append(block.strip())
+    return "\n\n".join(blocks)
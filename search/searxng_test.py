@@ -1,8 +1,148 @@
-import requests
+"""
+Local stand-in for a SearxNG instance plus a smoke run of SearxngClient against it (or against a real instance with --live).
+The stand-in serves `/search?format=json` with deterministic results and the result pages themselves, each with
+configurable latency, so pooling, caching and concurrency can be checked offline:
 
-def search(query):
-    url = "http://localhost:8080/search"
-    params = {"q": query, "format": "json"}
-    return requests.get(url, params=params).json()
+    python search/searxng_test.py
+    python search/searxng_test.py --live "delhi air quality diwali"
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-print(search("delhi air quality diwali"))
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+import argparse
+import json
+import tempfile
+import threading
+import time
+
+from search.searxng_client import SearxngClient, format_results
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class FakeSearxng:
+    def __init__(
+            self,
+            search_latency: float = 0.0,
+            page_latency: float = 0.0,
+            host: str = "127.0.0.1",
+            port: int = 0,
+        ):
+        self.search_latency = search_latency
+        self.page_latency = page_latency
+        self.calls = Counter()              # "search", "page"
+        self.connections = set()            # client ports seen, shows whether keep-alive connections get reused
+        self._lock = threading.Lock()
+
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with fake._lock:
+                    fake.connections.add(self.client_address[1])
+                url = urlparse(self.path)
+                if url.path == "/search":
+                    fake._count("search")
+                    time.sleep(fake.search_latency)
+                    query = parse_qs(url.query).get("q", [""])[0]
+                    self._send(json.dumps({"query": query, "results": fake.results(query)}), "application/json")
+                elif url.path.startswith("/page/"):
+                    fake._count("page")
+                    time.sleep(fake.page_latency)
+                    self._send(fake.page(url.path.rsplit("/", 1)[-1]), "text/html; charset=utf-8")
+                else:
+                    self.send_error(404)
+
+            def _send(self, body: str, content_type: str):
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, kind: str):
+        with self._lock:
+            self.calls[kind] += 1
+
+    def results(self, query: str):
+        slug = "-".join(query.lower().split()) or "empty"
+        return [
+                {"title": f"{query} - result {idx}", "url": f"{self.url}/page/{slug}-{idx}",
+                 "content": f"Snippet {idx} about {query}.", "engine": "fake"}
+                for idx in range(1, 9)
+            ]
+
+    def page(self, slug: str) -> str:
+        return (f"<html><head><title>{slug}</title><style>body{{color:red}}</style></head><body><nav>menu</nav>"
+                f"<h1>{slug}</h1><p>Everything about {slug.replace('-', ' ')}.</p><script>track()</script></body></html>")
+
+    def start(self) -> "FakeSearxng":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def smoke_run(latency: float):
+    server = FakeSearxng(search_latency=latency, page_latency=latency).start()
+    client = SearxngClient(base_url=server.url, cache_path=os.path.join(tempfile.mkdtemp(), "search_cache.sqlite3"))
+    queries = ["delhi air quality diwali", "rtx 3090 benchmarks", "esp32 deep sleep", "elgar cello concerto"]
+    try:
+        # the one-at-a-time baseline goes through an uncached client, so the concurrent run below still misses
+        baseline = SearxngClient(base_url=server.url, cache_path=None)
+        start = time.perf_counter()
+        for query in queries:
+            baseline.search(query)
+        sequential = time.perf_counter() - start
+        baseline.close()
+
+        start = time.perf_counter()
+        client.search_many(queries)
+        concurrent = time.perf_counter() - start
+
+        start = time.perf_counter()
+        client.search_many(queries)
+        cached = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = client.search_and_read(queries[0], max_results=3)
+        read = time.perf_counter() - start
+
+        print(f"{len(queries)} queries   sequential {sequential*1000:.0f}ms · concurrent {concurrent*1000:.0f}ms · cached {cached*1000:.1f}ms")
+        print(f"search + 3 pages {read*1000:.0f}ms")
+        print(f"server calls {dict(server.calls)}, connections opened {len(server.connections)}, cache {client.cache.stats()}")
+        print("\n" + format_results(results, max_chars=200))
+    finally:
+        client.close()
+        server.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exercise SearxngClient against a local stand-in (or a real instance)")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds the stand-in waits per request")
+    parser.add_argument("--live", metavar="QUERY", help="query the instance at $SEARXNG_URL / localhost:8080 instead")
+    args = parser.parse_args()
+
+    if args.live:
+        client = SearxngClient(cache_path=None)
+        print(format_results(client.search_and_read(args.live)))
+    else:
+        smoke_run(args.latency)
@@ -0,0 +1,297 @@
+"""
+Append-only log of every chat turn, one JSONL file per session under <db_path>/sessions/.
+Lines are written and flushed as they come and fsynced in batches, so a crash or a killed terminal loses at most the
+last unsynced batch on power loss and nothing on a plain process kill. A cleanly ended session gets a close marker;
+the latest session without one is picked up again on the next start, reading only its tail.
+
+    python session_log.py "./private/chroma_db[main]"              # list sessions
+    python session_log.py "./private/chroma_db[main]" --show 20     # last 20 messages of the latest one
+"""
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+try:
+    import fcntl
+except ImportError:                             # no flock on Windows, logs are not guarded against a second instance there
+    fcntl = None
+
+# a process can start several logs within one second (a session closed and reopened, several databases), the counter
+# keeps their names apart and in start order
+_log_numbers = itertools.count()
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def sessions_dir(db_path: str) -> str:
+    return os.path.join(db_path, "sessions")
+
+def list_sessions(db_path: str) -> List[str]:
+    """ Session log paths, oldest first (names sort by start time) """
+    directory = sessions_dir(db_path)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.endswith(".jsonl")]
+
+def is_held(path: str) -> bool:
+    """ True while a SessionLog (of this or another running process) has the file open """
+    if fcntl is None:
+        return False
+    try:
+        with open(path, "rb") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except FileNotFoundError:
+        return False
+    return False
+
+def resumable_session(
+        db_path: str,
+        skip: Set[str] = frozenset(),
+    ) -> Optional[str]:
+    """
+    The latest session log nobody holds if it was never closed (the app crashed or was killed), None otherwise.
+    Logs another running instance is still writing are passed over.
+    """
+    for path in reversed(list_sessions(db_path)):
+        if path in skip or is_held(path):
+            continue
+        return None if SessionLogReader(path).is_closed() else path
+    return None
+
+def open_session_log(db_path: str, **kwargs) -> Tuple["SessionLog", bool]:
+    """ Continues the resumable session if there is one, else starts a new log; the flag tells whether it resumed """
+    skip = set()
+    while True:
+        path = resumable_session(db_path, skip)
+        if path is None:
+            return SessionLog(db_path, **kwargs), False
+        try:
+            return SessionLog(db_path, path=path, **kwargs), True
+        except (BlockingIOError, ValueError):   # another instance got to it first
+            skip.add(path)
+
+
+class SessionLog:
+    """
+    Writer side. `append` writes and flushes one line per message; fsync runs once `fsync_every` lines are pending or
+    `fsync_interval` seconds after the first pending one, whichever comes first. Opening an existing path continues it.
+    The file is flocked while open, so two processes never write the same log (BlockingIOError if it is held).
+    """
+    def __init__(
+            self,
+            db_path: str,
+            path: str = None,
+            fsync_every: int = 8,
+            fsync_interval: float = 2.0,
+        ):
+        os.makedirs(sessions_dir(db_path), exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{next(_log_numbers):04d}.jsonl"
+        self.path = path or os.path.join(sessions_dir(db_path), name)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._timer: Optional[threading.Timer] = None
+        resuming = os.path.exists(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._lock_file()
+        if resuming:
+            if SessionLogReader(self.path).is_closed():
+                self._file.close()
+                raise ValueError(f"session log {self.path} is closed")
+            self._drop_torn_tail()
+        self.count = SessionLogReader(self.path).count_messages() if resuming else 0
+        if not resuming:
+            self._write({"session": os.path.basename(self.path)[:-len(".jsonl")], "started_at": time.time()})
+            self.sync()
+
+    def _lock_file(self):
+        # held until the file is closed; taken before the tail is touched, the holder may still be writing it
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise BlockingIOError(f"session log {self.path} is held by another process") from None
+
+    def _drop_torn_tail(self):
+        # a write cut short by a crash leaves a line without its newline, nothing after it can be trusted
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                return
+            block = min(size, 1 << 16)
+            f.seek(size - block)
+            tail = f.read(block)
+            f.truncate(size - block + tail.rfind(b"\n") + 1 if b"\n" in tail else 0)
+
+    def _write(self, record: Dict):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def append(self, role: str, content: str):
+        with self._lock:
+            if self.closed:
+                raise ValueError(f"session log {self.path} is closed")
+            self._write({"i": self.count, "role": role, "content": content, "at": time.time()})
+            self.count += 1
+            self._pending += 1
+            if self._pending >= self.fsync_every:
+                self._sync_locked()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync_locked(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._file.closed:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def sync(self):
+        with self._lock:
+            self._sync_locked()
+
+    def _discard_if_empty(self):
+        # a session nobody typed in leaves no file behind
+        if self.count == 0:
+            os.remove(self.path)
+
+    def release(self):
+        """ Syncs and closes the file without ending the session, it is resumed on the next start """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._sync_locked()
+            self._file.close()
+            self._discard_if_empty()
+
+    def close(self, ingest_job: int = None):
+        """ Ends the session: a close marker (with the ingestion job that covers it, if any) keeps it from being resumed """
+        with self._lock:
+            if self.closed or self._file.closed:
+                return
+            self.closed = True
+            if self.count == 0:
+                self._sync_locked()
+                self._file.close()
+                self._discard_if_empty()
+                return
+            self._write({"closed": True, "at": time.time(), "messages": self.count, "ingest_job": ingest_job})
+            self._sync_locked()
+            self._file.close()
+
+
+class SessionLogReader:
+    """
+    Reader side, working backwards from the end of the file so resuming a long session only touches its tail.
+    Cursors are byte offsets: `page(cursor, n)` returns up to `n` messages that end before `cursor`, oldest first, plus the
+    cursor to ask for the page before those (0 once the start of the log is reached).
+    """
+    def __init__(self, path: str, block_size: int = 1 << 16):
+        self.path = path
+        self.block_size = block_size
+
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def _lines_before(
+            self,
+            cursor: int,
+            n: int,
+        ) -> Tuple[List[bytes], int]:
+        """ Up to `n` complete lines ending at or before `cursor` (newest last) and where the first of them starts """
+        with open(self.path, "rb") as f:
+            end, buffer = cursor, b""
+            while end > 0 and buffer.count(b"\n") <= n:
+                start = max(0, end - self.block_size)
+                f.seek(start)
+                buffer = f.read(end - start) + buffer
+                end = start
+        pieces = buffer.split(b"\n")
+        torn = len(pieces.pop())                # anything after the last newline is an unfinished write
+        if end > 0:
+            pieces = pieces[1:]                 # may have been cut at the block boundary
+        lines = pieces[-n:] if n else []
+        return lines, cursor - torn - sum(len(line) + 1 for line in lines)
+
+    @staticmethod
+    def _parse(line: bytes) -> Optional[Dict]:
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None                         # torn last line of a crashed session
+
+    def page(
+            self,
+            cursor: int = None,
+            n: int = 50,
+        ) -> Tuple[List[Dict], int]:
+        cursor = self.size() if cursor is None else cursor
+        messages = []
+        while cursor > 0 and len(messages) < n:
+            lines, cursor = self._lines_before(cursor, n - len(messages))
+            if not lines:
+                break
+            records = [self._parse(line) for line in lines]
+            messages[:0] = [{"role": r["role"], "content": r["content"]} for r in records if r and "role" in r]
+        return messages, cursor
+
+    def tail(self, n: int = 50) -> Tuple[List[Dict], int]:
+        return self.page(None, n)
+
+    def last_record(self) -> Optional[Dict]:
+        lines, _ = self._lines_before(self.size(), 1)
+        return self._parse(lines[-1]) if lines else None
+
+    def is_closed(self) -> bool:
+        last = self.last_record()
+        return bool(last and last.get("closed"))
+
+    def count_messages(self) -> int:
+        last = self.last_record()
+        if last and "i" in last:
+            return last["i"] + 1
+        if last and last.get("closed"):
+            return last["messages"]
+        return len(self.messages())
+
+    def messages(self) -> List[Dict]:
+        """ The whole conversation, for ingestion """
+        with open(self.path, "rb") as f:
+            records = [self._parse(line) for line in f]
+        return [{"role": r["role"], "content": r["content"]} for r in records if r and "role" in r]
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect the session logs of a database")
+    parser.add_argument("db_path", help="e.g. ./private/chroma_db[main]")
+    parser.add_argument("--show", type=int, metavar="N", help="print the last N messages of the latest session")
+    args = parser.parse_args()
+
+    paths = list_sessions(args.db_path)
+    if args.show:
+        if paths:
+            for message in SessionLogReader(paths[-1]).tail(args.show)[0]:
+                print(f"{message['role'].upper()}: {message['content']}\n")
+    else:
+        for path in paths:
+            reader = SessionLogReader(path)
+            last = reader.last_record() or {}
+            status = f"closed, ingest job {last.get('ingest_job')}" if last.get("closed") else "open"
+            print(f"{os.path.basename(path)}  {reader.count_messages()} messages  {reader.size() / 1024:.1f}KB  {status}")
@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import contextvars
+import threading
+
+from ingest_queue import IngestQueue, IngestWorker
+from session_log import SessionLog, SessionLogReader, open_session_log
+from tracing import tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class ChatSession:
+    """
+    Everything that belongs to one opened database: its UserRAG, chat agent, conversation and ingestion worker.
+    `retriever` is what the chat agent's tool searches, the session's own UserRAG or a `FederatedRetriever` on top of it.
+    """
+    def __init__(
+            self,
+            db_name: str,
+            db_path: str,
+            rag_system,
+            chat_agent=None,
+            context=None,
+        ):
+        self.db_name = db_name
+        self.db_path = db_path
+        self.rag_system = rag_system
+        self.chat_agent = chat_agent
+        self.context = context
+        self.retriever = rag_system
+        self.federated_with: List[str] = []
+        self.ingest_queue: Optional[IngestQueue] = None
+        self.ingest_worker: Optional[IngestWorker] = None
+        self.prefetcher = None                  # MemoryPrefetcher over `retriever` when speculative prefetch is on
+        self.session_log: Optional[SessionLog] = None
+        self.history_start = 0                  # byte offset in the log of the first message loaded on resume
+        self.resumed = 0                        # messages loaded from a session that was cut short
+
+    def open_log(self, tail: int = 40) -> int:
+        """
+        Opens the session log, continuing the latest one if the app went down without closing it. Only its last `tail`
+        messages are loaded into the conversation; returns how many.
+        """
+        self.session_log, resumed = open_session_log(self.db_path)
+        if not resumed:
+            return 0
+        messages, self.history_start = SessionLogReader(self.session_log.path).tail(tail)
+        for message in messages:
+            self.context.append(message["role"], message["content"])
+        self.resumed = len(messages)
+        return self.resumed
+
+    def older_messages(
+            self,
+            cursor: int,
+            n: int = 50,
+        ) -> Tuple[List[Dict], int]:
+        """ Up to `n` logged messages before `cursor` (start with `history_start`), oldest first, and the next cursor """
+        if self.session_log is None or cursor <= 0:
+            return [], 0
+        return SessionLogReader(self.session_log.path).page(cursor, n)
+
+    def record(self, role: str, content: str):
+        """ Adds a message to the conversation and the session log """
+        self.context.append(role, content)
+        if self.session_log is not None:
+            self.session_log.append(role, content)
+
+    def end_log(self, ingest: bool) -> Optional[int]:
+        """ Closes the session for good, queueing its log for ingestion first if asked to; returns the job id """
+        if self.session_log is None or self.session_log.closed:
+            return None
+        job_id = None
+        if ingest and self.session_log.count:
+            queue = self.ingest_queue or IngestQueue(self.db_path)
+            job_id = queue.enqueue_log(self.session_log.path)
+            if queue is not self.ingest_queue:
+                queue.close()
+        self.session_log.close(ingest_job=job_id)
+        return job_id
+
+    def set_retriever(self, retriever):
+        """ Swaps what the chat agent's tool searches, the prefetcher follows """
+        self.retriever = retriever
+        if self.prefetcher is not None:
+            self.prefetcher.retriever = retriever
+
+    def start_ingest(self, on_progress: Callable[[Dict], None] = None):
+        """ Starts draining this database's ingestion queue, once """
+        if self.ingest_worker is None:
+            self.ingest_queue = IngestQueue(self.db_path)
+            self.ingest_worker = IngestWorker(self.ingest_queue, self.rag_system, on_progress=on_progress)
+            self.ingest_worker.start()
+
+    def close(self):
+        """ Stops the worker and releases the store; a job in flight finishes first, on a background thread """
+        worker, queue = self.ingest_worker, self.ingest_queue
+
+        def shutdown():
+            if worker is not None:
+                worker.stop()
+                worker.join()
+                queue.close()
+            self.rag_system.close()
+
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        if self.session_log is not None:
+            self.session_log.release()      # not ended, the next start picks it up again
+        threading.Thread(target=shutdown, name=f"close-{self.db_name}", daemon=True).start()
+
+
+class SessionPool:
+    """
+    LRU pool of opened sessions, so switching databases does not rebuild the UserRAG and agents.
+    `open_session(name)` must return a Future of a `ChatSession` (opening runs in the background). Past `capacity` the
+    least recently used session that is not pinned gets closed, after `on_evict` had a look at it.
+    """
+    def __init__(
+            self,
+            open_session: Callable[[str], Future],
+            capacity: int = 3,
+            on_evict: Callable[[ChatSession], None] = None,
+        ):
+        self.open_session = open_session
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self.pinned = set()                     # e.g. the active database and the ones federated with it
+        self._futures: "OrderedDict[str, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Future:
+        """ Future of the session for `name`, opening it if needed; marks it most recently used """
+        with self._lock:
+            if name in self._futures:
+                self._futures.move_to_end(name)
+                return self._futures[name]
+            future = self._futures[name] = self.open_session(name)
+            evicted = self._evict(keep=name)
+
+        for old in evicted:
+            old.add_done_callback(self._close_evicted)
+        return future
+
+    def _evict(self, keep: str) -> List[Future]:
+        evicted = []
+        for name in list(self._futures):
+            if len(self._futures) <= self.capacity:
+                break
+            if name != keep and name not in self.pinned:
+                evicted.append(self._futures.pop(name))
+        return evicted
+
+    def _close_evicted(self, future: Future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        session = future.result()
+        if self.on_evict:
+            try:
+                self.on_evict(session)
+            except Exception:
+                pass
+        session.close()
+
+    def discard(self, name: str):
+        """ Forgets a session that failed to open, so the next `get` retries """
+        with self._lock:
+            self._futures.pop(name, None)
+
+    def open_sessions(self) -> List[ChatSession]:
+        """ Sessions that finished opening, least recently used first """
+        with self._lock:
+            futures = list(self._futures.values())
+        return [future.result() for future in futures if future.done() and future.exception() is None]
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._futures
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class FederatedRetriever:
+    """
+    Searches several memory stores as one. The query is decomposed and embedded once (by `primary`), every store is
+    searched concurrently with those vectors, and the per-store rankings of each sub-query are merged with
+    reciprocal-rank fusion. Hits are prefixed with the name of the store they came from.
+    Drop-in for `UserRAG.retrieve_data` / `aretrieve_data`; all stores must share the embedding model.
+    """
+    def __init__(
+            self,
+            primary,
+            stores: Dict[str, object],
+            max_concurrency: int = 4,
+        ):
+        models = {rag.embeddings.model_name for rag in stores.values()} | {primary.embeddings.model_name}
+        if len(models) > 1:
+            raise ValueError(f"federated stores use different embedding models: {sorted(models)}")
+        self.primary = primary
+        self.stores = stores                    # store name -> UserRAG, normally including the primary one
+        self.max_concurrency = max_concurrency
+
+    def _merge(
+            self,
+            per_store: List[List[List]],
+            k: int,
+        ) -> List[str]:
+        from bm25 import reciprocal_rank_fusion     # numpy-backed, kept out of the TUI's startup imports
+
+        tagged = [
+                [[hit._replace(text=f"[{name}] {hit.text}") for hit in hits] for hits in store_results]
+                for name, store_results in zip(self.stores, per_store)
+            ]
+        merged = [reciprocal_rank_fusion(list(rankings), k=k) for rankings in zip(*tagged)]
+        return self.primary._stitch_hits(merged)
+
+    @tracer.traced("federated")
+    def retrieve_data(
+            self,
+            query,
+            k,
+        ):
+        sub_queries = list(dict.fromkeys(self.primary.decompose_query(query)))
+        if not sub_queries:
+            return []
+
+        query_vectors = self.primary.embeddings.embed_documents(sub_queries)
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            # each search runs in a copy of the caller's context so its spans nest under this one
+            futures = [
+                    pool.submit(contextvars.copy_context().run, rag.search_sub_queries, sub_queries, query_vectors, k)
+                    for rag in self.stores.values()
+                ]
+            per_store = [future.result() for future in futures]
+        return self._merge(per_store, k)
+
+    @tracer.traced("federated")
+    async def aretrieve_data(
+            self,
+            query,
+            k,
+        ):
+        sub_queries = list(dict.fromkeys(await self.primary.adecompose_query(query)))
+        if not sub_queries:
+            return []
+
+        from rag_utils import gather_bounded
+
+        query_vectors = await self.primary.embeddings.aembed_documents(sub_queries)
+        per_store = await gather_bounded(
+                [asyncio.to_thread(rag.search_sub_queries, sub_queries, query_vectors, k) for rag in self.stores.values()],
+                limit=self.max_concurrency,
+            )
+        return self._merge(per_store, k)
@@ -0,0 +1,53 @@
+from contextlib import contextmanager
+from typing import Dict
+import json
+import os
+import threading
+import time
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class StartupTimer:
+    """
+    Records how long each cold-start phase takes, so startup regressions show up.
+    `mark` stamps a point in time relative to process start, `phase` times a block; both are thread safe since most
+    of the startup work happens in background threads.
+    """
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.marks = {}                 # name -> seconds since start
+        self.phases = {}                # name -> seconds spent
+        self._lock = threading.Lock()
+
+    def mark(self, name: str):
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self.started_at)
+
+    @contextmanager
+    def phase(self, name: str):
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = time.perf_counter() - phase_start
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                    "timestamp": time.time(),
+                    "marks": {name: round(value, 4) for name, value in self.marks.items()},
+                    "phases": {name: round(value, 4) for name, value in self.phases.items()},
+                }
+
+    def report(self) -> str:
+        data = self.as_dict()
+        marks = " · ".join(f"{name} {value:.2f}s" for name, value in sorted(data["marks"].items(), key=lambda item: item[1]))
+        phases = " · ".join(f"{name} {value:.2f}s" for name, value in data["phases"].items())
+        return f"{marks}\n{phases}" if phases else marks
+
+    def save(self, path: str):
+        """ Appends this run as one JSON line, the file is the history to compare cold starts against """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(self.as_dict()) + "\n")
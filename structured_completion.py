@@ -0,0 +1,162 @@
+from typing import Dict, Generic, List, Type, TypeVar
+import json
+
+from langchain_ollama import ChatOllama
+from pydantic import BaseModel, ValidationError
+
+from ollama_pool import pool
+from rag_utils import gather_bounded
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+Schema = TypeVar("Schema", bound=BaseModel)
+
+class StructuredCompletion(Generic[Schema]):
+    """
+    One chat call constrained to `schema`'s JSON schema (Ollama's `format`), parsed into the Pydantic model.
+    No agent graph and no tool round trip; a reply that still fails validation is shown back to the model with the error,
+    at most `max_retries` times, before a ValueError is raised.
+    """
+    def __init__(
+            self,
+            model_name: str,
+            schema: Type[Schema],
+            keep_alive: int = None,
+            max_retries: int = 2,
+        ):
+        self.schema = schema
+        self.max_retries = max_retries
+        self.llm = ChatOllama(model=model_name, format=schema.model_json_schema(), keep_alive=keep_alive, **pool.client_kwargs())
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+
+    def _parse(self, content: str) -> Schema:
+        return self.schema.model_validate(json.loads(content))
+
+    def _retry_messages(
+            self,
+            messages: List[Dict],
+            content: str,
+            error: Exception,
+        ) -> List[Dict]:
+        return messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": f"That reply is not valid JSON for the schema ({error}). Return ONLY the corrected JSON."},
+            ]
+
+    def _validated(
+            self,
+            messages: List[Dict],
+            content: str,
+        ) -> Schema:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._parse(content)
+            except (json.JSONDecodeError, ValidationError) as e:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise ValueError(f"no valid {self.schema.__name__} after {attempt + 1} attempts: {e}") from e
+                messages = self._retry_messages(messages, content, e)
+                self.stats["calls"] += 1
+                self.stats["retries"] += 1
+                content = self.llm.invoke(messages).content
+
+    async def _avalidated(
+            self,
+            messages: List[Dict],
+            content: str,
+        ) -> Schema:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._parse(content)
+            except (json.JSONDecodeError, ValidationError) as e:
+                if attempt == self.max_retries:
+                    self.stats["failures"] += 1
+                    raise ValueError(f"no valid {self.schema.__name__} after {attempt + 1} attempts: {e}") from e
+                messages = self._retry_messages(messages, content, e)
+                self.stats["calls"] += 1
+                self.stats["retries"] += 1
+                content = (await self.llm.ainvoke(messages)).content
+
+    def invoke(self, messages: List[Dict]) -> Schema:
+        self.stats["calls"] += 1
+        return self._validated(messages, self.llm.invoke(messages).content)
+
+    async def ainvoke(self, messages: List[Dict]) -> Schema:
+        self.stats["calls"] += 1
+        return await self._avalidated(messages, (await self.llm.ainvoke(messages)).content)
+
+    def batch(
+            self,
+            inputs: List[List[Dict]],
+            max_concurrency: int = 4,
+        ) -> List[Schema]:
+        """ First attempts go out as one concurrent batch, only replies that fail validation are retried, one by one """
+        self.stats["calls"] += len(inputs)
+        replies = self.llm.batch(inputs, config={"max_concurrency": max_concurrency})
+        return [self._validated(messages, reply.content) for messages, reply in zip(inputs, replies)]
+
+    async def abatch(
+            self,
+            inputs: List[List[Dict]],
+            max_concurrency: int = 4,
+        ) -> List[Schema]:
+        return await gather_bounded([self.ainvoke(messages) for messages in inputs], limit=max_concurrency)
+
+
+class AgentCompletion:
+    """
+    The previous path, a `create_agent` graph with `response_format=schema`, behind the same interface as
+    `StructuredCompletion` so the two can be benchmarked against each other.
+    """
+    def __init__(
+            self,
+            model_name: str,
+            schema: Type[BaseModel],
+            keep_alive: int = None,
+            json_mode: bool = False,
+        ):
+        from langchain.agents import create_agent
+
+        self.schema = schema
+        llm = ChatOllama(model=model_name, format="json" if json_mode else None, keep_alive=keep_alive, **pool.client_kwargs())
+        self.agent = create_agent(llm, response_format=schema)
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+
+    def invoke(self, messages: List[Dict]) -> BaseModel:
+        self.stats["calls"] += 1
+        return self.agent.invoke({"messages": messages})["structured_response"]
+
+    async def ainvoke(self, messages: List[Dict]) -> BaseModel:
+        self.stats["calls"] += 1
+        return (await self.agent.ainvoke({"messages": messages}))["structured_response"]
+
+    def batch(
+            self,
+            inputs: List[List[Dict]],
+            max_concurrency: int = 4,
+        ) -> List[BaseModel]:
+        self.stats["calls"] += len(inputs)
+        responses = self.agent.batch([{"messages": messages} for messages in inputs], config={"max_concurrency": max_concurrency})
+        return [response["structured_response"] for response in responses]
+
+    async def abatch(
+            self,
+            inputs: List[List[Dict]],
+            max_concurrency: int = 4,
+        ) -> List[BaseModel]:
+        return await gather_bounded([self.ainvoke(messages) for messages in inputs], limit=max_concurrency)
+
+
+def make_completion(
+        kind: str,
+        model_name: str,
+        schema: Type[BaseModel],
+        keep_alive: int = None,
+        json_mode: bool = False,
+    ):
+    """ "direct" -> StructuredCompletion, "agent" -> AgentCompletion """
+    if kind == "agent":
+        return AgentCompletion(model_name, schema, keep_alive=keep_alive, json_mode=json_mode)
+    if kind == "direct":
+        return StructuredCompletion(model_name, schema, keep_alive=keep_alive)
+    raise ValueError(f"unknown structured output mode {kind!r}, expected 'direct' or 'agent'")
@@ -0,0 +1,113 @@
+"""
+ModelScheduler grant order, max_batch and cancellation of a queued aacquire. No Ollama needed.
+
+    python -m unittest discover tests
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from typing import List
+import asyncio
+import unittest
+
+from ollama_pool import ModelScheduler
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+async def grant_order(
+        scheduler: ModelScheduler,
+        models: List[str],
+    ) -> List[str]:
+    """ Queues `models` in order behind a running request for "a", then lets them through one at a time """
+    order = []
+
+    async def request(model: str):
+        await scheduler.aacquire(model)
+        order.append(model)
+        await asyncio.sleep(0)
+        scheduler.release(model)
+
+    scheduler.acquire("a")
+    tasks = [asyncio.ensure_future(request(model)) for model in models]
+    await asyncio.sleep(0)                      # every task is queued now
+    scheduler.release("a")
+    await asyncio.gather(*tasks)
+    return order
+
+
+class ModelSchedulerTest(unittest.TestCase):
+    def scheduler(self, **kwargs) -> ModelScheduler:
+        return ModelScheduler(max_loaded=1, limits={"a": 1, "b": 1}, **kwargs)
+
+    def test_loaded_model_drains_its_queue_first(self):
+        scheduler = self.scheduler()
+        order = asyncio.run(grant_order(scheduler, ["b", "a", "b", "a"]))
+        # "a" is still loaded, so its requests go before the older "b" ones: one swap instead of three
+        self.assertEqual(order, ["a", "a", "b", "b"])
+        self.assertEqual(scheduler.snapshot()["swaps"], 1)
+
+    def test_oldest_request_wins_between_unloaded_models(self):
+        scheduler = self.scheduler()
+        order = asyncio.run(grant_order(scheduler, ["b", "c", "b", "c"]))
+        self.assertEqual(order, ["b", "b", "c", "c"])
+
+    def test_max_batch_lets_waiting_models_in(self):
+        scheduler = self.scheduler(max_batch=2)
+        order = asyncio.run(grant_order(scheduler, ["b", "a", "a", "a", "a"]))
+        self.assertEqual(order, ["a", "a", "b", "a", "a"])
+
+    def test_limit_caps_requests_in_flight(self):
+        scheduler = ModelScheduler(max_loaded=1, limits={"a": 2})
+        scheduler.acquire("a")
+        scheduler.acquire("a")
+
+        async def third():
+            task = asyncio.ensure_future(scheduler.aacquire("a"))
+            await asyncio.sleep(0.01)
+            self.assertFalse(task.done())
+            self.assertEqual(scheduler.snapshot()["queue_depth"], {"a": 1})
+            scheduler.release("a")
+            await task
+
+        asyncio.run(third())
+        self.assertEqual(scheduler.snapshot()["in_flight"], {"a": 2})
+
+    def test_cancelled_while_queued_leaves_the_queue(self):
+        scheduler = self.scheduler()
+
+        async def cancelled():
+            scheduler.acquire("a")
+            task = asyncio.ensure_future(scheduler.aacquire("b"))
+            await asyncio.sleep(0)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(scheduler.snapshot()["queue_depth"], {})
+            scheduler.release("a")
+
+        asyncio.run(cancelled())
+        snapshot = scheduler.snapshot()
+        self.assertEqual((snapshot["queue_depth"], snapshot["in_flight"]), ({}, {}))
+        self.assertEqual(snapshot["loaded"], ["a"])     # "b" was never started
+
+    def test_cancelled_after_grant_gives_the_slot_back(self):
+        scheduler = self.scheduler()
+
+        async def cancelled():
+            scheduler.acquire("a")
+            task = asyncio.ensure_future(scheduler.aacquire("b"))
+            await asyncio.sleep(0)
+            scheduler.release("a")              # grants "b", the task has not resumed yet
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled())
+        self.assertEqual(scheduler.snapshot()["in_flight"], {})
+        scheduler.acquire("a")                  # would block if "b" still held the host
+        self.assertEqual(scheduler.snapshot()["in_flight"], {"a": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
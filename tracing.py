@@ -0,0 +1,220 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+# histogram buckets in seconds, from a cached lookup up to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "trace_id", "start", "duration", "attrs", "children")
+
+    def __init__(self, name: str, span_id: int, parent: Optional["Span"], attrs: Dict):
+        self.name = name
+        self.span_id = span_id
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else span_id
+        self.start = time.time()
+        self.duration = None
+        self.attrs = attrs
+        self.children = []
+
+    def as_dict(self) -> Dict:
+        return {
+                "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+                "start": round(self.start, 6), "duration_ms": round(self.duration * 1000, 3), **({"attrs": self.attrs} if self.attrs else {}),
+            }
+
+
+class Tracer:
+    """
+    Minimal span tracer for the chat/RAG pipeline.
+    Spans nest through a ContextVar, so they follow asyncio tasks and `asyncio.to_thread` calls. A `turn()` span groups
+    one chat turn: its spans are written to a size-rotated JSONL file when the turn ends and `on_turn_end` listeners get the
+    per-stage totals. Every finished span also feeds Prometheus-style counters and latency histograms.
+    """
+    def __init__(self):
+        self.jsonl_path = None
+        self.prom_path = None
+        self.max_bytes = 5 * 1024 * 1024
+        self.backups = 3
+        self.on_turn_end: List[Callable[[Dict], None]] = []
+
+        self._current: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._sums: Dict[str, float] = {}
+        self._buckets: Dict[str, List[int]] = {}
+
+    def configure(
+            self,
+            jsonl_path: str = None,
+            prom_path: str = None,
+            max_bytes: int = None,
+        ):
+        """ Turns on file export, e.g. configure("./private/traces.jsonl", "./private/metrics.prom") """
+        self.jsonl_path = jsonl_path
+        self.prom_path = prom_path
+        if max_bytes:
+            self.max_bytes = max_bytes
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        parent = self._current.get()
+        span = Span(name, next(self._ids), parent, attrs)
+        token = self._current.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - started
+            self._current.reset(token)
+            self._finish(span, parent)
+
+    def traced(self, name: str):
+        """ Decorator version of `span`, works for both plain and async functions """
+        def decorator(fn):
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def annotate(self, **attrs):
+        """ Attaches attributes (e.g. cache=hit) to the innermost open span """
+        span = self._current.get()
+        if span is not None:
+            span.attrs.update(attrs)
+
+    def turn(self, **attrs):
+        """ Root span of one chat turn """
+        return self.span("turn", **attrs)
+
+    def record(self, name: str, duration: float, **attrs):
+        """ Adds an already measured span under the current one (used for callback based timings) """
+        parent = self._current.get()
+        span = Span(name, next(self._ids), parent, attrs)
+        span.start -= duration
+        span.duration = duration
+        self._finish(span, parent)
+
+    def _finish(self, span: Span, parent: Optional[Span]):
+        self._observe(span.name, span.duration)
+        if parent is not None:
+            with self._lock:
+                parent.children.append(span)
+            return
+
+        # a root span: export it together with everything that nested under it
+        spans = self._flatten(span)
+        if self.jsonl_path:
+            self._write_jsonl(spans)
+        if self.prom_path:
+            self.write_prometheus(self.prom_path)
+        if span.name == "turn":
+            breakdown = self.breakdown(span)
+            for listener in list(self.on_turn_end):
+                try:
+                    listener(breakdown)
+                except Exception:
+                    pass
+
+    def _flatten(self, root: Span) -> List[Span]:
+        spans, stack = [], [root]
+        while stack:
+            span = stack.pop()
+            spans.append(span)
+            stack.extend(span.children)
+        return spans
+
+    def breakdown(self, root: Span) -> Dict:
+        """ Total seconds per stage name below `root` (nested stages of the same name are not double counted) """
+        totals = {}
+        def walk(span: Span, inside: set):
+            for child in span.children:
+                if child.name not in inside:
+                    totals[child.name] = totals.get(child.name, 0.0) + child.duration
+                walk(child, inside | {child.name})
+        walk(root, set())
+        return {"total": root.duration, "stages": totals, "attrs": root.attrs}
+
+    # ------------------------------------------------------- EXPORT --------------------------------------------------------- #
+
+    def _observe(self, name: str, duration: float):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+            self._sums[name] = self._sums.get(name, 0.0) + duration
+            buckets = self._buckets.setdefault(name, [0] * len(LATENCY_BUCKETS))
+            for idx, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    buckets[idx] += 1
+
+    def _write_jsonl(self, spans: List[Span]):
+        lines = "".join(json.dumps(span.as_dict()) + "\n" for span in sorted(spans, key=lambda span: span.span_id))
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+                if os.path.exists(self.jsonl_path) and os.path.getsize(self.jsonl_path) > self.max_bytes:
+                    for idx in range(self.backups - 1, 0, -1):
+                        if os.path.exists(f"{self.jsonl_path}.{idx}"):
+                            os.replace(f"{self.jsonl_path}.{idx}", f"{self.jsonl_path}.{idx + 1}")
+                    os.replace(self.jsonl_path, f"{self.jsonl_path}.1")
+                with open(self.jsonl_path, "a") as f:
+                    f.write(lines)
+            except OSError:
+                pass
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            lines = [
+                    "# HELP rechat_stage_calls_total Number of finished spans per pipeline stage.",
+                    "# TYPE rechat_stage_calls_total counter",
+                ]
+            lines += [f'rechat_stage_calls_total{{stage="{name}"}} {count}' for name, count in sorted(self._counts.items())]
+            lines += [
+                    "# HELP rechat_stage_seconds Latency of each pipeline stage.",
+                    "# TYPE rechat_stage_seconds histogram",
+                ]
+            for name in sorted(self._counts):
+                for bound, count in zip(LATENCY_BUCKETS, self._buckets[name]):
+                    lines.append(f'rechat_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'rechat_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {self._counts[name]}')
+                lines.append(f'rechat_stage_seconds_sum{{stage="{name}"}} {self._sums[name]:.6f}')
+                lines.append(f'rechat_stage_seconds_count{{stage="{name}"}} {self._counts[name]}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """ Writes the metrics atomically, in the textfile-collector format """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(f"{path}.tmp", "w") as f:
+                f.write(self.prometheus_text())
+            os.replace(f"{path}.tmp", path)
+        except OSError:
+            pass
+
+
+def format_breakdown(breakdown: Dict, limit: int = 6) -> str:
+    """ 'turn 6.21s │ chat_model 5.10s · decompose 0.80s · ...' for status lines """
+    stages = sorted(breakdown["stages"].items(), key=lambda item: -item[1])[:limit]
+    return f"turn {breakdown['total']:.2f}s │ " + " · ".join(f"{name} {seconds:.2f}s" for name, seconds in stages)
+
+# one tracer for the whole process, UserRAG and both front ends report into it
+tracer = Tracer()
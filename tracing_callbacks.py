@@ -0,0 +1,45 @@
+from langchain_core.callbacks import BaseCallbackHandler
+
+import time
+
+from tracing import Tracer
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+# kept apart from tracing.py so the tracer itself can be imported without pulling in langchain
+
+class TracingCallback(BaseCallbackHandler):
+    """
+    Times model calls and tool runs of an agent as spans, pass it in the agent's `config["callbacks"]`.
+    Calls to `chat_model_name` are recorded as 'chat_model', calls to any other model (e.g. the RAG agents running
+    inside a tool) as 'llm[<model>]'.
+    """
+    run_inline = True                   # run in the caller's context, so spans nest under the current turn
+
+    def __init__(self, tracer: Tracer, chat_model_name: str = None):
+        self.tracer = tracer
+        self.chat_model_name = chat_model_name
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        model_name = (metadata or {}).get("ls_model_name")
+        stage = "chat_model" if model_name == self.chat_model_name or not model_name else f"llm[{model_name}]"
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.tracer.record(started[0], time.perf_counter() - started[1])
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._started[run_id] = ("tool", time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            self.tracer.record(started[0], time.perf_counter() - started[1])
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._started.pop(run_id, None)
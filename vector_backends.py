@@ -0,0 +1,549 @@
+from typing import Dict, Iterator, List, Literal, NamedTuple, Optional, Tuple
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from rag_utils import cosine_similarity_matrix
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class SearchHit(NamedTuple):
+    """ A single stored fact returned by a vector search """
+    id: str
+    text: str
+    distance: float                         # cosine distance, 0 means identical direction
+    vector: Optional[List[float]] = None
+
+class VectorBackend:
+    """
+    What `UserRAG` needs from a vector store: add facts with known vectors, multi-query cosine top-k, list / delete stored
+    facts. Vectors always come from the caller, backends never embed anything themselves.
+    """
+    def add(
+            self,
+            ids: List[str],
+            texts: List[str],
+            vectors: List[List[float]],
+        ):
+        raise NotImplementedError
+
+    def search(
+            self,
+            query_vectors: List[List[float]],
+            k: int,
+        ) -> List[List[SearchHit]]:
+        """ One list of hits per query vector, closest first """
+        raise NotImplementedError
+
+    def get_all(self) -> Tuple[List[str], List[str]]:
+        """ (ids, texts) of every stored fact """
+        raise NotImplementedError
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[str], List[List[float]]]]:
+        """ (ids, texts, vectors) in batches, used for migrations and maintenance jobs """
+        raise NotImplementedError
+
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+class ChromaBackend(VectorBackend):
+    """ The original persistent Chroma collection (`<db_path>/chroma.sqlite3`) """
+    def __init__(
+            self,
+            db_path: str,
+            embedding_function=None,
+            collection_name: str = "chroma_db",
+        ):
+        from langchain_chroma import Chroma         # chromadb is slow to import, the flat backend never needs it
+
+        self.vector_store = Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding_function,
+                persist_directory=db_path,
+            )
+        self._collection = self.vector_store._collection
+
+    def add(self, ids, texts, vectors):
+        self._collection.add(ids=ids, embeddings=[list(map(float, vector)) for vector in vectors], documents=texts)
+
+    def search(self, query_vectors, k):
+        results = self._collection.query(
+                query_embeddings=[list(map(float, vector)) for vector in query_vectors],
+                n_results=k,
+                include=["documents", "embeddings"],
+            )
+
+        # chroma ranks by its own metric, the distances are recomputed as cosine so every backend reports the same thing
+        search_results = []
+        for query_vector, ids, docs, vectors in zip(query_vectors, results["ids"], results["documents"], results["embeddings"]):
+            if not ids:
+                search_results.append([])
+                continue
+            distances = 1.0 - cosine_similarity_matrix([query_vector], vectors)[0]
+            search_results.append([
+                    SearchHit(id=doc_id, text=doc_text, distance=float(distance), vector=vector)
+                    for doc_id, doc_text, distance, vector in zip(ids, docs, distances, vectors)
+                ])
+        return search_results
+
+    def get_all(self):
+        stored = self._collection.get(include=["documents"])
+        return stored["ids"], stored["documents"]
+
+    def iter_batches(self, batch_size=1000):
+        for offset in range(0, self.count(), batch_size):
+            batch = self._collection.get(include=["documents", "embeddings"], limit=batch_size, offset=offset)
+            if batch["ids"]:
+                yield batch["ids"], batch["documents"], [list(vector) for vector in batch["embeddings"]]
+
+    def delete(self, ids):
+        if ids:
+            self._collection.delete(ids=list(ids))
+
+    def count(self):
+        return self._collection.count()
+
+
+# ------------------------------------------------------ QUANTIZATION --------------------------------------------------------- #
+
+# set bits per byte value, numpy < 2.0 has no popcount
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+def quantize(
+        mode: str,
+        unit_vectors: np.ndarray,
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Compact codes for unit vectors:
+        "int8"      each row scaled so its largest component maps to 127, plus the float32 factor to undo that
+        "binary"    sign bits packed 8 per byte (32x smaller than float32)
+    """
+    unit_vectors = np.asarray(unit_vectors, dtype=np.float32)
+    if mode == "int8":
+        peaks = np.maximum(np.abs(unit_vectors).max(axis=1, initial=0.0), 1e-12)
+        codes = np.round(unit_vectors * (127.0 / peaks)[:, None]).astype(np.int8)
+        return codes, (peaks / 127.0).astype(np.float32)
+    if mode == "binary":
+        return np.packbits(unit_vectors > 0, axis=1), None
+    raise ValueError(f"unknown quantization: {mode}")
+
+def code_width(mode: str, dim: int) -> int:
+    return dim if mode == "int8" else (dim + 7) // 8
+
+def approximate_scores(
+        mode: str,
+        queries: np.ndarray,
+        codes: np.ndarray,
+        scales: Optional[np.ndarray],
+    ) -> np.ndarray:
+    """ Higher is closer; int8 approximates the cosine similarity, binary is the negated hamming distance """
+    if mode == "int8":
+        return (queries @ codes.astype(np.float32).T) * scales[None, :]
+    query_bits = np.packbits(queries > 0, axis=1)
+    return -POPCOUNT[query_bits[:, None, :] ^ codes[None, :, :]].sum(axis=2, dtype=np.int32).astype(np.float32)
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+DATA_FILES = ("vectors", "meta", "codes", "scales")
+
+class FlatIndexBackend(VectorBackend):
+    """
+    Brute force index for small personal stores, kept in `<db_path>/flat/`:
+        vectors.bin     row-major unit vectors (float16 by default, always float32 when quantized so the rerank is exact),
+                        memory mapped and only ever appended to
+        meta.jsonl      one {"id", "text"} line per row plus {"delete": id} tombstones
+        index.json      dimension, dtype, quantization and the current generation
+        codes.bin       (quantized mode) int8 or sign-bit codes of every row, held in RAM
+        scales.bin      (int8 mode) float32 factor per row
+    After a vacuum the data files carry its generation (vectors.3.bin, meta.3.jsonl, ...); index.json names the current
+    one, so switching to the rewritten files is a single os.replace of the header.
+    A search is one matrix product against the mapped rows plus an argpartition for the top k. With `quantization` set
+    the scan runs over the codes instead and only the best `k * rerank_factor` rows are read back from vectors.bin and
+    re-scored exactly. Deleted rows are masked until they pass `vacuum_ratio` of the file, then the files are rewritten.
+    """
+    def __init__(
+            self,
+            path: str,
+            dtype: str = "float16",
+            quantization: Optional[Literal["int8", "binary"]] = None,
+            rerank_factor: int = 4,
+            vacuum_ratio: float = 0.25,
+            block_rows: int = 65_536,
+        ):
+        self.path = path
+        self.rerank_factor = rerank_factor
+        self.vacuum_ratio = vacuum_ratio
+        self.block_rows = block_rows            # rows upcast to float32 at a time while scoring
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+
+        header_path = os.path.join(path, "index.json")
+        header = {}
+        if os.path.exists(header_path):
+            with open(header_path) as f:
+                header = json.load(f)
+        self.dtype = np.dtype(header.get("dtype", "float32" if quantization else dtype))
+        self.dim = header.get("dim")
+        self.quantization = header.get("quantization", quantization)
+        self.generation = header.get("generation", 0)
+        self._drop_stale_files()
+
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self._rows = {}                         # id -> row
+        self._matrix = None
+        self._codes = None
+        self._scales = None
+        self._load()
+        if self.dim and quantization is not None and quantization != self.quantization:
+            self.set_quantization(quantization)
+        elif self.dim and self.quantization and self.dtype != np.float32:
+            self.set_quantization(self.quantization)    # quantized before the rerank went full precision
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "index.json"))
+
+    def _file(
+            self,
+            name: str,
+            generation: int = None,
+        ) -> str:
+        # data files are named after the generation that wrote them, generation 0 keeps the plain names
+        generation = self.generation if generation is None else generation
+        stem, _, ext = name.partition(".")
+        if generation and stem in DATA_FILES:
+            name = f"{stem}.{generation}.{ext}"
+        return os.path.join(self.path, name)
+
+    def _drop_stale_files(self):
+        # a vacuum cut short leaves the next generation's files behind, a finished one may leave the previous ones
+        for name in os.listdir(self.path):
+            match = re.fullmatch(r"(\w+?)(?:\.(\d+))?\.(?:bin|jsonl)(?:\.tmp)?", name)
+            if match and match.group(1) in DATA_FILES and int(match.group(2) or 0) != self.generation:
+                os.remove(os.path.join(self.path, name))
+
+    def _write_header(self):
+        with open(self._file("index.json.tmp"), "w") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "quantization": self.quantization, "generation": self.generation}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self._file("index.json.tmp"), self._file("index.json"))
+
+    def _load(self):
+        # replayed in order: a tombstone only kills the rows written before it, and a repeated id replaces its earlier row
+        dead = set()
+        rows = {}
+        if os.path.exists(self._file("meta.jsonl")):
+            with open(self._file("meta.jsonl"), "r+b") as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        f.truncate(offset)      # torn last line from a crash
+                        break
+                    offset += len(line)
+                    if "delete" in entry:
+                        if entry["delete"] in rows:
+                            dead.add(rows.pop(entry["delete"]))
+                    else:
+                        if entry["id"] in rows:
+                            dead.add(rows[entry["id"]])
+                        rows[entry["id"]] = len(self.ids)
+                        self.ids.append(entry["id"])
+                        self.texts.append(entry["text"])
+
+        # rows are written before their meta line, so a crash can only leave extra rows at the end of the file; those get
+        # cut off here so the next append lines up with the sidecar again
+        if self.dim:
+            row_bytes = self.dim * self.dtype.itemsize
+            stored_rows = os.path.getsize(self._file("vectors.bin")) // row_bytes if os.path.exists(self._file("vectors.bin")) else 0
+            del self.ids[stored_rows:], self.texts[stored_rows:]
+            if stored_rows > len(self.ids):
+                with open(self._file("vectors.bin"), "r+b") as f:
+                    f.truncate(len(self.ids) * row_bytes)
+        else:
+            self.ids, self.texts = [], []
+        self.alive = np.array([row not in dead for row in range(len(self.ids))], dtype=bool)
+        self._rows = {doc_id: row for doc_id, row in rows.items() if row < len(self.ids)}
+        self._remap()
+        self._load_codes()
+
+    def _remap(self):
+        if self.dim and self.ids:
+            self._matrix = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(len(self.ids), self.dim))
+        else:
+            self._matrix = None
+
+    def _load_codes(self):
+        """ Reads the codes into RAM, they are rebuilt from vectors.bin whenever they do not line up with it (e.g. after a crash) """
+        self._codes = self._scales = None
+        if not self.quantization or not self.dim:
+            return
+        width = code_width(self.quantization, self.dim)
+        dtype = np.int8 if self.quantization == "int8" else np.uint8
+        if os.path.exists(self._file("codes.bin")):
+            codes = np.fromfile(self._file("codes.bin"), dtype=dtype)
+            scales = np.fromfile(self._file("scales.bin"), dtype=np.float32) if os.path.exists(self._file("scales.bin")) else None
+            if len(codes) == len(self.ids) * width and (self.quantization != "int8" or (scales is not None and len(scales) == len(self.ids))):
+                self._codes, self._scales = codes.reshape(len(self.ids), width), scales
+                return
+        self._rebuild_codes()
+
+    def _rebuild_codes(self):
+        codes, scales = [], []
+        for start in range(0, len(self.ids), self.block_rows):
+            block_codes, block_scales = quantize(self.quantization, np.asarray(self._matrix[start:start+self.block_rows], dtype=np.float32))
+            codes.append(block_codes)
+            scales.append(block_scales)
+        width = code_width(self.quantization, self.dim)
+        self._codes = np.concatenate(codes) if codes else np.zeros((0, width), dtype=np.int8 if self.quantization == "int8" else np.uint8)
+        self._scales = np.concatenate(scales) if self.quantization == "int8" and scales else (np.zeros(0, dtype=np.float32) if self.quantization == "int8" else None)
+
+        with open(self._file("codes.bin.tmp"), "wb") as f:
+            f.write(self._codes.tobytes())
+        os.replace(self._file("codes.bin.tmp"), self._file("codes.bin"))
+        if self._scales is not None:
+            with open(self._file("scales.bin.tmp"), "wb") as f:
+                f.write(self._scales.tobytes())
+            os.replace(self._file("scales.bin.tmp"), self._file("scales.bin"))
+
+    def set_quantization(self, quantization: Optional[Literal["int8", "binary"]]):
+        """
+        Switches the storage mode of an existing index; the codes are derived from the stored vectors. A float16 index is
+        rewritten as float32 first, the codes only shortlist and the rerank reads vectors.bin (rows stored so far keep
+        their float16 rounding, everything added afterwards is full precision).
+        """
+        with self._lock:
+            if quantization and self.dtype != np.float32 and self.dim:
+                self._rewrite(np.dtype(np.float32))
+            elif quantization:
+                self.dtype = np.dtype(np.float32)
+            self.quantization = quantization
+            self._write_header()
+            for name in ("codes.bin", "scales.bin"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._load_codes()
+
+    @staticmethod
+    def _unit(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def add(self, ids, texts, vectors):
+        if not len(ids):
+            return
+        unit = self._unit(vectors)
+        with self._lock:
+            if self.dim is None:
+                self.dim = int(unit.shape[1])
+                self._write_header()
+                self._load_codes()
+            if unit.shape[1] != self.dim:
+                raise ValueError(f"vector dimension {unit.shape[1]} does not match the index ({self.dim})")
+
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(unit.astype(self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            if self.quantization:
+                codes, scales = quantize(self.quantization, unit.astype(self.dtype).astype(np.float32))
+                with open(self._file("codes.bin"), "ab") as f:
+                    f.write(codes.tobytes())
+                self._codes = np.concatenate([self._codes, codes])
+                if scales is not None:
+                    with open(self._file("scales.bin"), "ab") as f:
+                        f.write(scales.tobytes())
+                    self._scales = np.concatenate([self._scales, scales])
+            with open(self._file("meta.jsonl"), "a") as f:
+                f.write("".join(json.dumps({"id": doc_id, "text": text}) + "\n" for doc_id, text in zip(ids, texts)))
+
+            # a repeated id is an upsert: the new row wins and the old one (or an earlier one in this batch) is tombstoned in
+            # memory, the same way _load replays the sidecar
+            first_row = len(self.ids)
+            replaced = [self._rows[doc_id] for doc_id in ids if doc_id in self._rows]
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+            for offset, doc_id in enumerate(ids):
+                if doc_id in self._rows and self._rows[doc_id] >= first_row:
+                    replaced.append(self._rows[doc_id])
+                self._rows[doc_id] = first_row + offset
+            self.alive[replaced] = False
+            self._remap()
+            if replaced and (~self.alive).sum() > self.vacuum_ratio * len(self.alive):
+                self.vacuum()
+
+    def search(self, query_vectors, k):
+        if not len(query_vectors):
+            return []
+        queries = self._unit(query_vectors)
+        with self._lock:
+            matrix, alive, n_rows = self._matrix, self.alive, len(self.ids)
+            if matrix is None or k <= 0 or not alive.any():
+                return [[] for _ in query_vectors]
+
+            k = min(k, int(alive.sum()))
+            if self.quantization:
+                shortlist = self._top_rows(self._scan_codes(queries, n_rows, alive), min(k * self.rerank_factor, int(alive.sum())))
+            else:
+                shortlist = self._top_rows(self.exact_scores(queries, n_rows, alive), k)
+
+            # the shortlist is re-scored from the full precision rows, only those pages of vectors.bin get read
+            search_results = []
+            for query, candidates in zip(queries, shortlist):
+                rows = np.sort(candidates)
+                vectors = np.asarray(matrix[rows], dtype=np.float32)
+                similarities = vectors @ query
+                order = np.argsort(-similarities)[:k]
+                search_results.append([
+                        SearchHit(id=self.ids[rows[idx]], text=self.texts[rows[idx]], distance=float(1.0 - similarities[idx]), vector=vectors[idx].tolist())
+                        for idx in order
+                    ])
+            return search_results
+
+    def exact_scores(
+            self,
+            queries: np.ndarray,
+            n_rows: int,
+            alive: np.ndarray,
+        ) -> np.ndarray:
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, self.block_rows):
+            block = np.asarray(self._matrix[start:start+self.block_rows], dtype=np.float32)
+            scores[:, start:start+len(block)] = queries @ block.T
+        scores[:, ~alive] = -np.inf
+        return scores
+
+    def _scan_codes(
+            self,
+            queries: np.ndarray,
+            n_rows: int,
+            alive: np.ndarray,
+        ) -> np.ndarray:
+        # binary scoring builds a (queries, rows, bytes) xor table, so blocks are kept smaller for it
+        block_rows = self.block_rows if self.quantization == "int8" else max(self.block_rows // 16, 1)
+        scores = np.empty((len(queries), n_rows), dtype=np.float32)
+        for start in range(0, n_rows, block_rows):
+            end = min(start + block_rows, n_rows)
+            scales = self._scales[start:end] if self._scales is not None else None
+            scores[:, start:end] = approximate_scores(self.quantization, queries, self._codes[start:end], scales)
+        scores[:, ~alive] = -np.inf
+        return scores
+
+    @staticmethod
+    def _top_rows(
+            scores: np.ndarray,
+            k: int,
+        ) -> np.ndarray:
+        if k >= scores.shape[1]:
+            return np.tile(np.arange(scores.shape[1]), (len(scores), 1))
+        return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+    def get_all(self):
+        with self._lock:
+            rows = np.flatnonzero(self.alive)
+            return [self.ids[row] for row in rows], [self.texts[row] for row in rows]
+
+    def iter_batches(self, batch_size=1000):
+        with self._lock:
+            rows = np.flatnonzero(self.alive)
+            matrix = self._matrix
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start+batch_size]
+            yield ([self.ids[row] for row in batch], [self.texts[row] for row in batch],
+                   np.asarray(matrix[batch], dtype=np.float32).tolist())
+
+    def delete(self, ids):
+        with self._lock:
+            rows = [self._rows.pop(doc_id) for doc_id in ids if doc_id in self._rows]
+            if not rows:
+                return
+            with open(self._file("meta.jsonl"), "a") as f:
+                f.write("".join(json.dumps({"delete": self.ids[row]}) + "\n" for row in rows))
+            self.alive[rows] = False
+            if (~self.alive).sum() > self.vacuum_ratio * len(self.alive):
+                self.vacuum()
+
+    def vacuum(self):
+        """ Rewrites the files without the deleted rows, as the next generation; the header switches to it in one step """
+        with self._lock:
+            self._rewrite(self.dtype)
+
+    def _rewrite(self, dtype: np.dtype):
+        with self._lock:
+            rows = np.flatnonzero(self.alive)
+            vectors = np.asarray(self._matrix[rows]) if self._matrix is not None else np.zeros((0, self.dim or 0), dtype=self.dtype)
+            generation = self.generation + 1
+            with open(self._file("vectors.bin", generation), "wb") as f:
+                f.write(vectors.astype(dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self._file("meta.jsonl", generation), "w") as f:
+                f.write("".join(json.dumps({"id": self.ids[row], "text": self.texts[row]}) + "\n" for row in rows))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # a crash before the header is replaced keeps the old pair, after it the new one; never one of each
+            self._matrix = None                 # drop the old mapping before its file goes away
+            self.generation, self.dtype = generation, dtype
+            self._write_header()
+            self._drop_stale_files()
+            self.ids = [self.ids[row] for row in rows]
+            self.texts = [self.texts[row] for row in rows]
+            self.alive = np.ones(len(rows), dtype=bool)
+            self._rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self._remap()
+            if self.quantization:
+                self._rebuild_codes()
+
+    def count(self):
+        return int(self.alive.sum())
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """ Size of what a scan touches (codes in RAM, or the mapped vectors) next to the full precision file """
+        vectors = len(self.ids) * (self.dim or 0) * self.dtype.itemsize
+        scanned = vectors if self._codes is None else self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+        return {"vectors": vectors, "scanned": scanned}
+
+    def close(self):
+        with self._lock:
+            self._matrix = None
+
+# ------------------------------------------------------------------------------------------------------------------------------ #
+
+def flat_index_path(db_path: str) -> str:
+    return os.path.join(db_path, "flat")
+
+def make_backend(
+        kind: str,
+        db_path: str,
+        embedding_function=None,
+        dtype: str = "float16",
+        quantization: Optional[str] = None,
+    ) -> VectorBackend:
+    """
+    "chroma", "flat" or "auto": a db that went through migrate_store.py (has `<db_path>/flat/index.json`) opens as a flat
+    index, anything else keeps using chroma.
+    """
+    if kind == "auto":
+        kind = "flat" if FlatIndexBackend.exists(flat_index_path(db_path)) else "chroma"
+    if kind == "flat":
+        return FlatIndexBackend(flat_index_path(db_path), dtype=dtype, quantization=quantization)
+    if kind == "chroma":
+        return ChromaBackend(db_path, embedding_function=embedding_function)
+    raise ValueError(f"unknown vector backend: {kind}")